@@ -0,0 +1,142 @@
+"""Semantic answer cache for /response.
+
+Answers are grouped into buckets keyed by the picked pipelines, the resolved
+location, the commodity and, for answers built on external data, the UTC date
+(document-only answers do not go stale at midnight). Within a bucket a lookup compares the
+query embedding against stored entries and returns the closest answer above
+``ANSWER_CACHE_THRESHOLD``. Entry TTLs come from ``cache_ttl_s`` in
+pipelines.json (shortest of the picked pipelines), so weather and mandi answers
+expire quickly while general/document answers live for days.
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+from config import config
+
+logger = logging.getLogger("answer_cache")
+
+
+@dataclass
+class CachedAnswer:
+    answer: str
+    similarity: float
+    query: str
+
+
+def cache_bucket(
+    picked_ids: Iterable[str],
+    *,
+    lat: Optional[float] = None,
+    lon: Optional[float] = None,
+    region: Optional[str] = None,
+    commodity: Optional[str] = None,
+    has_external_data: bool = True,
+) -> str:
+    """Key prefix for answers that may be shared: same pipelines, place, commodity and (with external data) day."""
+    if lat is not None and lon is not None:
+        # ~1 km grid so nearby callers share a bucket
+        loc = f"{round(float(lat), 2)},{round(float(lon), 2)}"
+    else:
+        loc = (region or "").strip().lower() or "-"
+    parts = [
+        "+".join(sorted(set(picked_ids))) or "-",
+        loc,
+        (commodity or "").strip().lower() or "-",
+        datetime.now(timezone.utc).strftime("%Y-%m-%d") if has_external_data else "-",
+    ]
+    digest = hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:20]
+    return f"{config.ANSWER_CACHE_PREFIX}:{digest}"
+
+
+def cache_ttl(pipelines: Iterable, *, has_external_data: bool = True) -> int:
+    """Shortest cache_ttl_s among the picked pipelines; document-only answers use the long TTL."""
+    if not has_external_data:
+        return config.ANSWER_CACHE_DOC_TTL_S
+    ttls = [p.cache_ttl_s for p in pipelines if getattr(p, "cache_ttl_s", None) is not None]
+    return min(ttls) if ttls else config.ANSWER_CACHE_DEFAULT_TTL_S
+
+
+async def lookup(bucket: str, query_vec: np.ndarray) -> Optional[CachedAnswer]:
+    """Return the most similar cached answer in the bucket if it clears the threshold."""
+    if not config.ANSWER_CACHE_ENABLED:
+        return None
+    r = config.aredis_client
+    try:
+        members = await r.smembers(f"{bucket}:idx")
+        if not members:
+            return None
+        keys = [m.decode("utf-8") if isinstance(m, bytes) else m for m in members]
+        pipe = r.pipeline(transaction=False)
+        for k in keys:
+            pipe.hmget(k, "vec", "answer", "query")
+        rows = await pipe.execute()
+    except Exception as e:
+        logger.warning("Answer cache lookup failed: %s", e)
+        return None
+
+    live: List[tuple] = []
+    stale: List[str] = []
+    for k, (vec, answer, query) in zip(keys, rows):
+        if vec is None or answer is None:
+            stale.append(k)
+            continue
+        live.append((np.frombuffer(vec, dtype=np.float32), answer, query))
+    if stale:
+        # Entries expire individually; drop their index members lazily
+        asyncio.create_task(_discard(f"{bucket}:idx", stale))
+    if not live:
+        return None
+    matrix = np.vstack([v for v, _, _ in live])
+    sims = matrix @ query_vec
+    best = int(np.argmax(sims))
+    score = float(sims[best])
+    if score < config.ANSWER_CACHE_THRESHOLD:
+        logger.debug("Answer cache near-miss (best=%.3f) in %s", score, bucket)
+        return None
+    _, answer, query = live[best]
+    return CachedAnswer(
+        answer=answer.decode("utf-8"),
+        similarity=score,
+        query=query.decode("utf-8") if query else "",
+    )
+
+
+async def store(bucket: str, query: str, query_vec: np.ndarray, answer: str, ttl_s: int) -> None:
+    """Save an answer under the bucket with its own TTL. Failures are logged, not raised."""
+    if not config.ANSWER_CACHE_ENABLED or ttl_s <= 0 or not answer:
+        return
+    r = config.aredis_client
+    key = f"{bucket}:{hashlib.sha1(query.strip().lower().encode('utf-8')).hexdigest()[:16]}"
+    idx = f"{bucket}:idx"
+    try:
+        if await r.scard(idx) >= config.ANSWER_CACHE_MAX_ENTRIES:
+            logger.debug("Answer cache bucket full: %s", bucket)
+            return
+        pipe = r.pipeline(transaction=False)
+        pipe.hset(key, mapping={
+            "vec": np.asarray(query_vec, dtype=np.float32).tobytes(),
+            "answer": answer.encode("utf-8"),
+            "query": query.encode("utf-8"),
+            "ts": str(int(time.time())),
+        })
+        pipe.expire(key, ttl_s)
+        pipe.sadd(idx, key)
+        # The index outlives the longest entry in it; it is pruned on lookup
+        pipe.expire(idx, max(ttl_s, config.ANSWER_CACHE_DOC_TTL_S))
+        await pipe.execute()
+    except Exception as e:
+        logger.warning("Answer cache store failed: %s", e)
+
+
+async def _discard(idx: str, keys: List[str]) -> None:
+    try:
+        await config.aredis_client.srem(idx, *keys)
+    except Exception:
+        pass
@@ -1,4 +1,7 @@
 # common.py
+import asyncio
+from typing import AsyncIterator, Optional
+
 from langchain_groq import ChatGroq  
 from langchain_mistralai import ChatMistralAI
 from langchain.prompts import PromptTemplate 
@@ -15,15 +18,66 @@ from config import config
 llm = ChatMistralAI(
     mistral_api_key=config.MISTRAL_API_KEY,
     model=config.MODEL_NAME,  # e.g. "mistral-large-latest"
+    endpoint=config.MISTRAL_BASE_URL,
     temperature=0.1
 )
 
-def format_docs(docs):
-    return "\n\n".join(doc.page_content for doc in docs)
+# Bounds concurrent Mistral calls per worker; created lazily inside the running loop
+_llm_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def _get_llm_semaphore() -> asyncio.Semaphore:
+    global _llm_semaphore
+    if _llm_semaphore is None:
+        _llm_semaphore = asyncio.Semaphore(max(1, config.LLM_MAX_CONCURRENCY))
+    return _llm_semaphore
+
+
+async def arun_chain(prompt_template, inputs, *, timeout: Optional[float] = None) -> str:
+    """Run the prompt through the LLM and return the parsed text; never blocks the event loop.
+
+    Waits for a slot on the shared LLM semaphore, then awaits ``ainvoke``; the
+    timeout (``config.LLM_TIMEOUT_S`` unless overridden) covers both, so a call
+    queued behind saturated slots still fails in time. Raises
+    ``asyncio.TimeoutError`` when the call does not finish in time.
+    """
+    chain = RunnablePassthrough() | prompt_template | llm | StrOutputParser()
+
+    async def call() -> str:
+        async with _get_llm_semaphore():
+            return await chain.ainvoke(inputs)
+
+    return await asyncio.wait_for(call(), timeout=timeout or config.LLM_TIMEOUT_S)
+
+
+async def astream_chain(prompt_template, inputs, *, timeout: Optional[float] = None) -> AsyncIterator[str]:
+    """Stream answer chunks from the LLM as they arrive.
 
-def run_chain(prompt_template, inputs):
+    Holds one semaphore slot for the whole stream; the timeout bounds the wait
+    for that slot plus the total stream duration, not each chunk.
+    """
     chain = RunnablePassthrough() | prompt_template | llm | StrOutputParser()
-    return chain.invoke(inputs)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + (timeout or config.LLM_TIMEOUT_S)
+    semaphore = _get_llm_semaphore()
+    await asyncio.wait_for(semaphore.acquire(), timeout=max(0.0, deadline - loop.time()))
+    try:
+        stream = chain.astream(inputs)
+        try:
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError("LLM stream exceeded timeout")
+                try:
+                    chunk = await asyncio.wait_for(stream.__anext__(), timeout=remaining)
+                except StopAsyncIteration:
+                    break
+                if chunk:
+                    yield chunk
+        finally:
+            await stream.aclose()
+    finally:
+        semaphore.release()
 
 def get_prompt_template(use_case: str) -> PromptTemplate:
     if use_case == "irrigation":
@@ -142,7 +196,7 @@ def get_prompt_template(use_case: str) -> PromptTemplate:
             Guidelines:
             - Show price ranges (min, max, modal)
             - Specify commodity, market, district, state if available
-            - Suggest when and where selling might be optimal
+            - Suggest when and where selling might be optimal, using the precomputed trends and best-paying markets; do not recompute them
             - Do not fabricate numbers if context lacks data [/INST]
             """
         )
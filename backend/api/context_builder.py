@@ -0,0 +1,200 @@
+"""Token-budgeted context for the answer prompt.
+
+``build_context`` assembles "External Data" + "Relevant Docs" for one prompt key
+within that key's budget (``CONTEXT_TOKEN_BUDGET``, overridden per key by
+``CONTEXT_TOKEN_BUDGETS``, e.g. ``"mandi=900,uv=600"``; 0 disables the limit).
+
+Everything competes for the budget by relevance:
+
+- external-data sections score by whether the prompt key is about them (the
+  forecast for ``irrigation``, the price table for ``mandi``) plus how many
+  question terms they mention;
+- retrieved chunks are split into passages (paragraphs, long paragraphs into
+  sentences) scored by question-term overlap, weighted by the chunk's retrieval
+  rank.
+
+The highest-scoring units are kept greedily; the rest are dropped, and output
+keeps the original order so sections and passages still read naturally. Tokens
+are estimated from characters (``CONTEXT_CHARS_PER_TOKEN``); no tokenizer is
+loaded. Tokens saved are logged and counted in ``agri_context_tokens_total``.
+"""
+import logging
+import math
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Sequence, Tuple
+
+from api import metrics
+from config import config
+
+logger = logging.getLogger("context_builder")
+
+# Sections each prompt key is mainly about; they outrank everything else
+_PRIMARY_SECTIONS: Dict[str, Tuple[str, ...]] = {
+    "weather": ("weather", "forecast", "climate"),
+    "irrigation": ("forecast", "weather", "soil"),
+    "soil": ("soil", "weather"),
+    "uv": ("weather",),
+    "mandi": ("mandi",),
+}
+# Words that make a section relevant to the question even when the prompt key is not about it
+_SECTION_TERMS: Dict[str, FrozenSet[str]] = {
+    "weather": frozenset({"weather", "temperature", "temp", "humidity", "wind", "today", "now", "hot", "cold"}),
+    "forecast": frozenset({"forecast", "rain", "rainfall", "tomorrow", "week", "days", "spray", "sow", "sowing", "irrigate", "irrigation"}),
+    "climate": frozenset({"climate", "month", "season", "monsoon", "outlook"}),
+    "soil": frozenset({"soil", "moisture", "irrigate", "irrigation", "water", "dry", "wet"}),
+    "mandi": frozenset({"mandi", "price", "prices", "rate", "rates", "market", "sell", "quintal", "modal"}),
+}
+# Always kept: they qualify the data rather than add to it
+_PINNED_SECTIONS = frozenset({"stale_note", "empty"})
+_STOPWORDS = frozenset(
+    "the a an and or of to in on at for is are was be it this that with my me i we our you your what which how when "
+    "should can do does will would about from by as any there their them have has".split()
+)
+_WORD = re.compile(r"\w+", re.UNICODE)
+_SENTENCE = re.compile(r"(?<=[.!?।])\s+")
+
+_EXTERNAL_HEADER = "External Data:\n"
+_DOCS_HEADER = "\n\nRelevant Docs:\n"
+_NO_EXTERNAL = "No external data available."
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / config.CONTEXT_CHARS_PER_TOKEN) if text else 0
+
+
+@lru_cache(maxsize=1)
+def _budgets(spec: str) -> Dict[str, int]:
+    out: Dict[str, int] = {}
+    for item in spec.split(","):
+        key, _, value = item.partition("=")
+        try:
+            out[key.strip()] = int(value)
+        except ValueError:
+            if item.strip():
+                logger.warning("Ignoring malformed CONTEXT_TOKEN_BUDGETS entry %r", item)
+    return out
+
+
+def budget_for(prompt_key: str) -> int:
+    """Context token budget for ``prompt_key``; 0 means unlimited."""
+    return _budgets(config.CONTEXT_TOKEN_BUDGETS).get(prompt_key, config.CONTEXT_TOKEN_BUDGET)
+
+
+def _terms(text: str) -> FrozenSet[str]:
+    return frozenset(w for w in _WORD.findall(text.casefold()) if len(w) > 2 and w not in _STOPWORDS)
+
+
+def _overlap(question_terms: FrozenSet[str], text: str) -> float:
+    if not question_terms:
+        return 0.0
+    return len(question_terms & _terms(text)) / len(question_terms)
+
+
+@dataclass
+class _Unit:
+    kind: str  # "section" or "doc"
+    group: int  # section index or doc rank
+    order: int  # position inside the group
+    text: str
+    tokens: int
+    score: float
+
+
+def _passages(text: str) -> List[str]:
+    """Split a chunk into paragraphs, and paragraphs longer than ``CONTEXT_PASSAGE_TOKENS`` into sentences."""
+    out: List[str] = []
+    for para in re.split(r"\n\s*\n", text.strip()):
+        para = para.strip()
+        if not para:
+            continue
+        if estimate_tokens(para) <= config.CONTEXT_PASSAGE_TOKENS:
+            out.append(para)
+            continue
+        current = ""
+        for sentence in _SENTENCE.split(para):
+            if current and estimate_tokens(current) + estimate_tokens(sentence) > config.CONTEXT_PASSAGE_TOKENS:
+                out.append(current)
+                current = ""
+            current = f"{current} {sentence}".strip()
+        if current:
+            out.append(current)
+    return out
+
+
+def _section_score(name: str, text: str, prompt_key: str, question_terms: FrozenSet[str]) -> float:
+    if name in _PINNED_SECTIONS:
+        return math.inf
+    primary = _PRIMARY_SECTIONS.get(prompt_key, ())
+    score = 2.0 - 0.1 * primary.index(name) if name in primary else 0.5
+    if question_terms & _SECTION_TERMS.get(name, frozenset()):
+        score += 0.5
+    return score + _overlap(question_terms, text)
+
+
+def build_context(
+    question: str,
+    prompt_key: str,
+    sections: Sequence[Tuple[str, str]],
+    doc_texts: Sequence[str],
+) -> str:
+    """"External Data" + "Relevant Docs" context for ``prompt_key``, trimmed to its token budget.
+
+    ``sections`` are (name, text) pairs in display order (see
+    ``external_data_sections``); ``doc_texts`` are chunk texts in retrieval order.
+    """
+    budget = budget_for(prompt_key)
+    untrimmed = _EXTERNAL_HEADER + ("\n".join(t for _, t in sections) or _NO_EXTERNAL) + _DOCS_HEADER + "\n\n".join(doc_texts)
+    if budget <= 0:
+        return untrimmed
+    full_tokens = estimate_tokens(untrimmed)
+    if full_tokens <= budget:
+        metrics.record_context_tokens(prompt_key, full_tokens, 0)
+        return untrimmed
+
+    question_terms = _terms(question)
+    units: List[_Unit] = []
+    for i, (name, text) in enumerate(sections):
+        score = _section_score(name, text, prompt_key, question_terms)
+        units.append(_Unit("section", i, 0, text, estimate_tokens(text) + 1, score))
+    for rank, text in enumerate(doc_texts):
+        rank_weight = 1.0 / (1.0 + 0.25 * rank)
+        for j, passage in enumerate(_passages(text)):
+            # Leading passages usually carry the chunk's topic; break ties towards them
+            score = rank_weight * (0.3 + _overlap(question_terms, passage)) - 0.001 * j
+            units.append(_Unit("doc", rank, j, passage, estimate_tokens(passage) + 1, score))
+
+    remaining = budget - estimate_tokens(_EXTERNAL_HEADER + _DOCS_HEADER)
+    kept: List[_Unit] = []
+    for unit in sorted(units, key=lambda u: u.score, reverse=True):
+        if unit.tokens <= remaining or unit.score == math.inf:
+            kept.append(unit)
+            remaining -= unit.tokens
+
+    kept_sections = sorted((u for u in kept if u.kind == "section"), key=lambda u: u.group)
+    external_text = "\n".join(u.text for u in kept_sections) or _NO_EXTERNAL
+    docs: Dict[int, List[_Unit]] = {}
+    for u in kept:
+        if u.kind == "doc":
+            docs.setdefault(u.group, []).append(u)
+    doc_parts = []
+    for rank in sorted(docs):
+        passages = sorted(docs[rank], key=lambda u: u.order)
+        doc_parts.append("\n".join(p.text for p in passages))
+    context = _EXTERNAL_HEADER + external_text + _DOCS_HEADER + "\n\n".join(doc_parts)
+
+    used = estimate_tokens(context)
+    saved = max(0, full_tokens - used)
+    metrics.record_context_tokens(prompt_key, used, saved)
+    logger.info(
+        "Context for %s: ~%d tokens of %d budget (saved ~%d of %d); sections %d/%d, doc passages %d/%d from %d/%d docs",
+        prompt_key, used, budget, saved, full_tokens,
+        len(kept_sections), len(sections),
+        sum(len(v) for v in docs.values()), sum(1 for u in units if u.kind == "doc"),
+        len(docs), len(doc_texts),
+    )
+    return context
+
+
+__all__ = ["build_context", "budget_for", "estimate_tokens"]
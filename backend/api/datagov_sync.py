@@ -0,0 +1,187 @@
+"""Shared plumbing for the local mirrors of data.gov.in resources.
+
+``fetch_resource`` pages through a whole resource (first page for the total, the
+rest concurrently). ``PeriodicSync`` re-runs a mirror's sync whenever its file is
+older than the interval, holding a Redis lock so only one worker downloads while
+the others keep reading the previous file. ``match_keys`` resolves a folded filter
+value against the distinct keys of a mirror: exact, then prefix ("Pune" ->
+"Pune(Pimpri)"), then the longest key the value starts with ("Lasalgaon APMC" ->
+"Lasalgaon"), then a fuzzy match.
+"""
+import asyncio
+import difflib
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from api import redis_lock
+from api.http_clients import get_client
+from config import config
+
+logger = logging.getLogger("datagov_sync")
+
+
+def iso_date(value: Any) -> Optional[str]:
+    """data.gov.in dates (dd/mm/yyyy or ISO) as ISO strings, which sort."""
+    s = str(value or "").strip()
+    for fmt in ("%d/%m/%Y", "%Y-%m-%d", "%d-%m-%Y", "%Y-%m-%dT%H:%M:%S"):
+        try:
+            return datetime.strptime(s, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return s or None
+
+
+def file_age_s(path: str) -> Optional[float]:
+    """Seconds since ``path`` was last swapped in, or None if it does not exist."""
+    try:
+        return max(0.0, time.time() - os.path.getmtime(path))
+    except OSError:
+        return None
+
+
+def match_keys(key: str, values: List[str], cutoff: float) -> List[str]:
+    """Stored keys a folded filter value refers to; empty when nothing is close enough."""
+    if not key:
+        return []
+    if key in values:
+        return [key]
+    prefixed = [v for v in values if v.startswith(key + " ")]
+    if prefixed:
+        return prefixed
+    within = [v for v in values if key.startswith(v + " ")]
+    if within:
+        return [max(within, key=len)]
+    return difflib.get_close_matches(key, values, n=1, cutoff=cutoff)
+
+
+async def _page(resource_id: str, offset: int, limit: int) -> Dict[str, Any]:
+    params = {"api-key": config.DATA_GOV_API_KEY, "format": "json", "limit": limit, "offset": offset}
+    resp = await get_client("datagov").get(f"{config.DATA_GOV_BASE_URL}/resource/{resource_id}", params=params)
+    if resp.status_code != 200:
+        raise RuntimeError(f"{resource_id} page offset={offset} failed: {resp.status_code}")
+    return resp.json()
+
+
+async def fetch_resource(
+    resource_id: str,
+    *,
+    max_rows: int,
+    project: Optional[Callable[[Dict[str, Any]], Any]] = None,
+    pack: Optional[Callable[[List[Any]], Any]] = None,
+) -> List[Any]:
+    """Every record of a resource (up to ``max_rows``). Any failed page fails the whole download.
+
+    ``project`` maps each record to what the mirror keeps (returning None drops it),
+    so large resources are reduced page by page instead of holding every raw dict.
+    With ``pack``, each page's projected rows are handed to it as they arrive and
+    the result is the list of what it returned per page (e.g. compact arrays).
+
+    data.gov.in may return fewer records per page than asked for, so the pages
+    after the first step by the length the server actually returned, and a short
+    page is continued from where it stopped. Collecting fewer records than the
+    reported total raises instead of leaving a silently incomplete mirror.
+    """
+    page_size = config.DATAGOV_SYNC_PAGE_SIZE
+
+    def reduce(records: List[Dict[str, Any]]) -> Any:
+        rows = records if project is None else [row for row in map(project, records) if row is not None]
+        return rows if pack is None else pack(rows)
+
+    first = await _page(resource_id, 0, page_size)
+    first_records = list(first.get("records") or [])
+    if not first_records:
+        raise RuntimeError(f"{resource_id} returned no records")
+    total = min(int(first.get("total") or len(first_records)), max_rows)
+    step = len(first_records)
+    sem = asyncio.Semaphore(config.DATAGOV_SYNC_CONCURRENCY)
+
+    async def fetch(start: int) -> Tuple[int, Any]:
+        end = min(start + step, total)
+        records: List[Dict[str, Any]] = []
+        async with sem:
+            while start + len(records) < end:
+                got = (await _page(resource_id, start + len(records), end - start - len(records))).get("records") or []
+                if not got:
+                    break
+                records.extend(got[: end - start - len(records)])
+        return len(records), reduce(records)
+
+    pages = await asyncio.gather(*(fetch(off) for off in range(step, total, step)))
+    received = min(step, total) + sum(n for n, _ in pages)
+    if received < total:
+        raise RuntimeError(f"{resource_id} returned {received} of {total} records")
+    first_page = reduce(first_records[:total])
+    if pack is not None:
+        return [first_page, *(page for _, page in pages)]
+    rows = first_page
+    for _, page in pages:
+        rows.extend(page)
+    return rows
+
+
+class PeriodicSync:
+    """Background loop refreshing one mirror file every ``interval_s``."""
+
+    def __init__(self, name: str, path: str, interval_s: int, sync: Callable[[], Awaitable[int]]) -> None:
+        self.name = name
+        self.path = path
+        self.interval_s = interval_s
+        self._sync = sync
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def lock_key(self) -> str:
+        return f"{self.name}:sync:lock"
+
+    async def run_once(self) -> None:
+        r = config.aredis_client
+        token = redis_lock.new_token()
+        try:
+            got = await r.set(self.lock_key, token, nx=True, ex=config.DATAGOV_SYNC_LOCK_TTL_S)
+        except Exception as e:
+            logger.warning("%s sync lock unavailable (%s); syncing without it", self.name, e)
+            got = True
+        if not got:
+            logger.debug("%s sync already running in another worker", self.name)
+            return
+        t0 = time.monotonic()
+        try:
+            rows = await self._sync()
+            logger.info("%s mirror synced: %d rows in %d ms -> %s", self.name, rows, int((time.monotonic() - t0) * 1000), self.path)
+        except Exception as e:
+            logger.warning("%s mirror sync failed; keeping the previous mirror: %s", self.name, e)
+        finally:
+            try:
+                await redis_lock.release(r, self.lock_key, token)
+            except Exception as e:
+                logger.debug("%s sync lock not released (expires in %d s): %s", self.name, config.DATAGOV_SYNC_LOCK_TTL_S, e)
+
+    async def _loop(self) -> None:
+        interval = self.interval_s
+        while True:
+            age = file_age_s(self.path)
+            if age is None or age >= interval:
+                await self.run_once()
+                age = file_age_s(self.path)
+            # Wake when the current file is due; retry a failed/locked sync after a minute
+            delay = interval - age if age is not None and age < interval else 60
+            await asyncio.sleep(max(delay, 60))
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+
+__all__ = ["PeriodicSync", "fetch_resource", "file_age_s", "iso_date", "match_keys"]
@@ -0,0 +1,119 @@
+"""Per-request deadline and per-stage time budgets.
+
+A request may carry ``deadline_ms`` (time the caller will wait, from receipt);
+``start`` stores it in a context variable so every stage of that request, and
+the tasks it spawns, can see how much time is left. ``stage_timeout(stage)`` is
+the stage's share of the total (``DEADLINE_SHARES``), capped so that the answer
+LLM keeps its own share at the end; the answer stage gets whatever remains
+(at least ``DEADLINE_MIN_ANSWER_S``).
+
+Optional stages (extraction, geocode, fetchers, retrieval) that run out of time
+are abandoned with ``bounded``: the request continues without their output and
+the stage is listed in ``degraded()``, returned to the caller and counted in
+``agri_degraded_total{stage}``. Without a deadline nothing is bounded.
+"""
+import asyncio
+import logging
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Awaitable, Dict, List, Optional
+
+from api import metrics
+from config import config
+
+logger = logging.getLogger("deadline")
+
+
+@dataclass
+class Deadline:
+    expires_at: float  # time.monotonic()
+    total_s: float
+    degraded: List[str] = field(default_factory=list)
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+
+_current: ContextVar[Optional[Deadline]] = ContextVar("deadline", default=None)
+
+
+@lru_cache(maxsize=1)
+def _shares(spec: str) -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    for item in spec.split(","):
+        key, _, value = item.partition("=")
+        try:
+            out[key.strip()] = float(value)
+        except ValueError:
+            if item.strip():
+                logger.warning("Ignoring malformed DEADLINE_SHARES entry %r", item)
+    return out
+
+
+def start(deadline_ms: Optional[int]) -> Optional[Deadline]:
+    """Begin a deadline for the current request (``DEADLINE_DEFAULT_MS`` when None; 0 means none)."""
+    ms = deadline_ms if deadline_ms is not None else config.DEADLINE_DEFAULT_MS
+    if not ms or ms <= 0:
+        _current.set(None)
+        return None
+    d = Deadline(expires_at=time.monotonic() + ms / 1000.0, total_s=ms / 1000.0)
+    _current.set(d)
+    return d
+
+
+def current() -> Optional[Deadline]:
+    return _current.get()
+
+
+def stage_timeout(stage: str, default: Optional[float] = None) -> Optional[float]:
+    """Seconds ``stage`` may take from now, at most ``default``; ``default`` when there is no deadline."""
+    d = _current.get()
+    if d is None:
+        return default
+    shares = _shares(config.DEADLINE_SHARES)
+    remaining = d.remaining()
+    if stage == "answer":
+        timeout = max(remaining, config.DEADLINE_MIN_ANSWER_S)
+    else:
+        # Leave the answer LLM its share at the end
+        cutoff = remaining - shares.get("answer", 0.0) * d.total_s
+        share = shares.get(stage)
+        timeout = max(0.0, min(share * d.total_s, cutoff) if share is not None else cutoff)
+    return min(timeout, default) if default is not None else timeout
+
+
+def mark_degraded(stage: str) -> None:
+    d = _current.get()
+    if d is None or stage in d.degraded:
+        return
+    d.degraded.append(stage)
+    metrics.record_degraded(stage)
+    logger.warning("Deadline: degraded %s (%.2f s left of %.1f s)", stage, d.remaining(), d.total_s)
+
+
+def is_degraded(stage: str) -> bool:
+    d = _current.get()
+    return d is not None and stage in d.degraded
+
+
+def degraded() -> Optional[List[str]]:
+    """Stages degraded so far in this request; None when the request has no deadline."""
+    d = _current.get()
+    return list(d.degraded) if d is not None else None
+
+
+async def bounded(stage: str, aw: Awaitable[Any], default: Any = None) -> Any:
+    """Await ``aw`` within the stage's budget; on timeout mark the stage degraded and return ``default``."""
+    timeout = stage_timeout(stage)
+    if timeout is None:
+        return await aw
+    try:
+        return await asyncio.wait_for(aw, timeout=timeout)
+    except asyncio.TimeoutError:
+        mark_degraded(stage)
+        return default
+
+
+__all__ = ["Deadline", "start", "current", "stage_timeout", "mark_degraded", "is_degraded", "degraded", "bounded"]
@@ -0,0 +1,140 @@
+"""Fetcher declarations from pipelines.json.
+
+``pipelines.json`` holds two sections:
+
+- ``fetchers``: name -> declaration. ``function`` is ``"module:attribute"``;
+  ``inputs`` names the planner inputs whose keyword arguments it takes
+  (``coords``, ``caller_coords``, ``admin``, ``mandi_filters``, ``question``);
+  ``args`` are fixed keyword arguments; ``timeout_s``, ``stale_ttl_s`` (0 turns
+  the stale cache off) and ``singleflight`` are its run policy. ``fallback`` is
+  another declaration used when one of the inputs cannot be resolved; policy
+  fields it leaves out are inherited.
+- ``pipelines``: the routable pipelines, each listing the fetchers it needs.
+
+``run_fetcher`` looks up a fetcher's policy here by its function, and the
+planner (``plan_fetchers``) resolves inputs and schedules the fetchers of the
+picked pipelines. A bare list (the older format) is read as ``pipelines``.
+"""
+import importlib
+import json
+import logging
+import os
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("fetcher_registry")
+
+PIPELINES_FILE = os.getenv(
+    "PIPELINES_FILE",
+    os.path.join(os.path.dirname(__file__), "pipelines.json"),
+)
+
+
+@dataclass(frozen=True)
+class FetcherDef:
+    name: str
+    function: str
+    inputs: Tuple[str, ...] = ()
+    args: Dict[str, Any] = field(default_factory=dict)
+    timeout_s: Optional[float] = None
+    stale_ttl_s: Optional[int] = None
+    singleflight: bool = True
+    fallback: Optional["FetcherDef"] = None
+
+    def resolve(self) -> Callable[..., Any]:
+        """The fetcher coroutine function (imported on first use)."""
+        return _import(self.function)
+
+
+_FILE_CACHE: Optional[Dict[str, Any]] = None
+_FETCHERS: Optional[Dict[str, FetcherDef]] = None
+_BY_FUNCTION: Optional[Dict[str, FetcherDef]] = None
+_IMPORTED: Dict[str, Callable[..., Any]] = {}
+
+
+def load_pipelines_file() -> Dict[str, Any]:
+    """Parsed pipelines.json as ``{"fetchers": {...}, "pipelines": [...]}``."""
+    global _FILE_CACHE
+    if _FILE_CACHE is None:
+        with open(PIPELINES_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, list):
+            data = {"fetchers": {}, "pipelines": data}
+        _FILE_CACHE = {"fetchers": data.get("fetchers") or {}, "pipelines": data.get("pipelines") or []}
+    return _FILE_CACHE
+
+
+def _import(path: str) -> Callable[..., Any]:
+    fn = _IMPORTED.get(path)
+    if fn is None:
+        module, _, attr = path.partition(":")
+        fn = _IMPORTED[path] = getattr(importlib.import_module(module), attr)
+    return fn
+
+
+def _parse(name: str, d: Dict[str, Any], parent: Optional[FetcherDef] = None) -> FetcherDef:
+    def policy(key: str, default: Any) -> Any:
+        if d.get(key) is not None:
+            return d[key]
+        return getattr(parent, key) if parent is not None else default
+
+    timeout_s = policy("timeout_s", None)
+    stale_ttl_s = policy("stale_ttl_s", None)
+    fdef = FetcherDef(
+        name=name,
+        function=str(d["function"]),
+        inputs=tuple(str(i) for i in d.get("inputs") or ()),
+        args=dict(d.get("args") or {}),
+        timeout_s=float(timeout_s) if timeout_s else None,
+        stale_ttl_s=int(stale_ttl_s) if stale_ttl_s is not None else None,
+        singleflight=bool(policy("singleflight", True)),
+    )
+    if d.get("fallback"):
+        fdef = replace(fdef, fallback=_parse(name, d["fallback"], fdef))
+    return fdef
+
+
+def load_fetchers() -> Dict[str, FetcherDef]:
+    """Fetcher declarations by name."""
+    global _FETCHERS, _BY_FUNCTION
+    if _FETCHERS is None:
+        fetchers: Dict[str, FetcherDef] = {}
+        for name, d in load_pipelines_file()["fetchers"].items():
+            try:
+                fetchers[name] = _parse(name, d)
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning("Ignoring malformed fetcher %r in %s: %s", name, PIPELINES_FILE, e)
+        by_function: Dict[str, FetcherDef] = {}
+        for fdef in fetchers.values():
+            while fdef is not None:
+                by_function[fdef.function] = fdef
+                fdef = fdef.fallback
+        _FETCHERS, _BY_FUNCTION = fetchers, by_function
+        logger.info("Loaded %d fetchers from %s", len(fetchers), PIPELINES_FILE)
+    return _FETCHERS
+
+
+def fetcher_for(fn: Callable[..., Any]) -> Optional[FetcherDef]:
+    """Declaration whose ``function`` is ``fn``, if any."""
+    load_fetchers()
+    return (_BY_FUNCTION or {}).get(f"{fn.__module__}:{fn.__qualname__}")
+
+
+def fetchers_for(pipeline_fetchers: List[Tuple[str, ...]]) -> List[FetcherDef]:
+    """Declarations needed by the given pipelines' fetcher lists, each once, in first-seen order."""
+    fetchers = load_fetchers()
+    out: List[FetcherDef] = []
+    seen = set()
+    for names in pipeline_fetchers:
+        for name in names:
+            if name in seen:
+                continue
+            seen.add(name)
+            if name in fetchers:
+                out.append(fetchers[name])
+            else:
+                logger.warning("Pipeline refers to unknown fetcher %r", name)
+    return out
+
+
+__all__ = ["FetcherDef", "PIPELINES_FILE", "load_pipelines_file", "load_fetchers", "fetcher_for", "fetchers_for"]
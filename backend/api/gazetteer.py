@@ -0,0 +1,285 @@
+"""Offline gazetteer of Indian states, districts, talukas and towns.
+
+Loaded once from ``GAZETTEER_PATH`` (a CSV with columns name, kind, district,
+state, lat, lon, aliases; bundled: ``api/india_gazetteer.csv``) into a sorted
+key list with parallel arrays. Lookups are a dict hit or a bisect in the common
+case, so the geocoder can resolve most region strings without the network.
+
+Keys are transliteration-folded (``fold``): Pune/Poona, Nashik/Nasik,
+Buldhana/Buldana and Bareilly/Bareli collapse to the same key. Remaining typos are
+caught by a bounded fuzzy match over keys sharing the first letter.
+
+A key naming places in several states (Aurangabad, Bilaspur, Pratapgarh, Una)
+resolves only when the text also names the state; a bare name is ambiguous
+(``ambiguous_places``) and is never settled by row order.
+"""
+import bisect
+import csv
+import difflib
+import logging
+import os
+import re
+import unicodedata
+from array import array
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from config import config
+
+logger = logging.getLogger("gazetteer")
+
+GAZETTEER_FILE = os.getenv(
+    "GAZETTEER_PATH",
+    os.path.join(os.path.dirname(__file__), "india_gazetteer.csv"),
+)
+
+# Stored as a byte per place; index 0 (state) loses ties to real places of the same name
+_KINDS = ("state", "district", "taluka", "town", "village")
+
+# Words that describe a place rather than name it ("Junnar taluka", "Pune mandi")
+_NOISE = {
+    "district", "dist", "distt", "taluka", "taluk", "tehsil", "tahsil", "block", "village", "gaon",
+    "city", "town", "mandi", "apmc", "market", "region", "area", "near", "in", "at", "the", "of",
+    "state", "division", "rural", "urban", "india",
+}
+
+# Spelling variants common in romanised Indian place names, applied in order
+_FOLD_RULES: Tuple[Tuple[str, str], ...] = (
+    ("ee", "i"), ("oo", "u"), ("ou", "u"), ("aa", "a"),
+    ("sh", "s"), ("ph", "f"), ("bh", "b"), ("dh", "d"), ("th", "t"), ("kh", "k"),
+    ("gh", "g"), ("ch", "c"), ("jh", "j"), ("ck", "k"),
+    ("w", "v"), ("z", "j"), ("q", "k"), ("y", "i"),
+)
+
+
+def _fold_token(tok: str) -> str:
+    for a, b in _FOLD_RULES:
+        tok = tok.replace(a, b)
+    tok = re.sub(r"(.)\1+", r"\1", tok)  # Bareilly -> bareli
+    if len(tok) > 3:
+        tok = tok.rstrip("aeh") or tok  # Pune/Poona -> pun
+    return tok
+
+
+def fold(text: str) -> str:
+    """Normalise a place name to its lookup key."""
+    s = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode("ascii").lower()
+    s = s.replace("&", " and ")
+    tokens = [t for t in re.split(r"[^a-z0-9]+", s) if t]
+    return " ".join(_fold_token(t) for t in tokens)
+
+
+def _strip_noise(text: str) -> str:
+    words = [w for w in re.split(r"[^A-Za-z0-9&]+", text or "") if w]
+    return " ".join(w for w in words if w.lower() not in _NOISE)
+
+
+def _windows(key: str, longest: int = 4) -> Iterator[str]:
+    """Runs of up to ``longest`` words of a folded key, longest first."""
+    words = key.split()
+    for size in range(min(len(words), longest), 0, -1):
+        for start in range(len(words) - size + 1):
+            yield " ".join(words[start:start + size])
+
+
+@dataclass(frozen=True)
+class Place:
+    name: str
+    kind: str
+    district: Optional[str]
+    state: str
+    lat: float
+    lon: float
+
+
+class Gazetteer:
+    """Sorted folded keys -> place indices, with places held in parallel arrays."""
+
+    def __init__(self, rows: List[Dict[str, str]]) -> None:
+        self._names: List[str] = []
+        self._kinds = array("B")
+        self._districts: List[Optional[str]] = []
+        self._states: List[str] = []
+        self._lat = array("f")
+        self._lon = array("f")
+        index: Dict[str, List[int]] = {}
+        state_keys: Dict[str, str] = {}
+        for row in rows:
+            try:
+                lat, lon = float(row["lat"]), float(row["lon"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            name = (row.get("name") or "").strip()
+            if not name:
+                continue
+            kind = (row.get("kind") or "town").strip().lower()
+            i = len(self._names)
+            self._names.append(name)
+            self._kinds.append(_KINDS.index(kind) if kind in _KINDS else _KINDS.index("town"))
+            self._districts.append((row.get("district") or "").strip() or None)
+            self._states.append((row.get("state") or "").strip())
+            self._lat.append(lat)
+            self._lon.append(lon)
+            names = [name] + [a for a in (row.get("aliases") or "").split("|") if a.strip()]
+            for n in names:
+                key = fold(n)
+                if key:
+                    index.setdefault(key, []).append(i)
+                    if kind == "state":
+                        state_keys[key] = self._states[i]
+        self._index = index
+        self._keys = sorted(index)
+        self._state_keys = state_keys
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def _place(self, i: int) -> Place:
+        return Place(self._names[i], _KINDS[self._kinds[i]], self._districts[i], self._states[i], float(self._lat[i]), float(self._lon[i]))
+
+    def _best(self, ids: List[int], state: Optional[str]) -> Optional[int]:
+        """The place ``ids`` mean, or None when they lie in several states and ``state`` does not pick one."""
+        if state:
+            in_state = [i for i in ids if self._states[i] == state]
+            ids = in_state or ids
+        places = [i for i in ids if self._kinds[i] != 0]
+        if len({self._states[i] for i in places}) > 1:
+            return None
+        # Within one state, row order breaks ties, so the bundled file lists the usual meaning first
+        return min(ids, key=lambda i: (self._kinds[i] == 0, i))
+
+    def _fuzzy(self, key: str, cutoff: float) -> Optional[str]:
+        lo = bisect.bisect_left(self._keys, key[:1])
+        hi = bisect.bisect_left(self._keys, key[:1] + "\x7f")
+        match = difflib.get_close_matches(key, self._keys[lo:hi], n=1, cutoff=cutoff)
+        return match[0] if match else None
+
+    def _match(self, text: str, fuzzy: bool) -> Tuple[List[int], Optional[str]]:
+        """(place ids under the first key the text names, state it names) for ``lookup``."""
+        parts = [fold(_strip_noise(p)) for p in re.split(r"[,/;]| - ", text or "")]
+        parts = [p for p in parts if p]
+        if not parts:
+            return [], None
+        state = next((self._state_keys[p] for p in parts if p in self._state_keys), None)
+        non_state = [p for p in parts if p not in self._state_keys] or parts
+        if state is None:
+            # "Aurangabad Maharashtra": a state named inside a part
+            state = next((self._state_keys[w] for p in non_state for w in _windows(p) if w in self._state_keys), None)
+
+        for p in non_state:
+            ids = self._index.get(p)
+            if ids:
+                return ids, state
+        # "Junnar Pune", "onion rate Lasalgaon": longest word window that names a place, else a state
+        state_ids: List[int] = []
+        for p in non_state:
+            for w in _windows(p):
+                ids = self._index.get(w)
+                if ids and any(self._kinds[i] != 0 for i in ids):
+                    return ids, state
+                state_ids = state_ids or ids or []
+        if state_ids:
+            return state_ids, state
+        if fuzzy:
+            for p in non_state:
+                key = self._fuzzy(p, config.GAZETTEER_FUZZY_CUTOFF)
+                if key:
+                    return self._index[key], state
+        return [], state
+
+    def lookup(self, text: str, *, fuzzy: bool = True) -> Optional[Place]:
+        """Resolve a free-form region ("Junnar, Pune", "Nasik district", "Poona") to a place.
+
+        Comma-separated parts are tried most specific first; a part naming a state
+        narrows the others to that state. Falls back to word windows and then to
+        a fuzzy match. None when nothing matches or the name is ambiguous.
+        """
+        ids, state = self._match(text, fuzzy)
+        best = self._best(ids, state) if ids else None
+        return self._place(best) if best is not None else None
+
+    def ambiguous(self, text: str) -> List[Place]:
+        """One place per state when ``text`` names places in several states without naming the state."""
+        ids, state = self._match(text, fuzzy=True)
+        if not ids or self._best(ids, state) is not None:
+            return []
+        by_state: Dict[str, int] = {}
+        for i in ids:
+            if self._kinds[i] != 0:
+                by_state.setdefault(self._states[i], i)
+        return [self._place(i) for i in by_state.values()]
+
+    def complete(self, prefix: str, limit: int = 10) -> List[Place]:
+        """Places whose folded name starts with ``prefix`` (for typeahead and disambiguation)."""
+        key = fold(prefix)
+        if not key:
+            return []
+        out: List[Place] = []
+        seen = set()
+        for k in self._keys[bisect.bisect_left(self._keys, key):]:
+            if not k.startswith(key) or len(out) >= limit:
+                break
+            for i in self._index[k]:
+                if i not in seen:
+                    seen.add(i)
+                    out.append(self._place(i))
+        return out[:limit]
+
+    def admin_points(self) -> Tuple[array, array, List[Tuple[str, str]]]:
+        """(lats, lons, [(state, district)]) for every place below state level, for nearest-place search."""
+        lats, lons = array("f"), array("f")
+        areas: List[Tuple[str, str]] = []
+        for i in range(len(self._names)):
+            if self._kinds[i] == 0 or not self._districts[i]:
+                continue
+            lats.append(self._lat[i])
+            lons.append(self._lon[i])
+            areas.append((self._states[i], self._districts[i]))
+        return lats, lons, areas
+
+
+_GAZETTEER: Optional[Gazetteer] = None
+
+
+def get_gazetteer() -> Gazetteer:
+    global _GAZETTEER
+    if _GAZETTEER is None:
+        rows: List[Dict[str, str]] = []
+        try:
+            with open(GAZETTEER_FILE, "r", encoding="utf-8", newline="") as f:
+                rows = list(csv.DictReader(f))
+        except Exception as e:
+            logger.warning("Gazetteer not loaded from %s: %s", GAZETTEER_FILE, e)
+        _GAZETTEER = Gazetteer(rows)
+        logger.info("Gazetteer loaded: %d places, %d keys", len(_GAZETTEER), len(_GAZETTEER._keys))
+    return _GAZETTEER
+
+
+def lookup_place(text: str) -> Optional[Place]:
+    return get_gazetteer().lookup(text)
+
+
+def ambiguous_places(text: str) -> List[Place]:
+    """Candidates, one per state, for a bare name ``lookup_place`` will not resolve ("Aurangabad")."""
+    return get_gazetteer().ambiguous(text)
+
+
+def canonical_admin(state: Optional[str], district: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """Map free-text state/district to the gazetteer (data.gov.in) spellings.
+
+    "Nasik", "Maharastra" -> ("Maharashtra", "Nashik"). Names the gazetteer does
+    not know are passed through unchanged.
+    """
+    g = get_gazetteer()
+    if district:
+        place = g.lookup(f"{district}, {state}" if state else district)
+        if place is not None and place.kind != "state":
+            return place.state, place.district or place.name
+    if state:
+        place = g.lookup(state)
+        if place is not None and place.kind == "state":
+            return place.state, district
+    return state, district
+
+
+__all__ = ["Place", "Gazetteer", "fold", "get_gazetteer", "lookup_place", "ambiguous_places", "canonical_admin"]
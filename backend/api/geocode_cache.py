@@ -0,0 +1,133 @@
+"""Two-tier cache in front of network geocoding.
+
+Tier 1 is an in-process LRU; tier 2 is Redis (``geocode:{hash}``) shared by all
+workers. Successful lookups live for ``GEOCODE_CACHE_TTL_S``; failures (no result,
+timeout, upstream error) are cached as negative entries for the shorter
+``GEOCODE_NEGATIVE_TTL_S`` so a bad place name is not retried on every request.
+Concurrent lookups of the same normalised name share one outstanding request.
+Outcomes are counted in ``agri_geocode_cache_total{result}``.
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from api import metrics
+from api.gazetteer import fold
+from config import config
+
+logger = logging.getLogger("geocode_cache")
+
+Coords = Tuple[Optional[float], Optional[float]]
+
+# normalised name -> (lat, lon, expires_at); lat/lon None for a negative entry
+_LRU: "OrderedDict[str, Tuple[Optional[float], Optional[float], float]]" = OrderedDict()
+_INFLIGHT: Dict[str, "asyncio.Future[Coords]"] = {}
+_NEGATIVE = b"-"
+
+
+def normalize_name(name: str) -> str:
+    return fold(name)
+
+
+def _redis_key(norm: str) -> str:
+    return f"{config.GEOCODE_CACHE_PREFIX}:{hashlib.sha1(norm.encode('utf-8')).hexdigest()[:20]}"
+
+
+def _remember(norm: str, lat: Optional[float], lon: Optional[float], ttl_s: int) -> None:
+    _LRU[norm] = (lat, lon, time.monotonic() + ttl_s)
+    _LRU.move_to_end(norm)
+    while len(_LRU) > config.GEOCODE_CACHE_SIZE:
+        _LRU.popitem(last=False)
+
+
+def _from_memory(norm: str) -> Optional[Tuple[Optional[float], Optional[float]]]:
+    hit = _LRU.get(norm)
+    if hit is None:
+        return None
+    lat, lon, expires_at = hit
+    if expires_at <= time.monotonic():
+        _LRU.pop(norm, None)
+        return None
+    _LRU.move_to_end(norm)
+    return lat, lon
+
+
+async def _from_redis(norm: str) -> Optional[Tuple[Optional[float], Optional[float]]]:
+    try:
+        r = config.aredis_client
+        key = _redis_key(norm)
+        pipe = r.pipeline(transaction=False)
+        pipe.get(key)
+        pipe.ttl(key)
+        raw, ttl = await pipe.execute()
+    except Exception as e:
+        logger.warning("Geocode cache read failed: %s", e)
+        return None
+    if raw is None:
+        return None
+    # Keep the memory copy no longer than Redis would
+    ttl_s = int(ttl) if ttl and int(ttl) > 0 else config.GEOCODE_NEGATIVE_TTL_S
+    if raw == _NEGATIVE:
+        _remember(norm, None, None, ttl_s)
+        return None, None
+    try:
+        lat_s, lon_s = raw.decode("utf-8").split(",", 1)
+        lat, lon = float(lat_s), float(lon_s)
+    except Exception:
+        return None
+    _remember(norm, lat, lon, ttl_s)
+    return lat, lon
+
+
+async def _store(norm: str, lat: Optional[float], lon: Optional[float]) -> None:
+    found = lat is not None and lon is not None
+    ttl_s = config.GEOCODE_CACHE_TTL_S if found else config.GEOCODE_NEGATIVE_TTL_S
+    _remember(norm, lat if found else None, lon if found else None, ttl_s)
+    try:
+        value = f"{lat:.6f},{lon:.6f}".encode("utf-8") if found else _NEGATIVE
+        await config.aredis_client.set(_redis_key(norm), value, ex=ttl_s)
+    except Exception as e:
+        logger.warning("Geocode cache write failed: %s", e)
+
+
+async def _resolve(norm: str, name: str, resolver: Callable[[str], Awaitable[Coords]]) -> Coords:
+    cached = await _from_redis(norm)
+    if cached is not None:
+        metrics.record_geocode_cache("negative_hit" if cached[0] is None else "redis_hit")
+        return cached
+    metrics.record_geocode_cache("miss")
+    try:
+        lat, lon = await resolver(name)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.warning("Geocode failed for %r: %s", name, e)
+        lat, lon = None, None
+    await _store(norm, lat, lon)
+    return lat, lon
+
+
+async def cached_geocode(name: str, resolver: Callable[[str], Awaitable[Coords]]) -> Coords:
+    """Geocode ``name`` through the cache, calling ``resolver`` only on a miss."""
+    norm = normalize_name(name)
+    if not norm:
+        return None, None
+    hit = _from_memory(norm)
+    if hit is not None:
+        metrics.record_geocode_cache("negative_hit" if hit[0] is None else "memory_hit")
+        return hit
+    fut = _INFLIGHT.get(norm)
+    if fut is None:
+        fut = asyncio.ensure_future(_resolve(norm, name, resolver))
+        _INFLIGHT[norm] = fut
+        fut.add_done_callback(lambda _f, k=norm: _INFLIGHT.pop(k, None))
+    else:
+        metrics.record_geocode_cache("inflight_shared")
+    # A caller giving up must not cancel the lookup other callers are waiting on
+    return await asyncio.shield(fut)
+
+
+__all__ = ["cached_geocode", "normalize_name"]
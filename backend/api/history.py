@@ -0,0 +1,134 @@
+"""Conversation history storage off the request path.
+
+Handlers call ``history_writer.submit(call_sid, record)``, which only enqueues.
+A background task drains the queue in batches and writes them through one Redis
+pipeline per batch: LPUSH (newest first), LTRIM to ``HISTORY_MAX_TURNS`` and
+EXPIRE ``HISTORY_TTL_S`` on every touched ``call:{sid}:history`` list. Records
+are msgpack-encoded; legacy JSON entries are still readable.
+"""
+import asyncio
+import json
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import msgpack
+
+from api import metrics
+from config import config
+
+logger = logging.getLogger("history")
+
+
+def history_key(call_sid: str) -> str:
+    return f"call:{call_sid}:history"
+
+
+def encode_record(rec: Dict[str, Any]) -> bytes:
+    return msgpack.packb(rec, use_bin_type=True)
+
+
+def decode_record(raw: bytes) -> Dict[str, Any]:
+    # Entries written before the msgpack switch are JSON objects
+    if raw[:1] == b"{":
+        return json.loads(raw.decode("utf-8"))
+    return msgpack.unpackb(raw, raw=False)
+
+
+class HistoryWriter:
+    def __init__(self) -> None:
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _ensure_started(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=config.HISTORY_QUEUE_SIZE)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self._queue
+
+    async def start(self) -> None:
+        self._ensure_started()
+        logger.info(
+            "History writer started (max_turns=%d ttl=%ds batch=%d)",
+            config.HISTORY_MAX_TURNS, config.HISTORY_TTL_S, config.HISTORY_BATCH_SIZE,
+        )
+
+    async def stop(self) -> None:
+        """Flush everything queued so far, then stop the background task."""
+        if self._task is None or self._queue is None:
+            return
+        await self._queue.put(None)  # sentinel: flush and exit
+        try:
+            await asyncio.wait_for(self._task, timeout=10)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            logger.warning("History writer did not drain in time")
+        self._task = None
+
+    def submit(self, call_sid: str, rec: Dict[str, Any]) -> None:
+        """Enqueue a record; never blocks. Drops (and logs) when the queue is full."""
+        try:
+            self._ensure_started().put_nowait((call_sid, encode_record(rec)))
+        except asyncio.QueueFull:
+            logger.error("History queue full; dropping record for %s", call_sid)
+            metrics.record_fallback("history_dropped")
+
+    async def _run(self) -> None:
+        queue = self._queue
+        assert queue is not None
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            batch = [item]
+            stopping = False
+            deadline = loop.time() + config.HISTORY_FLUSH_INTERVAL_MS / 1000
+            while len(batch) < config.HISTORY_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+            if stopping:
+                return
+
+    async def _flush(self, batch: List[Tuple[str, bytes]]) -> None:
+        grouped: Dict[str, List[bytes]] = {}
+        for call_sid, blob in batch:
+            grouped.setdefault(history_key(call_sid), []).append(blob)
+        try:
+            with metrics.stage("history_write"):
+                pipe = config.aredis_client.pipeline(transaction=False)
+                for key, blobs in grouped.items():
+                    # LPUSH of oldest..newest leaves the newest at index 0
+                    pipe.lpush(key, *blobs)
+                    pipe.ltrim(key, 0, config.HISTORY_MAX_TURNS - 1)
+                    pipe.expire(key, config.HISTORY_TTL_S)
+                await pipe.execute()
+            logger.debug("History flushed %d records across %d sessions", len(batch), len(grouped))
+        except Exception as e:
+            logger.error("History flush failed (%d records): %s", len(batch), e)
+
+
+history_writer = HistoryWriter()
+
+
+async def read_recent(call_sid: str, n: int = 10) -> List[Dict[str, Any]]:
+    """Most recent ``n`` turns for a session, newest first."""
+    if n <= 0:
+        return []
+    raw = await config.aredis_client.lrange(history_key(call_sid), 0, n - 1)
+    turns: List[Dict[str, Any]] = []
+    for blob in raw:
+        try:
+            turns.append(decode_record(blob))
+        except Exception as e:
+            logger.warning("Undecodable history entry for %s: %s", call_sid, e)
+    return turns
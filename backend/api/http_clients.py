@@ -0,0 +1,101 @@
+"""Application-scoped pooled HTTP clients, one per upstream.
+
+Fetchers call ``get_client("owm" | "datagov" | "nominatim")`` instead of opening
+an ``httpx.AsyncClient`` per call, so DNS, TCP and TLS setup is paid once per
+connection and connections are kept alive between requests. Pool size and
+timeout are configured per upstream; HTTP/2 is negotiated when the optional
+``h2`` package is installed and ``HTTP2_ENABLED`` is on.
+
+``start_clients()`` / ``close_clients()`` run on app startup/shutdown; clients are
+also created lazily so scripts that never start the app still work.
+"""
+import importlib.util
+import logging
+from dataclasses import dataclass, field
+from typing import Dict
+
+import httpx
+
+from config import config
+
+logger = logging.getLogger("http_clients")
+
+
+@dataclass(frozen=True)
+class UpstreamSettings:
+    timeout_s: float
+    max_connections: int
+    max_keepalive: int
+    headers: Dict[str, str] = field(default_factory=dict)
+    hedge: bool = True  # may send a second, duplicate GET when slow (see api.resilience)
+
+
+def _upstreams() -> Dict[str, UpstreamSettings]:
+    return {
+        "owm": UpstreamSettings(config.OWM_TIMEOUT_S, config.OWM_MAX_CONNECTIONS, config.OWM_MAX_CONNECTIONS),
+        "datagov": UpstreamSettings(config.DATA_GOV_TIMEOUT_S, config.DATA_GOV_MAX_CONNECTIONS, config.DATA_GOV_MAX_CONNECTIONS),
+        # Nominatim's usage policy allows ~1 request/s; keep the pool tiny
+        "nominatim": UpstreamSettings(
+            config.NOMINATIM_TIMEOUT_S,
+            config.NOMINATIM_MAX_CONNECTIONS,
+            config.NOMINATIM_MAX_CONNECTIONS,
+            {"User-Agent": "captial-one-agri-app/1.0"},
+            hedge=False,
+        ),
+    }
+
+
+_CLIENTS: Dict[str, httpx.AsyncClient] = {}
+_HTTP2 = config.HTTP2_ENABLED and importlib.util.find_spec("h2") is not None
+
+
+def upstream_names() -> list:
+    return sorted(_upstreams())
+
+
+def upstream_settings(name: str) -> UpstreamSettings:
+    settings = _upstreams().get(name)
+    if settings is None:
+        raise KeyError(f"Unknown upstream {name!r}")
+    return settings
+
+
+def _build(name: str) -> httpx.AsyncClient:
+    settings = upstream_settings(name)
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(settings.timeout_s, connect=min(settings.timeout_s, 5.0)),
+        limits=httpx.Limits(
+            max_connections=settings.max_connections,
+            max_keepalive_connections=settings.max_keepalive,
+            keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY_S,
+        ),
+        headers=settings.headers,
+        http2=_HTTP2,
+    )
+
+
+def get_client(name: str) -> httpx.AsyncClient:
+    """Shared client for an upstream. Do not close it; the app owns its lifetime."""
+    client = _CLIENTS.get(name)
+    if client is None or client.is_closed:
+        client = _CLIENTS[name] = _build(name)
+    return client
+
+
+async def start_clients() -> None:
+    for name in _upstreams():
+        get_client(name)
+    logger.info("HTTP clients ready: %s (http2=%s)", ", ".join(_CLIENTS), _HTTP2)
+
+
+async def close_clients() -> None:
+    clients = list(_CLIENTS.values())
+    _CLIENTS.clear()
+    for client in clients:
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.warning("HTTP client close failed: %s", e)
+
+
+__all__ = ["get_client", "upstream_names", "upstream_settings", "start_clients", "close_clients"]
@@ -0,0 +1,213 @@
+"""Vectorised mandi price analytics for the answer prompt.
+
+``analyze`` takes every matching mandi record (``MandiRecord``, from the mirror
+or the live API), loads them into columnar NumPy arrays and computes, per market and commodity:
+
+- latest modal price and its date, spread (max - min) on that day
+- day-over-day change against the market's previous reporting day
+- week-over-week change of the 7-day mean modal price against the 7 days before
+- modal price distribution (p25 / median / p75) over all reporting days
+
+Markets are placed with the offline gazetteer, so ``best_nearby`` can list the
+highest-paying markets within ``MANDI_NEARBY_RADIUS_KM`` of the caller. The LLM
+gets this compact table (see ``summarize_external_data``) instead of raw rows.
+"""
+import logging
+import math
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from api.gazetteer import fold, lookup_place
+from api.payloads import MandiRecord
+from config import config
+
+logger = logging.getLogger("mandi_analytics")
+
+
+@lru_cache(maxsize=8192)
+def market_coords(market: str, district: str, state: str) -> Optional[Tuple[float, float]]:
+    """Approximate market location: the market town, else its district, from the gazetteer."""
+    for text in (f"{market}, {district}, {state}", f"{district}, {state}"):
+        place = lookup_place(text.strip(", "))
+        if place is not None and place.kind != "state":
+            return place.lat, place.lon
+    return None
+
+
+def _distance_km(lat1: float, lon1: float, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    p1, p2 = math.radians(lat1), np.radians(lat2)
+    dlat = p2 - p1
+    dlon = np.radians(lon2) - math.radians(lon1)
+    a = np.sin(dlat / 2) ** 2 + math.cos(p1) * np.cos(p2) * np.sin(dlon / 2) ** 2
+    return 2 * 6371.0 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _columns(records: List[MandiRecord]) -> Optional[Dict[str, np.ndarray]]:
+    keys, days, modal, low, high = [], [], [], [], []
+    for rec in records:
+        date = rec.arrival_date
+        if not date or len(date) != 10 or rec.modal_price is None:
+            continue
+        keys.append(f"{rec.market or ''}\x1f{rec.district or ''}\x1f{rec.state or ''}\x1f{rec.commodity or ''}")
+        days.append(date)
+        modal.append(rec.modal_price)
+        low.append(np.nan if rec.min_price is None else rec.min_price)
+        high.append(np.nan if rec.max_price is None else rec.max_price)
+    if not keys:
+        return None
+    return {
+        "key": np.asarray(keys, dtype=str),
+        "day": np.asarray(days, dtype="datetime64[D]").astype(np.int64),
+        "modal": np.asarray(modal, dtype=np.float64),
+        "min": np.asarray(low, dtype=np.float64),
+        "max": np.asarray(high, dtype=np.float64),
+    }
+
+
+def _market_stats(cols: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """One row per market/commodity, computed with group-bys over sorted arrays."""
+    names, group = np.unique(cols["key"], return_inverse=True)
+    n = len(names)
+
+    # Collapse varieties/grades reported by one market on one day to a single daily price
+    day_min = int(cols["day"].min())
+    gd = group.astype(np.int64) * (int(cols["day"].max()) - day_min + 1) + (cols["day"] - day_min)
+    gd_keys, gd_idx = np.unique(gd, return_inverse=True)
+    cnt = np.bincount(gd_idx)
+    d_modal = np.bincount(gd_idx, weights=cols["modal"]) / cnt
+    d_min = np.full(len(gd_keys), np.inf)
+    np.minimum.at(d_min, gd_idx, np.where(np.isfinite(cols["min"]), cols["min"], np.inf))
+    d_max = np.full(len(gd_keys), -np.inf)
+    np.maximum.at(d_max, gd_idx, np.where(np.isfinite(cols["max"]), cols["max"], -np.inf))
+    span = int(cols["day"].max()) - day_min + 1
+    d_group = gd_keys // span
+    d_day = gd_keys % span + day_min
+
+    # gd_keys is sorted, so each market's days are contiguous and ascending
+    counts = np.bincount(d_group, minlength=n)
+    last = np.cumsum(counts) - 1
+    first = last - counts + 1
+    prev = np.where(counts > 1, last - 1, last)
+    latest = d_modal[last]
+    dod = np.where(counts > 1, latest - d_modal[prev], np.nan)
+    spread = np.where(np.isfinite(d_max[last]) & np.isfinite(d_min[last]), d_max[last] - d_min[last], np.nan)
+
+    age = d_day[last][d_group] - d_day
+    this_week = (age < 7).astype(np.float64)
+    last_week = ((age >= 7) & (age < 14)).astype(np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        m_this = np.bincount(d_group, weights=d_modal * this_week, minlength=n) / np.bincount(d_group, weights=this_week, minlength=n)
+        m_last = np.bincount(d_group, weights=d_modal * last_week, minlength=n) / np.bincount(d_group, weights=last_week, minlength=n)
+        wow_pct = (m_this - m_last) / m_last * 100.0
+
+    # Distribution of daily modal prices per market: sort within groups and index quantiles
+    order = np.lexsort((d_modal, d_group))
+    sorted_modal = d_modal[order]
+
+    def quantile(q: float) -> np.ndarray:
+        return sorted_modal[first + np.floor(q * (counts - 1)).astype(np.int64)]
+
+    return {
+        "key": names,
+        "latest": latest,
+        "day": d_day[last],
+        "dod": dod,
+        "wow_pct": wow_pct,
+        "spread": spread,
+        "p25": quantile(0.25),
+        "median": quantile(0.5),
+        "p75": quantile(0.75),
+        "days": counts,
+    }
+
+
+def _round(v: float, nd: int = 0) -> Optional[float]:
+    if not np.isfinite(v):
+        return None
+    return round(float(v), nd) if nd else int(round(float(v)))
+
+
+def _row(stats: Dict[str, np.ndarray], i: int, distance: Optional[float]) -> Dict[str, Any]:
+    market, district, state, commodity = str(stats["key"][i]).split("\x1f")
+    return {
+        "market": market,
+        "district": district or None,
+        "state": state or None,
+        "commodity": commodity or None,
+        "modal": _round(stats["latest"][i]),
+        "date": str(np.datetime64(int(stats["day"][i]), "D")),
+        "dod": _round(stats["dod"][i]),
+        "wow_pct": _round(stats["wow_pct"][i], 1),
+        "p25": _round(stats["p25"][i]),
+        "median": _round(stats["median"][i]),
+        "p75": _round(stats["p75"][i]),
+        "spread": _round(stats["spread"][i]),
+        "distance_km": _round(distance) if distance is not None else None,
+    }
+
+
+def analyze(
+    records: List[MandiRecord],
+    *,
+    origin: Optional[Tuple[float, float]] = None,
+    focus: Optional[Dict[str, Optional[str]]] = None,
+    max_rows: int = 5,
+) -> Optional[Dict[str, Any]]:
+    """Compact price table for ``records``; None when no record has a usable price and date.
+
+    ``focus`` (market/district filters from the query) picks the markets listed
+    first; ``origin`` (lat, lon) enables distances and ``best_nearby``.
+    """
+    cols = _columns(records)
+    if cols is None:
+        return None
+    stats = _market_stats(cols)
+    n = len(stats["key"])
+    parts = np.char.split(stats["key"], "\x1f")
+    dist = np.full(n, np.nan)
+    if origin is not None:
+        coords = [market_coords(*p[:3]) for p in parts]
+        known = np.array([c is not None for c in coords])
+        if known.any():
+            lat = np.array([c[0] if c else 0.0 for c in coords])
+            lon = np.array([c[1] if c else 0.0 for c in coords])
+            dist = np.where(known, _distance_km(origin[0], origin[1], lat, lon), np.nan)
+
+    # Markets the farmer asked about, else the highest-paying ones overall
+    focus = focus or {}
+    wanted = np.ones(n, dtype=bool)
+    for field, idx in (("market", 0), ("district", 1)):
+        value = fold(focus.get(field) or "")
+        if value:
+            wanted &= np.array([fold(p[idx]).startswith(value) for p in parts])
+    if not wanted.any():
+        wanted[:] = True
+    picked = np.flatnonzero(wanted)
+    picked = picked[np.argsort(-stats["latest"][picked], kind="stable")][:max_rows]
+
+    radius = config.MANDI_NEARBY_RADIUS_KM
+    nearby = np.flatnonzero(np.isfinite(dist) & (dist <= radius))
+    nearby = nearby[np.argsort(-stats["latest"][nearby], kind="stable")][:3]
+
+    def dist_of(i: int) -> Optional[float]:
+        return float(dist[i]) if np.isfinite(dist[i]) else None
+
+    latest_all = stats["latest"]
+    return {
+        "as_of": str(np.datetime64(int(stats["day"].max()), "D")),
+        "records": int(len(cols["key"])),
+        "markets_total": n,
+        "overall": {
+            "p25": _round(np.percentile(latest_all, 25)),
+            "median": _round(np.median(latest_all)),
+            "p75": _round(np.percentile(latest_all, 75)),
+        },
+        "markets": [_row(stats, int(i), dist_of(int(i))) for i in picked],
+        "best_nearby": [_row(stats, int(i), dist_of(int(i))) for i in nearby],
+        "radius_km": radius if origin is not None else None,
+    }
+
+
+__all__ = ["analyze", "market_coords"]
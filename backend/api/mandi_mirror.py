@@ -0,0 +1,179 @@
+"""Local SQLite mirror of the data.gov.in daily mandi price resource.
+
+A background job (``start_sync`` on app startup, see ``api.datagov_sync``) pages
+through the whole resource every ``MANDI_SYNC_INTERVAL_S``, builds a fresh
+database next to ``MANDI_MIRROR_PATH`` and atomically swaps it in, so readers
+never see a partial sync.
+
+Filter values are matched on transliteration-folded keys (``api.gazetteer.fold``)
+with prefix and fuzzy fallbacks against the distinct values of that column.
+``query`` returns None when the mirror is missing or older than
+``MANDI_MIRROR_MAX_AGE_S`` so the caller can fall back to the live API.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from api.datagov_sync import PeriodicSync, fetch_resource, file_age_s, iso_date, match_keys
+from api.gazetteer import fold
+from api.payloads import MandiRecord
+from config import config
+
+logger = logging.getLogger("mandi_mirror")
+
+MANDI_RESOURCE_ID = "9ef84268-d588-465a-a308-a864a43d0070"
+
+# Text columns as named by the resource; all but grade get a folded ``*_k`` key column
+_TEXT_COLS = ("state", "district", "market", "commodity", "variety", "grade")
+_KEYED_COLS = ("state", "district", "market", "commodity", "variety")
+_PRICE_COLS = ("min_price", "max_price", "modal_price")
+
+_SCHEMA = """
+CREATE TABLE prices (
+    state TEXT, district TEXT, market TEXT, commodity TEXT, variety TEXT, grade TEXT,
+    arrival_date TEXT, min_price REAL, max_price REAL, modal_price REAL,
+    state_k TEXT, district_k TEXT, market_k TEXT, commodity_k TEXT, variety_k TEXT
+);
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+# Built after the bulk insert; cheaper than maintaining them row by row
+_INDEXES = """
+CREATE INDEX ix_prices_state ON prices (state_k, district_k);
+CREATE INDEX ix_prices_district ON prices (district_k);
+CREATE INDEX ix_prices_market ON prices (market_k);
+CREATE INDEX ix_prices_commodity ON prices (commodity_k, arrival_date);
+CREATE INDEX ix_prices_date ON prices (arrival_date);
+"""
+
+# (path, mtime) -> column -> distinct folded keys, for prefix/fuzzy matching
+_distinct_cache: Tuple[Optional[Tuple[str, float]], Dict[str, List[str]]] = (None, {})
+
+
+def _price(value: Any) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _row(rec: Dict[str, Any]) -> Tuple[Any, ...]:
+    text = [str(rec.get(c) or "").strip() or None for c in _TEXT_COLS]
+    prices = [_price(rec.get(c)) for c in _PRICE_COLS]
+    keys = [fold(rec.get(c) or "") or None for c in _KEYED_COLS]
+    return (*text, iso_date(rec.get("arrival_date")), *prices, *keys)
+
+
+def mirror_age_s() -> Optional[float]:
+    return file_age_s(config.MANDI_MIRROR_PATH)
+
+
+def is_fresh() -> bool:
+    age = mirror_age_s()
+    return age is not None and age <= config.MANDI_MIRROR_MAX_AGE_S
+
+
+def _build(path: str, rows: List[Tuple[Any, ...]]) -> int:
+    tmp = f"{path}.tmp-{os.getpid()}"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.executescript(_SCHEMA)
+        conn.executemany(f"INSERT INTO prices VALUES ({', '.join('?' * 15)})", rows)
+        conn.executescript(_INDEXES)
+        conn.executemany(
+            "INSERT INTO meta VALUES (?, ?)",
+            [("synced_at", datetime.utcnow().isoformat(timespec="seconds")), ("rows", str(len(rows)))],
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp, path)
+    return len(rows)
+
+
+async def sync_once() -> int:
+    """Download the full resource and swap it in. Returns the number of rows mirrored."""
+    # Rows are projected page by page, so raw records never pile up in the worker
+    rows = await fetch_resource(MANDI_RESOURCE_ID, max_rows=config.MANDI_SYNC_MAX_ROWS, project=_row)
+    path = config.MANDI_MIRROR_PATH
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    return await asyncio.to_thread(_build, path, rows)
+
+
+_sync = PeriodicSync("mandi", config.MANDI_MIRROR_PATH, config.MANDI_SYNC_INTERVAL_S, sync_once)
+
+
+async def start_sync() -> None:
+    if config.MANDI_MIRROR_ENABLED and config.DATA_GOV_API_KEY:
+        _sync.start()
+
+
+async def stop_sync() -> None:
+    await _sync.stop()
+
+
+def _distinct(conn: sqlite3.Connection, column: str) -> List[str]:
+    global _distinct_cache
+    path = config.MANDI_MIRROR_PATH
+    stamp = (path, os.path.getmtime(path))
+    if _distinct_cache[0] != stamp:
+        _distinct_cache = (stamp, {})
+    values = _distinct_cache[1].get(column)
+    if values is None:
+        values = [v for (v,) in conn.execute(f"SELECT DISTINCT {column}_k FROM prices WHERE {column}_k IS NOT NULL")]
+        _distinct_cache[1][column] = values
+    return values
+
+
+def _match_keys(conn: sqlite3.Connection, column: str, value: str) -> List[str]:
+    return match_keys(fold(value), _distinct(conn, column), config.MANDI_FUZZY_CUTOFF)
+
+
+def _query(filters: Dict[str, Optional[str]], limit: int, offset: int) -> Dict[str, Any]:
+    conn = sqlite3.connect(f"file:{config.MANDI_MIRROR_PATH}?mode=ro", uri=True)
+    try:
+        where: List[str] = []
+        args: List[Any] = []
+        for column in _KEYED_COLS:
+            value = filters.get(column)
+            if not value:
+                continue
+            keys = _match_keys(conn, column, value)
+            if not keys:
+                return {"mandi_records": [], "total": 0}
+            where.append(f"{column}_k IN ({', '.join('?' * len(keys))})")
+            args.extend(keys)
+        if filters.get("grade"):
+            where.append("grade = ? COLLATE NOCASE")
+            args.append(filters["grade"])
+        clause = f"WHERE {' AND '.join(where)}" if where else ""
+        total = conn.execute(f"SELECT COUNT(*) FROM prices {clause}", args).fetchone()[0]
+        cols = _TEXT_COLS + ("arrival_date",) + _PRICE_COLS
+        rows = conn.execute(
+            f"SELECT {', '.join(cols)} FROM prices {clause} ORDER BY arrival_date DESC, market LIMIT ? OFFSET ?",
+            [*args, limit, offset],
+        ).fetchall()
+    finally:
+        conn.close()
+    # Columns are selected in MandiRecord field order
+    return {"mandi_records": [MandiRecord(*row) for row in rows], "total": total}
+
+
+async def query(
+    filters: Dict[str, Optional[str]], *, limit: int = 10, offset: int = 0
+) -> Optional[Dict[str, Any]]:
+    """Mandi rows matching ``filters`` from the mirror, or None if it is missing or stale."""
+    if not config.MANDI_MIRROR_ENABLED or not is_fresh():
+        return None
+    try:
+        return await asyncio.to_thread(_query, filters, max(1, int(limit)), max(0, int(offset)))
+    except Exception as e:
+        logger.warning("Mandi mirror query failed: %s", e)
+        return None
+
+
+__all__ = ["query", "sync_once", "start_sync", "stop_sync", "is_fresh", "mirror_age_s"]
@@ -0,0 +1,130 @@
+"""Prometheus metrics and per-request stage timings.
+
+Every stage of /response (routing, extraction, geocode, fetchers, embedding,
+vector search, answer LLM, history write) is wrapped in ``stage(...)``. It
+observes a histogram labelled by stage and picked pipeline(s), and, when a
+request opted in via ``start_timings()``, accumulates milliseconds into that
+request's timings dict.
+"""
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, Iterator, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+
+logger = logging.getLogger("metrics")
+
+STAGE_SECONDS = Histogram(
+    "agri_stage_seconds",
+    "Duration of each /response stage",
+    ["stage", "pipeline"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60),
+)
+FETCHER_ERRORS = Counter("agri_fetcher_errors_total", "External fetcher failures", ["fetcher", "pipeline"])
+FALLBACKS = Counter("agri_fallbacks_total", "Fallback paths taken (LLM router, default coords, ...)", ["kind", "pipeline"])
+ANSWER_CACHE = Counter("agri_answer_cache_total", "Semantic answer cache lookups", ["result", "pipeline"])
+UPSTREAM_CACHE = Counter("agri_upstream_cache_total", "Cached upstream data lookups (weather tiles, ...)", ["source", "result"])
+CIRCUIT_STATE = Gauge("agri_circuit_state", "Upstream circuit breaker state (0 closed, 1 half-open, 2 open)", ["upstream"], multiprocess_mode="max")
+HEDGED_REQUESTS = Counter("agri_hedged_requests_total", "Second requests sent to slow upstreams", ["upstream"])
+STALE_SERVED = Counter("agri_stale_served_total", "Fetcher results served from the stale cache after a failure", ["fetcher", "pipeline"])
+SINGLEFLIGHT = Counter("agri_singleflight_total", "Fetcher calls by single-flight outcome (leader, shared_local, shared_remote, result_hit)", ["fetcher", "result"])
+GEOCODE_CACHE = Counter("agri_geocode_cache_total", "Geocode cache outcomes (memory_hit, redis_hit, negative_hit, inflight_shared, miss)", ["result"])
+DEGRADED = Counter("agri_degraded_total", "Stages cut short by the request deadline (extraction, geocode, fetcher:<name>, retrieval)", ["stage", "pipeline"])
+CONTEXT_TOKENS = Counter("agri_context_tokens_total", "Estimated answer-prompt context tokens sent (used) and trimmed by the budget (saved)", ["prompt_key", "kind"])
+
+# Pipeline label for the current request ("-" until routing has picked pipelines)
+_pipeline_label: ContextVar[str] = ContextVar("pipeline_label", default="-")
+# Per-request stage timings in ms; None when the request did not ask for them
+_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("stage_timings", default=None)
+
+
+def set_pipelines(picked_ids: Iterable[str]) -> None:
+    """Label subsequent stage metrics in this request (and tasks it spawns) with the picked pipelines."""
+    _pipeline_label.set("+".join(sorted(picked_ids)) or "-")
+
+
+def start_timings() -> Dict[str, float]:
+    """Begin collecting stage timings for the current request; returns the live dict."""
+    timings: Dict[str, float] = {}
+    _timings.set(timings)
+    return timings
+
+
+def observe(stage_name: str, seconds: float) -> None:
+    STAGE_SECONDS.labels(stage=stage_name, pipeline=_pipeline_label.get()).observe(seconds)
+    timings = _timings.get()
+    if timings is not None:
+        # Stages that repeat within a request (e.g. geocode) accumulate
+        timings[stage_name] = round(timings.get(stage_name, 0.0) + seconds * 1000, 1)
+
+
+@contextmanager
+def stage(stage_name: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage_name, time.perf_counter() - t0)
+
+
+def record_fetcher_error(fetcher: str) -> None:
+    FETCHER_ERRORS.labels(fetcher=fetcher, pipeline=_pipeline_label.get()).inc()
+
+
+def record_fallback(kind: str) -> None:
+    FALLBACKS.labels(kind=kind, pipeline=_pipeline_label.get()).inc()
+
+
+def record_cache(result: str) -> None:
+    ANSWER_CACHE.labels(result=result, pipeline=_pipeline_label.get()).inc()
+
+
+def record_upstream_cache(source: str, result: str) -> None:
+    UPSTREAM_CACHE.labels(source=source, result=result).inc()
+
+
+_CIRCUIT_LEVELS = {"closed": 0, "half_open": 1, "open": 2}
+
+
+def set_circuit_state(upstream: str, state: str) -> None:
+    CIRCUIT_STATE.labels(upstream=upstream).set(_CIRCUIT_LEVELS.get(state, 0))
+
+
+def record_hedge(upstream: str) -> None:
+    HEDGED_REQUESTS.labels(upstream=upstream).inc()
+
+
+def record_stale_served(fetcher: str) -> None:
+    STALE_SERVED.labels(fetcher=fetcher, pipeline=_pipeline_label.get()).inc()
+
+
+def record_singleflight(fetcher: str, result: str) -> None:
+    SINGLEFLIGHT.labels(fetcher=fetcher, result=result).inc()
+
+
+def record_geocode_cache(result: str) -> None:
+    GEOCODE_CACHE.labels(result=result).inc()
+
+
+def record_degraded(stage: str) -> None:
+    DEGRADED.labels(stage=stage, pipeline=_pipeline_label.get()).inc()
+
+
+def record_context_tokens(prompt_key: str, used: int, saved: int) -> None:
+    CONTEXT_TOKENS.labels(prompt_key=prompt_key, kind="used").inc(used)
+    if saved:
+        CONTEXT_TOKENS.labels(prompt_key=prompt_key, kind="saved").inc(saved)
+
+
+def render_latest() -> tuple[bytes, str]:
+    """Exposition payload; aggregates across workers when PROMETHEUS_MULTIPROC_DIR is set."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
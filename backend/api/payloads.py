@@ -0,0 +1,217 @@
+"""Compact typed records for fetcher payloads.
+
+Fetchers project upstream JSON into these slotted dataclasses when they parse
+it, keeping only the fields the answer context and analytics read: OpenWeather's
+current/daily/climate documents shrink to a handful of numbers per day, and
+data.gov.in rows to the price or soil fields we use. Everything downstream
+(external-data summaries, mandi analytics, caches) works on the records.
+
+``dump``/``load`` turn payloads (dicts and lists holding records) into plain
+JSON values and back; records are stored as ``{"@": type, "v": [values]}``.
+The weather tile cache, the stale-result cache and single-flight result sharing
+use them. Bump ``VERSION`` when a record changes so cached payloads of the old
+shape are not read back.
+"""
+from dataclasses import dataclass, fields
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from api.datagov_sync import iso_date
+
+VERSION = 1
+
+
+@dataclass(frozen=True, slots=True)
+class CurrentWeather:
+    temp: Optional[float]
+    humidity: Optional[float]
+    clouds: Optional[float]
+    wind_speed: Optional[float]
+
+
+@dataclass(frozen=True, slots=True)
+class DailyForecast:
+    day: str  # YYYY-MM-DD (UTC)
+    temp_min: Optional[float]
+    temp_max: Optional[float]
+    temp_day: Optional[float]
+    rain_mm: float
+
+
+@dataclass(frozen=True, slots=True)
+class ClimateDay:
+    day: str
+    temp_min: Optional[float]
+    temp_max: Optional[float]
+
+
+@dataclass(frozen=True, slots=True)
+class MandiRecord:
+    state: Optional[str]
+    district: Optional[str]
+    market: Optional[str]
+    commodity: Optional[str]
+    variety: Optional[str]
+    grade: Optional[str]
+    arrival_date: Optional[str]  # YYYY-MM-DD
+    min_price: Optional[float]
+    max_price: Optional[float]
+    modal_price: Optional[float]
+
+
+@dataclass(frozen=True, slots=True)
+class SoilSummary:
+    state: Optional[str]
+    district: str
+    latest_date: str
+    samples: int
+    latest: Optional[float]
+    mean_7d: Optional[float]
+    mean_30d: Optional[float]
+    trend_per_day: Optional[float]
+    seasonal_norm: Optional[float]
+    anomaly: Optional[float]
+
+
+_RECORD_TYPES: Tuple[Type[Any], ...] = (CurrentWeather, DailyForecast, ClimateDay, MandiRecord, SoilSummary)
+_BY_NAME: Dict[str, Type[Any]] = {cls.__name__: cls for cls in _RECORD_TYPES}
+_FIELDS: Dict[Type[Any], Tuple[str, ...]] = {cls: tuple(f.name for f in fields(cls)) for cls in _RECORD_TYPES}
+
+
+def _num(value: Any) -> Optional[float]:
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _text(value: Any) -> Optional[str]:
+    s = str(value).strip() if value is not None else ""
+    return s or None
+
+
+def _day(value: Any) -> Optional[str]:
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, tz=timezone.utc).strftime("%Y-%m-%d")
+    return _text(value)
+
+
+def _entries(data: Any) -> List[Dict[str, Any]]:
+    # Some responses wrap the entries in { city, cnt, list: [...] }
+    if isinstance(data, dict):
+        data = data.get("list", [])
+    return [e for e in data if isinstance(e, dict)] if isinstance(data, list) else []
+
+
+def project_current(data: Any) -> Optional[CurrentWeather]:
+    """OpenWeather current-weather document -> CurrentWeather."""
+    if not isinstance(data, dict):
+        return None
+    main = data.get("main") or {}
+    return CurrentWeather(
+        temp=_num(main.get("temp")),
+        humidity=_num(main.get("humidity")),
+        clouds=_num((data.get("clouds") or {}).get("all")),
+        wind_speed=_num((data.get("wind") or {}).get("speed")),
+    )
+
+
+def project_daily(data: Any) -> List[DailyForecast]:
+    """OpenWeather daily (``temp: {min, max, day}``) or 3-hourly (``main``) forecast -> one record per entry."""
+    out: List[DailyForecast] = []
+    for entry in _entries(data):
+        day = _day(entry.get("dt"))
+        if not day:
+            continue
+        temp = entry.get("temp") if isinstance(entry.get("temp"), dict) else {}
+        main = entry.get("main") or {}
+        rain = entry.get("rain")
+        if isinstance(rain, dict):
+            rain = rain.get("3h", 0)
+        out.append(DailyForecast(
+            day=day,
+            temp_min=_num(temp.get("min", main.get("temp_min"))),
+            temp_max=_num(temp.get("max", main.get("temp_max"))),
+            temp_day=_num(temp.get("day", main.get("temp"))),
+            rain_mm=_num(rain) or 0.0,
+        ))
+    return out
+
+
+def project_climate(data: Any) -> List[ClimateDay]:
+    """OpenWeather 30-day climate forecast -> ClimateDay records (days without temperatures dropped)."""
+    out: List[ClimateDay] = []
+    for entry in _entries(data):
+        day = _day(entry.get("dt") or entry.get("time"))
+        temp = entry.get("temp") or entry.get("main") or {}
+        if not isinstance(temp, dict):
+            continue
+        tmin = _num(temp.get("min", temp.get("temp_min")))
+        tmax = _num(temp.get("max", temp.get("temp_max")))
+        if day and (tmin is not None or tmax is not None):
+            out.append(ClimateDay(day=day, temp_min=tmin, temp_max=tmax))
+    return out
+
+
+def project_mandi(rec: Dict[str, Any]) -> MandiRecord:
+    """data.gov.in mandi price row (any key casing) -> MandiRecord."""
+    def get(*keys: str) -> Any:
+        for k in keys:
+            if rec.get(k) not in (None, ""):
+                return rec[k]
+        return None
+
+    return MandiRecord(
+        state=_text(get("state", "State")),
+        district=_text(get("district", "District")),
+        market=_text(get("market", "Market")),
+        commodity=_text(get("commodity", "Commodity")),
+        variety=_text(get("variety", "Variety")),
+        grade=_text(get("grade", "Grade")),
+        arrival_date=iso_date(get("arrival_date", "Arrival_Date", "date")),
+        min_price=_num(get("min_price", "Min_Price", "min")),
+        max_price=_num(get("max_price", "Max_Price", "max")),
+        modal_price=_num(get("modal_price", "Modal_Price", "modal_price (Rs/quintal)", "modal")),
+    )
+
+
+def dump(value: Any) -> Any:
+    """JSON-safe form of a payload."""
+    cls = type(value)
+    if cls in _FIELDS:
+        return {"@": cls.__name__, "v": [getattr(value, f) for f in _FIELDS[cls]]}
+    if isinstance(value, dict):
+        return {k: dump(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [dump(v) for v in value]
+    return value
+
+
+def load(value: Any) -> Any:
+    """Inverse of ``dump``."""
+    if isinstance(value, dict):
+        cls = _BY_NAME.get(value.get("@")) if "@" in value else None
+        if cls is not None:
+            return cls(*value["v"])
+        return {k: load(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [load(v) for v in value]
+    return value
+
+
+__all__ = [
+    "VERSION",
+    "CurrentWeather",
+    "DailyForecast",
+    "ClimateDay",
+    "MandiRecord",
+    "SoilSummary",
+    "project_current",
+    "project_daily",
+    "project_climate",
+    "project_mandi",
+    "dump",
+    "load",
+]
@@ -10,14 +10,24 @@ import json
 import os
 import logging
 from dataclasses import dataclass
-from typing import List, Optional, Tuple, Dict
+from typing import Any, Awaitable, Callable, List, Optional, Tuple, Dict
 
+import asyncio
+from collections import OrderedDict
+
+import numpy as np
 from langchain.prompts import PromptTemplate
-from api.common import run_chain
-from routers.pipelines.weather import fetch_weather_data
-from routers.pipelines.soil import fetch_soil_data
-from routers.pipelines.mandi import fetch_mandi_data_from_query
-import httpx
+from api import deadline, metrics
+from api.common import arun_chain
+from api.gazetteer import ambiguous_places, canonical_admin, lookup_place
+from api.resilience import upstream_get
+from api.geocode_cache import cached_geocode
+from api.reverse_geocode import reverse_geocode
+from api.query_understanding import QueryUnderstanding, understand_query
+from api.fetcher_registry import PIPELINES_FILE, FetcherDef, fetchers_for, load_pipelines_file
+from routers.pipelines.mandi import mandi_fetch_args
+from routers.pipelines.common import dedupe_fetchers
+from routers.retrieval import get_embeddings
 
 logger = logging.getLogger("pipeline_selector")
 
@@ -27,48 +37,207 @@ class PipelineDef:
     id: str
     description: str
     prompt_key: str
+    examples: Tuple[str, ...] = ()
+    cache_ttl_s: Optional[int] = None
+    fetchers: Tuple[str, ...] = ()
+    needs: Tuple[str, ...] = ("docs", "external")  # "docs" (vector search) and/or "external" (fetchers)
+    retrieval_k: Optional[int] = None
+    score_threshold: Optional[float] = None
+
+
+@dataclass(frozen=True)
+class RetrievalSpec:
+    """Vector search settings for a request; ``score_threshold`` is a 0-1 relevance floor (None = none)."""
+    k: int
+    score_threshold: Optional[float] = None
+
 
+@dataclass
+class FetchPlan:
+    """Planner output: fetchers to run plus the resolved inputs they were built from."""
+    fetchers: List[Tuple]
+    prompt_key: str
+    picked_ids: List[str]
+    lat: Optional[float] = None
+    lon: Optional[float] = None
+    region: Optional[str] = None
+    commodity: Optional[str] = None
+    retrieval: Optional[RetrievalSpec] = None  # None: no picked pipeline needs documents
 
-# Location of the pipelines JSON file
-PIPELINES_FILE = os.getenv(
-    "PIPELINES_FILE",
-    os.path.join(os.path.dirname(__file__), "pipelines.json"),
-)
 
 _PIPELINES_CACHE: Optional[List[PipelineDef]] = None
 
 
+def _pipeline_def(d: dict) -> PipelineDef:
+    retrieval = d.get("retrieval") or {}
+    return PipelineDef(
+        id=str(d.get("id")),
+        description=str(d.get("description", "")),
+        prompt_key=str(d.get("prompt_key")),
+        examples=tuple(str(e) for e in (d.get("examples") or []) if e),
+        cache_ttl_s=int(d["cache_ttl_s"]) if d.get("cache_ttl_s") is not None else None,
+        fetchers=tuple(str(f) for f in (d.get("fetchers") or []) if f),
+        needs=tuple(str(n) for n in d["needs"]) if d.get("needs") is not None else PipelineDef.needs,
+        retrieval_k=int(retrieval["k"]) if retrieval.get("k") is not None else None,
+        score_threshold=float(retrieval["score_threshold"]) if retrieval.get("score_threshold") is not None else None,
+    )
+
+
 def load_pipelines() -> List[PipelineDef]:
     global _PIPELINES_CACHE
     if _PIPELINES_CACHE is not None:
         logger.debug("Pipelines loaded from cache: %d", len(_PIPELINES_CACHE))
         return _PIPELINES_CACHE
 
-    with open(PIPELINES_FILE, "r", encoding="utf-8") as f:
-        data: List[dict] = json.load(f)
-
-    _PIPELINES_CACHE = [
-        PipelineDef(
-            id=str(d.get("id")),
-            description=str(d.get("description", "")),
-            prompt_key=str(d.get("prompt_key")),
-        )
-        for d in data
-        if d.get("id") and d.get("prompt_key")
-    ]
+    data: List[dict] = load_pipelines_file()["pipelines"]
+
+    _PIPELINES_CACHE = [_pipeline_def(d) for d in data if d.get("id") and d.get("prompt_key")]
     logger.info("Loaded %d pipelines from %s", len(_PIPELINES_CACHE), PIPELINES_FILE)
     return _PIPELINES_CACHE
 
 
+def retrieval_for(pipelines: List[PipelineDef]) -> Optional[RetrievalSpec]:
+    """Vector search for the picked pipelines: the deepest ``k`` and loosest threshold among those
+    that need documents (config defaults where undeclared); None when none does."""
+    wanting = [p for p in pipelines if "docs" in p.needs]
+    if not wanting:
+        return None
+    k = max(p.retrieval_k or config.RETRIEVAL_K for p in wanting)
+    thresholds = [
+        p.score_threshold if p.score_threshold is not None else config.RETRIEVAL_SCORE_THRESHOLD
+        for p in wanting
+    ]
+    return RetrievalSpec(k=k, score_threshold=min(thresholds) or None)
+
+
+# Unit-normalised embeddings of every pipeline description/example, plus the owning pipeline id per row
+_PIPELINE_INDEX: Optional[Tuple[np.ndarray, List[str]]] = None
+
+
+def _pipeline_index_texts(pipelines: List[PipelineDef]) -> Tuple[List[str], List[str]]:
+    texts: List[str] = []
+    owners: List[str] = []
+    for p in pipelines:
+        for t in (p.description, *p.examples):
+            if t:
+                texts.append(t)
+                owners.append(p.id)
+    return texts, owners
+
+
 def ensure_pipeline_index() -> None:
-    """No-op for LLM routing; kept for startup compatibility."""
+    """Embed pipeline descriptions and example utterances once for similarity routing.
+
+    Vectors are cached in Redis under ``PIPELINE_INDEX_NAME`` keyed by a hash of the
+    embedding model and texts, so restarts and sibling workers skip re-encoding.
+    """
+    global _PIPELINE_INDEX
     try:
-        _ = load_pipelines()
-        logger.debug("Pipeline index ensured (no-op)")
+        pipelines = load_pipelines()
+        texts, owners = _pipeline_index_texts(pipelines)
+        if not texts:
+            return
+        digest = hashlib.sha1("\n".join([config.EMBEDDING_MODEL, *owners, *texts]).encode("utf-8")).hexdigest()
+        key = f"{config.PIPELINE_INDEX_NAME}:{digest}"
+        vectors: Optional[np.ndarray] = None
+        try:
+            blob = config.redis_client.get(key)
+            if blob:
+                vectors = np.frombuffer(blob, dtype=np.float32).reshape(len(texts), -1)
+                logger.info("Pipeline index loaded from Redis (%d vectors)", len(texts))
+        except Exception as e:
+            logger.warning("Pipeline index Redis read failed: %s", e)
+        if vectors is None:
+            vectors = np.asarray(get_embeddings().embed_documents(texts), dtype=np.float32)
+            try:
+                config.redis_client.set(key, vectors.tobytes())
+            except Exception as e:
+                logger.warning("Pipeline index Redis write failed: %s", e)
+            logger.info("Pipeline index built (%d vectors)", len(texts))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        _PIPELINE_INDEX = (vectors / np.maximum(norms, 1e-12), owners)
     except Exception as e:
         logger.error("Failed to ensure pipeline index: %s", e)
 
 
+# Memo of unit-normalised query embeddings so routing, caching and retrieval share one encode
+_QUERY_VEC_CACHE: "OrderedDict[str, np.ndarray]" = OrderedDict()
+_QUERY_VEC_CACHE_SIZE = 1024
+
+
+def _remember_query_vec(query: str, vec: np.ndarray) -> np.ndarray:
+    vec = np.asarray(vec, dtype=np.float32)
+    vec = vec / max(float(np.linalg.norm(vec)), 1e-12)
+    vec.setflags(write=False)
+    _QUERY_VEC_CACHE[query] = vec
+    _QUERY_VEC_CACHE.move_to_end(query)
+    while len(_QUERY_VEC_CACHE) > _QUERY_VEC_CACHE_SIZE:
+        _QUERY_VEC_CACHE.popitem(last=False)
+    return vec
+
+
+def embed_query(query: str) -> np.ndarray:
+    """Unit-normalised query embedding, memoised so routing and caching share one encode."""
+    vec = _QUERY_VEC_CACHE.get(query)
+    if vec is not None:
+        _QUERY_VEC_CACHE.move_to_end(query)
+        return vec
+    return _remember_query_vec(query, get_embeddings().embed_query(query))
+
+
+def embed_queries(queries: List[str]) -> List[np.ndarray]:
+    """Embed many queries in one batched encoder pass and seed the embed_query memo."""
+    missing = [q for q in dict.fromkeys(queries) if q not in _QUERY_VEC_CACHE]
+    if missing:
+        for q, vec in zip(missing, get_embeddings().embed_documents(missing)):
+            _remember_query_vec(q, vec)
+    return [embed_query(q) for q in queries]
+
+
+async def route_by_embedding(query: str) -> Optional[List[PipelineDef]]:
+    with metrics.stage("route_embedding"):
+        routed = await _route_by_embedding(query)
+    if routed is None and query:
+        metrics.record_fallback("llm_router")
+    return routed
+
+
+async def _route_by_embedding(query: str) -> Optional[List[PipelineDef]]:
+    """Pick pipelines by cosine similarity to their descriptions and examples.
+
+    Every pipeline scoring at least ``ROUTER_MIN_SCORE`` and within ``ROUTER_MARGIN``
+    of the best is returned, best first, so a mixed-intent query ("rain tomorrow
+    and onion price") gets each pipeline it sits close to. Returns None when even
+    the best score is below the minimum; callers then fall back to the LLM router.
+    """
+    if not query:
+        return None
+    if _PIPELINE_INDEX is None:
+        await asyncio.to_thread(ensure_pipeline_index)
+    if _PIPELINE_INDEX is None:
+        return None
+    vectors, owners = _PIPELINE_INDEX
+    try:
+        q = await asyncio.to_thread(embed_query, query)
+    except Exception as e:
+        logger.warning("Query embedding failed for routing: %s", e)
+        return None
+    sims = vectors @ q
+    best: Dict[str, float] = {}
+    for pid, score in zip(owners, sims.tolist()):
+        if score > best.get(pid, -1.0):
+            best[pid] = score
+    ranked = sorted(best.items(), key=lambda kv: kv[1], reverse=True)
+    top_id, top = ranked[0]
+    if top < config.ROUTER_MIN_SCORE:
+        logger.info("Embedding route unsure (top=%s %.3f); deferring to LLM", top_id, top)
+        return None
+    picked = [(pid, score) for pid, score in ranked if score >= config.ROUTER_MIN_SCORE and top - score < config.ROUTER_MARGIN]
+    id_to_def = {p.id: p for p in load_pipelines()}
+    logger.info("Embedding route -> %s", ", ".join(f"{pid} ({score:.3f})" for pid, score in picked))
+    return [id_to_def[pid] for pid, _ in picked]
+
+
 # Removed single-pipeline routing; only multi-routing is supported.
 
 
@@ -85,19 +254,28 @@ def _multi_routing_prompt() -> PromptTemplate:
     )
 
 
-def select_pipelines(query: str) -> List[PipelineDef]:
+async def select_pipelines(query: str) -> List[PipelineDef]:
     pipelines = load_pipelines()
     if not pipelines:
         return []
     if not query:
         return [pipelines[-1]]
+    routed = await route_by_embedding(query)
+    if routed:
+        return routed
     logger.info("Routing multi-pipeline for query: %s", query)
     plist = [
         {"id": p.id, "description": p.description, "prompt_key": p.prompt_key}
         for p in pipelines
     ]
     prompt = _multi_routing_prompt()
-    llm_out = run_chain(prompt, {"pipelines": json.dumps(plist, ensure_ascii=False), "question": query})
+    try:
+        with metrics.stage("route_llm"):
+            llm_out = await arun_chain(prompt, {"pipelines": json.dumps(plist, ensure_ascii=False), "question": query})
+    except Exception as e:
+        logger.warning("Multi-route LLM call failed (%s); using default pipeline", e)
+        metrics.record_fallback("default_pipeline")
+        return [pipelines[0]]
     logger.debug("Multi-route LLM output: %s", llm_out)
     try:
         obj = json.loads(llm_out)
@@ -112,219 +290,316 @@ def select_pipelines(query: str) -> List[PipelineDef]:
         logger.warning("Failed to parse multi-route output; using default pipeline")
     # Fallback to default (first) pipeline without single-route LLM
     logger.info("Fallback selected pipeline: %s", pipelines[0].id)
+    metrics.record_fallback("default_pipeline")
     return [pipelines[0]]
 
 
 # Single-pipeline routing removed.
 
 
-def _latlon_extraction_prompt() -> PromptTemplate:
-    return PromptTemplate(
-        input_variables=["q"],
-        template=(
-            "Extract latitude and longitude from the query if present. Return ONLY JSON:"
-            " {\n  \"lat\": <float or null>,\n  \"lon\": <float or null>\n}\n\nQuery: {q}"
-        ),
-    )
-
-def _region_extraction_prompt() -> PromptTemplate:
-    return PromptTemplate(
-        input_variables=["q"],
-        template=(
-            "If the query mentions a location/region (village, city, district, state, market), "
-            "return ONLY JSON with a single key 'region' as a string; otherwise region=null.\n"
-            "{\n  \"region\": <string or null>\n}\n\nQuery: {q}"
-        ),
-    )
-
-
-def _soil_city_state_prompt() -> PromptTemplate:
-    return PromptTemplate(
-        input_variables=["q"],
-        template=(
-            "Extract the city and state from the user's query if present. "
-            "Return ONLY valid JSON with keys: city, state (title case strings or null).\n"
-            "{\n  \"city\": <string|null>,\n  \"state\": <string|null>\n}\n\nQuery: {q}"
-        ),
-    )
+async def _geocode_region(name: str) -> Tuple[Optional[float], Optional[float]]:
+    """Bundled gazetteer first (no network); then the geocode cache, which calls
+    OpenWeather/Nominatim only for names it has not resolved recently."""
+    place = lookup_place(name)
+    if place is not None:
+        logger.debug("Gazetteer hit %r -> %s (%s, %s)", name, place.name, place.district, place.state)
+        return place.lat, place.lon
+    candidates = ambiguous_places(name)
+    if candidates:
+        # A remote geocoder would just pick one of them; without the state the place is unknown
+        logger.info("Region %r is ambiguous without a state: %s", name, ", ".join(p.state for p in candidates))
+        metrics.record_fallback("ambiguous_region")
+        return None, None
+    with metrics.stage("geocode"):
+        return await deadline.bounded("geocode", cached_geocode(name, _geocode_remote), (None, None))
 
 
-async def _geocode_region(name: str) -> Tuple[Optional[float], Optional[float]]:
+async def _geocode_remote(name: str) -> Tuple[Optional[float], Optional[float]]:
     """Geocode a freeform region string using OpenWeather Geo API first, then Nominatim as fallback."""
     q = (name or "").strip()
     if not q:
         return None, None
+    metrics.record_fallback("geocode_remote")
     # Try OpenWeather direct geocoding
     try:
         if config.OPENWEATHER_API_KEY:
-            async with httpx.AsyncClient(timeout=10) as client:
-                # OWM Geo API: q can be "city,state,country"
-                params = {"q": q, "limit": 1, "appid": config.OPENWEATHER_API_KEY}
-                resp = await client.get("https://api.openweathermap.org/geo/1.0/direct", params=params)
-                if resp.status_code == 200:
-                    arr = resp.json()
-                    if isinstance(arr, list) and arr:
-                        it = arr[0]
-                        lat = it.get("lat")
-                        lon = it.get("lon")
-                        if lat is not None and lon is not None:
-                            return float(lat), float(lon)
-                else:
-                    logger.info("OWM geocode failed: %s", resp.text)
+            # OWM Geo API: q can be "city,state,country"
+            params = {"q": q, "limit": 1, "appid": config.OPENWEATHER_API_KEY}
+            resp = await upstream_get("owm", f"{config.OWM_BASE_URL}/geo/1.0/direct", params=params)
+            if resp.status_code == 200:
+                arr = resp.json()
+                if isinstance(arr, list) and arr:
+                    it = arr[0]
+                    lat = it.get("lat")
+                    lon = it.get("lon")
+                    if lat is not None and lon is not None:
+                        return float(lat), float(lon)
+            else:
+                logger.info("OWM geocode failed: %s", resp.text)
     except Exception as e:
         logger.info("OWM geocode exception: %s", e)
     # Fallback: Nominatim
+    metrics.record_fallback("nominatim")
     try:
-        headers = {"User-Agent": "captial-one-agri-app/1.0"}
         params = {"q": q, "format": "json", "limit": 1}
-        async with httpx.AsyncClient(timeout=10, headers=headers) as client:
-            resp = await client.get("https://nominatim.openstreetmap.org/search", params=params)
-            if resp.status_code == 200:
-                data = resp.json()
-                if isinstance(data, list) and data:
-                    item = data[0]
-                    lat = float(item.get("lat"))
-                    lon = float(item.get("lon"))
-                    return lat, lon
-            else:
-                logger.warning("Nominatim geocode failed: %s", resp.text)
+        resp = await upstream_get("nominatim", f"{config.NOMINATIM_BASE_URL}/search", params=params)
+        if resp.status_code == 200:
+            data = resp.json()
+            if isinstance(data, list) and data:
+                item = data[0]
+                lat = float(item.get("lat"))
+                lon = float(item.get("lon"))
+                return lat, lon
+        else:
+            logger.warning("Nominatim geocode failed: %s", resp.text)
     except Exception as e:
         logger.warning("Nominatim geocode exception: %s", e)
     return None, None
 
 
-async def plan_fetchers(query: str, body_lat: Optional[float] = None, body_lon: Optional[float] = None, body_region: Optional[str] = None) -> Tuple[List[Tuple], str, List[str]]:
+
+# Default point for location pipelines when nothing in the request locates the caller
+_DEFAULT_COORDS = (18.3677, 73.77395)
+
+
+def _coords_in_text(query: str) -> Optional[Tuple[float, float]]:
+    """A "lat, lon" pair written in the query, if any."""
+    import re
+    nums = re.findall(r"[-+]?\d{1,3}(?:\.\d+)?", query or "")
+    if len(nums) < 2:
+        return None
+    try:
+        a = float(nums[0])
+        b = float(nums[1])
+    except ValueError:
+        return None
+    # Heuristic: pick lat in [-90,90], lon in [-180,180]
+    if -90.0 <= a <= 90.0 and -180.0 <= b <= 180.0:
+        return a, b
+    if -90.0 <= b <= 90.0 and -180.0 <= a <= 180.0:
+        return b, a
+    return None
+
+
+def _soil_filters(
+    lat: Optional[float],
+    lon: Optional[float],
+    understanding: Optional[QueryUnderstanding],
+    region: Optional[str],
+) -> Tuple[Optional[str], Optional[str]]:
+    """(state, district) for the soil fetch in data.gov.in spelling.
+
+    Known coordinates are reverse-geocoded; otherwise the city/state the query
+    named (or the region string) is mapped through the gazetteer.
+    """
+    area = reverse_geocode(lat, lon)
+    if area is not None:
+        return area.state, area.district
+    state = understanding.state if understanding else None
+    district = understanding.city if understanding else None
+    if not (state or district) and region:
+        place = lookup_place(region)
+        if place is not None:
+            return place.state, (place.district if place.kind != "state" else None)
+    return canonical_admin(state, district)
+
+async def plan_fetchers(
+    query: str,
+    body_lat: Optional[float] = None,
+    body_lon: Optional[float] = None,
+    body_region: Optional[str] = None,
+    *,
+    inflight: Optional[Dict[tuple, "asyncio.Future"]] = None,
+    on_retrieval: Optional[Callable[[Optional[RetrievalSpec]], None]] = None,
+) -> FetchPlan:
     """Decide which external fetchers to run for the given query.
-    Returns (fetchers, prompt_key, picked_ids)
-    where fetchers is a list of (callable, args_dict).
+    Returns a FetchPlan whose fetchers is a list of (callable, args_dict),
+    along with the prompt key, picked pipeline ids and resolved location/commodity.
+
+    The picked pipelines' fetchers come from pipelines.json, each once. Every
+    fetcher waits only for the inputs it declares (``coords``, ``caller_coords``,
+    ``admin``, ``mandi_filters``, ``question``); each input is resolved once, on
+    first need, so geocoding, query extraction and independent fetchers overlap.
+    A fetcher whose inputs cannot be resolved uses its declared fallback, if any.
+
+    When ``inflight`` is given, each fetcher is started as soon as its inputs are
+    known and the returned entries await those tasks; identical calls already in
+    ``inflight`` are reused. Callers own the tasks and should cancel them if the
+    plan goes unused.
+
+    Only pipelines that declare ``external`` in ``needs`` contribute fetchers.
+    ``on_retrieval`` is called with the picked pipelines' ``retrieval_for`` spec
+    as soon as routing is done, before any input is resolved, so the caller can
+    start the vector search (or skip it) while the fetchers are planned.
     """
-    # Local import to avoid static resolver issues in some environments
+    # Geocoding an explicit body region needs nothing from the LLM; start it right away
+    has_body_coords = body_lat is not None and body_lon is not None
+    body_region = body_region.strip() if isinstance(body_region, str) and body_region.strip() else None
+    has_location = has_body_coords or bool(body_region)
+    body_geocode = asyncio.ensure_future(_geocode_region(body_region)) if body_region and not has_body_coords else None
+    inputs: Dict[str, "asyncio.Future"] = {}
+    coords_source: Optional[str] = None
     try:
-        from routers.pipelines.uv import fetch_uv_data  # type: ignore
-    except Exception:
-        fetch_uv_data = None  # type: ignore
-    picked_defs = select_pipelines(query)
-    picked_ids = [p.id for p in picked_defs]
-
-    # Determine coordinates priority: request body > region geocode > LLM > regex
-    lat = body_lat
-    lon = body_lon
-    source = "body" if (lat is not None and lon is not None) else None
-    extracted_region: Optional[str] = None
-    if source == "body":
-        logger.info("Planner using body coords lat=%s lon=%s", lat, lon)
-    # If body missing, try explicit body_region then region extraction + geocode
-    if lat is None or lon is None:
-        # Prefer body_region if present
-        if body_region and isinstance(body_region, str) and body_region.strip():
-            extracted_region = body_region.strip()
-            lat_g, lon_g = await _geocode_region(body_region)
-            if lat_g is not None and lon_g is not None:
-                lat, lon = lat_g, lon_g
-                source = f"geocode:{body_region}"
-        if lat is None or lon is None:
-            try:
-                raw = run_chain(_region_extraction_prompt(), {"q": query})
-                obj = json.loads(raw)
-                region = obj.get("region") if isinstance(obj, dict) else None
-                if isinstance(region, str) and region.strip():
-                    extracted_region = region.strip()
-                    lat_g, lon_g = await _geocode_region(region)
-                    if lat_g is not None and lon_g is not None:
-                        lat, lon = lat_g, lon_g
-                        source = f"geocode:{region}"
-            except Exception:
-                pass
-    # If still missing, try LLM coord extraction
-    if lat is None or lon is None:
-        try:
-            raw = run_chain(_latlon_extraction_prompt(), {"q": query})
-            obj = json.loads(raw)
-            lat = obj.get("lat")
-            lon = obj.get("lon")
-            source = source or "llm"
-        except Exception:
-            pass
-    if lat is None or lon is None:
-        import re
-        nums = re.findall(r"[-+]?\d{1,3}(?:\.\d+)?", query)
-        if len(nums) >= 2:
-            try:
-                a = float(nums[0])
-                b = float(nums[1])
-                # Heuristic: pick lat in [-90,90], lon in [-180,180]
-                cand = None
-                if -90.0 <= a <= 90.0 and -180.0 <= b <= 180.0:
-                    cand = (a, b)
-                elif -90.0 <= b <= 90.0 and -180.0 <= a <= 180.0:
-                    cand = (b, a)
-                if cand:
-                    lat, lon = cand
-                    source = source or "regex"
-            except Exception:
-                pass
-    # If still missing but a location-based pipeline is selected, use hardcoded defaults
-    needs_coords = any(pid in ("weather_advice", "soil_advice", "uv_advice", "irrigation_advice") for pid in picked_ids)
-    if (lat is None or lon is None) and needs_coords:
-        lat = 18.3677
-        lon = 73.77395
-        source = source or "default"
-    logger.info("Planner coords -> lat=%s lon=%s (source=%s)", lat, lon, source)
-
-    fetchers: List[Tuple] = []
-    added = set()
-    for p in picked_defs:
-        if p.id == "weather_advice" and lat is not None and lon is not None:
-            key = ("weather", float(lat), float(lon))
-            if key not in added:
-                fetchers.append((fetch_weather_data, {"lat": float(lat), "lon": float(lon)}))
-                added.add(key)
-        elif p.id == "soil_advice":
-            # Always extract city/state using LLM
-            city_hint: Optional[str] = None
-            state_hint: Optional[str] = None
-            try:
-                raw = run_chain(_soil_city_state_prompt(), {"q": query})
-                obj = json.loads(raw)
-                if isinstance(obj, dict):
-                    c = obj.get("city")
-                    s = obj.get("state")
-                    city_hint = c.title() if isinstance(c, str) and c else None
-                    state_hint = s.title() if isinstance(s, str) and s else None
-            except Exception:
-                pass
-            key = ("soil", state_hint or "", city_hint or "")
-            if key not in added:
-                fetchers.append((fetch_soil_data, {"state": state_hint, "district": city_hint, "limit": 10, "offset": 0}))
-                added.add(key)
-        elif p.id == "uv_advice" and lat is not None and lon is not None:
-            key = ("uv", float(lat), float(lon))
-            if key not in added:
-                fetchers.append((fetch_uv_data, {"lat": float(lat), "lon": float(lon)}))
-                added.add(key)
-        elif p.id == "mandi_advice":
-            fetchers.append((fetch_mandi_data_from_query, {"question": query}))
-
-    # If irrigation is selected, prefer to fetch both weather and soil if coords exist
-    if "irrigation_advice" in picked_ids and lat is not None and lon is not None:
-        if ("weather", float(lat), float(lon)) not in added:
-            fetchers.append((fetch_weather_data, {"lat": float(lat), "lon": float(lon)}))
-            added.add(("weather", float(lat), float(lon)))
-        if not any(f is fetch_soil_data for f, _ in fetchers):
-            # Try to derive coarse state/district for irrigation too
-            state_hint = None
-            district_hint = None
-            region_src = extracted_region or (body_region if isinstance(body_region, str) else None)
-            if isinstance(region_src, str) and "," in region_src:
-                parts = [s.strip() for s in region_src.split(",") if s.strip()]
-                if len(parts) >= 2:
-                    district_hint = parts[0].title()
-                    state_hint = parts[1].title()
-            fetchers.append((fetch_soil_data, {"state": state_hint, "district": district_hint, "limit": 10, "offset": 0}))
-            added.add(("soil", state_hint or "", district_hint or ""))
+        # Route by embedding similarity when confident; otherwise one LLM call does routing and
+        # extraction together, with the router-only call as a fallback if it fails
+        pipelines = load_pipelines()
+        understanding: Optional[QueryUnderstanding] = None
+        routed = await route_by_embedding(query) if query else None
+        if routed is not None:
+            picked_defs = routed
+        else:
+            if query and pipelines:
+                understanding = await deadline.bounded("extraction", understand_query(query, pipelines))
+            if understanding is not None and understanding.pipeline_ids:
+                id_to_def = {p.id: p for p in pipelines}
+                picked_defs = [id_to_def[i] for i in understanding.pipeline_ids]
+                logger.info("Selected pipelines: %s", ", ".join([p.id for p in picked_defs]))
+            elif deadline.is_degraded("extraction") and pipelines:
+                # No time for a second routing call; the first pipeline is the general fallback
+                picked_defs = pipelines[:1]
+            else:
+                picked_defs = await select_pipelines(query)
+        picked_ids = [p.id for p in picked_defs]
+        metrics.set_pipelines(picked_ids)
+        retrieval = retrieval_for(picked_defs)
+        if on_retrieval is not None:
+            on_retrieval(retrieval)
+        fetcher_defs = fetchers_for([p.fetchers for p in picked_defs if "external" in p.needs])
+        wanted = {name for fdef in fetcher_defs for name in fdef.inputs}
+
+        def need(name: str) -> "asyncio.Future":
+            task = inputs.get(name)
+            if task is None:
+                resolver = resolvers.get(name)
+                if resolver is None:
+                    logger.warning("Planner: unknown fetcher input %r", name)
+                    task = asyncio.get_running_loop().create_future()
+                    task.set_result(None)
+                else:
+                    task = asyncio.ensure_future(resolver())
+                inputs[name] = task
+            return task
+
+        async def resolve_understanding() -> Optional[QueryUnderstanding]:
+            # Routing by embedding extracts nothing; pay for the extraction call only once a fetcher needs it
+            if routed is not None and query:
+                return await deadline.bounded("extraction", understand_query(query, pipelines, route=False))
+            return understanding
+
+        async def understanding_for_location() -> Optional[QueryUnderstanding]:
+            # A request that carries its location needs no extraction for it, but reuses one already running
+            if has_location and "understanding" not in inputs:
+                return None
+            return await need("understanding")
+
+        async def resolve_coords() -> Dict[str, float]:
+            # Priority: request body > body region geocode > understood region geocode > LLM > regex > default
+            nonlocal coords_source
+            if has_body_coords:
+                coords_source = "body"
+                return {"lat": float(body_lat), "lon": float(body_lon)}
+            if body_geocode is not None:
+                lat_g, lon_g = await body_geocode
+                if lat_g is not None and lon_g is not None:
+                    coords_source = f"geocode:{body_region}"
+                    return {"lat": float(lat_g), "lon": float(lon_g)}
+            u = await understanding_for_location()
+            if u is not None and u.region:
+                lat_g, lon_g = await _geocode_region(u.region)
+                if lat_g is not None and lon_g is not None:
+                    coords_source = f"geocode:{u.region}"
+                    return {"lat": float(lat_g), "lon": float(lon_g)}
+            if u is not None and u.lat is not None and u.lon is not None:
+                coords_source = "llm"
+                return {"lat": float(u.lat), "lon": float(u.lon)}
+            found = _coords_in_text(query)
+            if found is not None:
+                coords_source = "regex"
+                return {"lat": found[0], "lon": found[1]}
+            coords_source = "default"
+            metrics.record_fallback("default_coords")
+            return {"lat": _DEFAULT_COORDS[0], "lon": _DEFAULT_COORDS[1]}
+
+        async def resolve_caller_coords() -> Dict[str, float]:
+            # ~1 km is plenty for ranking nearby markets and keeps identical fetches coalescing
+            if has_body_coords:
+                return {"lat": round(float(body_lat), 2), "lon": round(float(body_lon), 2)}
+            if body_geocode is not None:
+                lat_g, lon_g = await body_geocode
+                if lat_g is not None and lon_g is not None:
+                    return {"lat": round(float(lat_g), 2), "lon": round(float(lon_g), 2)}
+            return {}
+
+        async def resolve_admin() -> Dict[str, Optional[str]]:
+            lat, lon = body_lat, body_lon
+            if "coords" in wanted:
+                # Coordinates are being resolved anyway; the hardcoded default point says nothing about the caller
+                coords = await need("coords")
+                if coords_source != "default":
+                    lat, lon = coords["lat"], coords["lon"]
+            u = await understanding_for_location()
+            state, district = _soil_filters(lat, lon, u, body_region or (u.region if u else None))
+            return {"state": state, "district": district}
+
+        async def resolve_mandi_filters() -> Optional[Dict[str, Any]]:
+            u = await need("understanding")
+            if u is None:
+                return None
+            args = mandi_fetch_args(u.mandi_filters)
+            args["state"], args["district"] = canonical_admin(args["state"], args["district"])
+            if not args["state"]:
+                area = reverse_geocode(body_lat, body_lon)
+                args["state"] = area.state if area is not None else None
+            return args
+
+        async def resolve_question() -> Dict[str, str]:
+            return {"question": query}
+
+        resolvers: Dict[str, Callable[[], Awaitable[Any]]] = {
+            "understanding": resolve_understanding,
+            "coords": resolve_coords,
+            "caller_coords": resolve_caller_coords,
+            "admin": resolve_admin,
+            "mandi_filters": resolve_mandi_filters,
+            "question": resolve_question,
+        }
+
+        async def schedule(fdef: FetcherDef) -> Optional[Tuple]:
+            candidate: Optional[FetcherDef] = fdef
+            while candidate is not None:
+                resolved = await asyncio.gather(*(need(name) for name in candidate.inputs))
+                if all(r is not None for r in resolved):
+                    args = dict(candidate.args)
+                    for r in resolved:
+                        args.update(r)
+                    entry = (candidate.resolve(), args)
+                    return entry if inflight is None else dedupe_fetchers([entry], inflight)[0]
+                candidate = candidate.fallback
+            logger.info("Planner: skipping fetcher %s (inputs unavailable)", fdef.name)
+            return None
+
+        scheduled = await asyncio.gather(*(schedule(fdef) for fdef in fetcher_defs))
+        fetchers: List[Tuple] = [entry for entry in scheduled if entry is not None]
+
+        if "coords" in inputs:
+            coords = inputs["coords"].result()
+            lat, lon = coords["lat"], coords["lon"]
+        elif has_body_coords:
+            lat, lon = body_lat, body_lon
+        elif understanding is not None and understanding.lat is not None:
+            lat, lon = understanding.lat, understanding.lon
+        else:
+            lat = lon = None
+        if "understanding" in inputs:
+            understanding = inputs["understanding"].result()
+        logger.info("Planner coords -> lat=%s lon=%s (source=%s)", lat, lon, coords_source)
+    finally:
+        for task in [body_geocode, *inputs.values()]:
+            if task is not None and not task.done():
+                task.cancel()
 
     if not fetchers:
-        logger.warning("Planner: no fetchers added (coords missing=%s or pipelines only-doc)", lat is None or lon is None)
+        logger.warning("Planner: no fetchers added (pipelines only-doc or inputs unavailable)")
 
     # Prompt key: prefer irrigation if irrigation pipeline is selected or both weather+soil are needed; otherwise from first picked weather/soil
     has_weather = "weather_advice" in picked_ids
@@ -333,4 +608,14 @@ async def plan_fetchers(query: str, body_lat: Optional[float] = None, body_lon:
     if ("irrigation_advice" in picked_ids) or (has_weather and has_soil):
         prompt_key = "irrigation"
     logger.info("Planner picked=%s prompt_key=%s fetchers=%d", ",".join(picked_ids), prompt_key, len(fetchers))
-    return fetchers, prompt_key, picked_ids
+    commodity = understanding.mandi_filters.get("commodity") if understanding else None
+    return FetchPlan(
+        fetchers=fetchers,
+        prompt_key=prompt_key,
+        picked_ids=picked_ids,
+        lat=float(lat) if lat is not None else None,
+        lon=float(lon) if lon is not None else None,
+        region=body_region or (understanding.region if understanding else None),
+        commodity=commodity if isinstance(commodity, str) and commodity.strip() else None,
+        retrieval=retrieval,
+    )
@@ -0,0 +1,173 @@
+"""Single-pass query understanding.
+
+One LLM call returns everything the planner needs: pipeline ids, region,
+explicit coordinates, city/state and mandi filters. This replaces the separate
+routing, region, lat/lon, soil city/state and mandi extraction prompts.
+"""
+import json
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain.prompts import PromptTemplate
+
+from api import metrics
+from api.common import arun_chain
+from routers.pipelines.mandi import normalize_mandi_filters
+
+logger = logging.getLogger("query_understanding")
+
+_EMPTY_VALUES = {"", "not specified", "na", "n/a", "none", "null", "-", "unknown"}
+
+
+@dataclass
+class QueryUnderstanding:
+    pipeline_ids: List[str] = field(default_factory=list)
+    region: Optional[str] = None
+    lat: Optional[float] = None
+    lon: Optional[float] = None
+    city: Optional[str] = None
+    state: Optional[str] = None
+    mandi_filters: Dict[str, Any] = field(default_factory=dict)
+    reason: str = ""
+
+
+def _understanding_prompt(route: bool = True) -> PromptTemplate:
+    """Build the understanding prompt; with ``route=False`` pipelines are already chosen
+    and only extraction is requested."""
+    if route:
+        task = (
+            "Given pipelines (id, description, prompt_key), choose ALL that are relevant and extract "
+            "location and market details mentioned in the query.\n"
+        )
+        ids_field = "  \"pipeline_ids\": [\"id1\", \"id2\"],\n  \"reason\": \"short rationale\",\n"
+        pipelines_section = "Pipelines:\n{pipelines}\n\n"
+    else:
+        task = "Extract location and market details mentioned in the query.\n"
+        ids_field = ""
+        pipelines_section = ""
+    return PromptTemplate(
+        input_variables=["pipelines", "question"] if route else ["question"],
+        template=(
+            "You analyse a farmer's query for an Indian agriculture assistant.\n"
+            + task
+            + "Return ONLY JSON of the form:\n"
+            "{{\n"
+            + ids_field
+            + "  \"region\": <place mentioned (village, city, district, state, market) as a string or null>,\n"
+            "  \"lat\": <float or null>,\n"
+            "  \"lon\": <float or null>,\n"
+            "  \"city\": <city or district in title case or null>,\n"
+            "  \"state\": <Indian state in title case or null>,\n"
+            "  \"mandi\": {{\"state\": <string|null>, \"district\": <string|null>, \"market\": <string|null>, "
+            "\"commodity\": <string|null>, \"variety\": <string|null>, \"grade\": <string|null>, "
+            "\"limit\": <int|null>, \"offset\": <int|null>}}\n"
+            "}}\n"
+            "Use null for anything not present in the query; do not guess coordinates. Do not add explanations.\n\n"
+            + pipelines_section
+            + "Query:\n{question}"
+        ),
+    )
+
+
+def _parse_json_object(raw: str) -> Optional[dict]:
+    """Parse the first JSON object in an LLM reply, tolerating code fences and chatter."""
+    if not isinstance(raw, str):
+        return None
+    text = raw.strip()
+    try:
+        obj = json.loads(text)
+        return obj if isinstance(obj, dict) else None
+    except Exception:
+        pass
+    m = re.search(r"\{.*\}", text, re.DOTALL)
+    if not m:
+        return None
+    try:
+        obj = json.loads(m.group(0))
+        return obj if isinstance(obj, dict) else None
+    except Exception:
+        return None
+
+
+def _clean_str(v: Any) -> Optional[str]:
+    if not isinstance(v, str):
+        return None
+    s = v.strip()
+    if s.lower() in _EMPTY_VALUES:
+        return None
+    return s
+
+
+def _clean_float(v: Any, lo: float, hi: float) -> Optional[float]:
+    try:
+        f = float(v)
+    except (TypeError, ValueError):
+        return None
+    return f if lo <= f <= hi else None
+
+
+def validate_understanding(obj: dict, valid_ids: Sequence[str]) -> QueryUnderstanding:
+    """Coerce a raw understanding object into a QueryUnderstanding, dropping invalid fields."""
+    ids = obj.get("pipeline_ids") or []
+    if isinstance(ids, str):
+        ids = [ids]
+    known = set(valid_ids)
+    picked: List[str] = []
+    for i in ids if isinstance(ids, list) else []:
+        if isinstance(i, str) and i in known and i not in picked:
+            picked.append(i)
+
+    lat = _clean_float(obj.get("lat"), -90.0, 90.0)
+    lon = _clean_float(obj.get("lon"), -180.0, 180.0)
+    if lat is None or lon is None:
+        lat = lon = None
+
+    city = _clean_str(obj.get("city"))
+    state = _clean_str(obj.get("state"))
+    mandi = normalize_mandi_filters(obj.get("mandi") or {})
+    return QueryUnderstanding(
+        pipeline_ids=picked,
+        region=_clean_str(obj.get("region")),
+        lat=lat,
+        lon=lon,
+        city=city.title() if city else None,
+        state=state.title() if state else None,
+        mandi_filters=mandi,
+        reason=_clean_str(obj.get("reason")) or "",
+    )
+
+
+async def understand_query(query: str, pipelines: Sequence[Any], *, route: bool = True) -> Optional[QueryUnderstanding]:
+    """Run the single understanding LLM call. Returns None when the call or its parsing fails.
+
+    With ``route=False`` the caller has already picked pipelines (e.g. by embedding
+    similarity) and the returned ``pipeline_ids`` is left empty.
+    """
+    inputs = {"question": query}
+    if route:
+        plist = [
+            {"id": p.id, "description": p.description, "prompt_key": p.prompt_key}
+            for p in pipelines
+        ]
+        inputs["pipelines"] = json.dumps(plist, ensure_ascii=False)
+    try:
+        with metrics.stage("extract_understanding"):
+            raw = await arun_chain(_understanding_prompt(route), inputs)
+    except Exception as e:
+        logger.warning("Query understanding LLM call failed: %s", e)
+        metrics.record_fallback("understanding_failed")
+        return None
+    logger.debug("Query understanding LLM output: %s", raw)
+    obj = _parse_json_object(raw)
+    if obj is None:
+        logger.warning("Failed to parse query understanding output")
+        metrics.record_fallback("understanding_failed")
+        return None
+    qu = validate_understanding(obj, [p.id for p in pipelines] if route else [])
+    logger.info(
+        "Understood query: pipelines=%s region=%s lat=%s lon=%s city=%s state=%s commodity=%s",
+        ",".join(qu.pipeline_ids), qu.region, qu.lat, qu.lon, qu.city, qu.state, qu.mandi_filters.get("commodity"),
+    )
+    return qu
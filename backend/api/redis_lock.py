@@ -0,0 +1,30 @@
+"""Owner-checked Redis locks.
+
+A lock is a key set with NX and an expiry, holding a random ``new_token()``.
+``release`` deletes it only while it still holds that token, in one server-side
+script: a holder whose lease expired must not delete the lock another worker
+has taken since. Used by single-flight fetches and the mirror syncs.
+"""
+import secrets
+from typing import Any
+
+# Delete the lock only while it still holds our token; it may have expired and been taken by another worker
+_RELEASE_LOCK = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+def new_token() -> str:
+    """Lock value unique across workers, hosts and containers."""
+    return secrets.token_hex(16)
+
+
+async def release(r: Any, key: str, token: str) -> bool:
+    """Delete ``key`` if it still holds ``token``; True when it was released."""
+    return bool(await r.eval(_RELEASE_LOCK, 1, key, token))
+
+
+__all__ = ["new_token", "release"]
@@ -0,0 +1,247 @@
+"""Circuit breakers and hedged requests for the external upstreams.
+
+Fetchers call ``upstream_get("owm" | "datagov" | "nominatim", url, params=...)``
+instead of using the pooled client directly:
+
+- Each upstream has a breaker. ``BREAKER_FAILURE_THRESHOLD`` consecutive failures
+  (connection errors, timeouts, 5xx, 429) open it; while open, calls fail at once
+  with ``CircuitOpenError`` instead of waiting for the timeout. After
+  ``BREAKER_RESET_S`` one probe request is let through (half-open); its outcome
+  closes or re-opens the breaker.
+- When an upstream allows hedging, a GET still running after the
+  ``HEDGE_PERCENTILE`` of its recent latencies gets a second identical request;
+  the first successful response wins and the other is cancelled.
+
+Breakers are per worker. Their state is exported as ``agri_circuit_state{upstream}``
+and returned by ``breaker_states()`` (``GET /upstreams``).
+
+``remember_result``/``load_stale`` keep the last good result of every fetcher
+call in Redis for ``STALE_CACHE_TTL_S``; ``run_fetcher`` serves it when a fetch
+fails, which is what callers get while a circuit is open.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+import httpx
+
+from api import metrics, payloads
+from api.http_clients import get_client, upstream_names, upstream_settings
+from config import config
+
+logger = logging.getLogger("resilience")
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling an upstream whose breaker is open."""
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int, reset_s: float) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_s = reset_s
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        metrics.set_circuit_state(name, CLOSED)
+
+    def _set(self, state: str) -> None:
+        if state != self.state:
+            logger.warning("Circuit %s: %s -> %s", self.name, self.state, state)
+            self.state = state
+            metrics.set_circuit_state(self.name, state)
+
+    def before_call(self) -> bool:
+        """Admit a call or raise CircuitOpenError. Returns True when the call is the half-open probe."""
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_s:
+            self._set(HALF_OPEN)
+        if self.state == CLOSED:
+            return False
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        raise CircuitOpenError(f"{self.name} circuit is {self.state}")
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._probing = False
+        self._set(CLOSED)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._set(OPEN)
+
+    def abandon_probe(self) -> None:
+        # The probe was cancelled by its caller; let the next call probe instead
+        self._probing = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"state": self.state, "consecutive_failures": self.failures}
+        if self.state == OPEN:
+            out["retry_in_s"] = round(max(0.0, self.reset_s - (time.monotonic() - self.opened_at)), 1)
+        return out
+
+
+class LatencyWindow:
+    """Recent successful latencies of one upstream; source of the hedge delay."""
+
+    def __init__(self, size: int) -> None:
+        self._samples: Deque[float] = deque(maxlen=size)
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def hedge_delay(self) -> Optional[float]:
+        if len(self._samples) < config.HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._samples)
+        idx = min(len(ordered) - 1, int(config.HEDGE_PERCENTILE * len(ordered)))
+        return max(ordered[idx], config.HEDGE_MIN_DELAY_MS / 1000.0)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+_BREAKERS: Dict[str, CircuitBreaker] = {}
+_LATENCY: Dict[str, LatencyWindow] = {}
+
+
+def _breaker(upstream: str) -> CircuitBreaker:
+    b = _BREAKERS.get(upstream)
+    if b is None:
+        b = _BREAKERS[upstream] = CircuitBreaker(upstream, config.BREAKER_FAILURE_THRESHOLD, config.BREAKER_RESET_S)
+    return b
+
+
+def _latency(upstream: str) -> LatencyWindow:
+    w = _LATENCY.get(upstream)
+    if w is None:
+        w = _LATENCY[upstream] = LatencyWindow(config.HEDGE_WINDOW)
+    return w
+
+
+def _is_failure(resp: httpx.Response) -> bool:
+    return resp.status_code >= 500 or resp.status_code == 429
+
+
+async def _hedged_get(upstream: str, url: str, kwargs: Dict[str, Any], delay: Optional[float]) -> httpx.Response:
+    client = get_client(upstream)
+    first = asyncio.ensure_future(client.get(url, **kwargs))
+    tasks = [first]
+    try:
+        if delay is None:
+            return await first
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            metrics.record_hedge(upstream)
+            tasks.append(asyncio.ensure_future(client.get(url, **kwargs)))
+        # First good response wins; a 5xx/429 is only returned if nothing better arrives
+        pending = set(tasks)
+        last_resp: Optional[httpx.Response] = None
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                if t.exception() is not None:
+                    error = t.exception()
+                    continue
+                if not _is_failure(t.result()):
+                    return t.result()
+                last_resp = t.result()
+        if last_resp is not None:
+            return last_resp
+        raise error
+    finally:
+        for t in tasks:
+            if not t.done():
+                t.cancel()
+
+
+async def upstream_get(upstream: str, url: str, **kwargs: Any) -> httpx.Response:
+    """GET through the upstream's breaker (and hedging, where allowed). Raises CircuitOpenError when open."""
+    breaker = _breaker(upstream)
+    probe = breaker.before_call()
+    window = _latency(upstream)
+    hedge = config.HEDGE_ENABLED and upstream_settings(upstream).hedge and not probe
+    t0 = time.perf_counter()
+    try:
+        resp = await _hedged_get(upstream, url, kwargs, window.hedge_delay() if hedge else None)
+    except asyncio.CancelledError:
+        if probe:
+            breaker.abandon_probe()
+        raise
+    except Exception:
+        breaker.record_failure()
+        raise
+    if _is_failure(resp):
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+        window.add(time.perf_counter() - t0)
+    return resp
+
+
+def breaker_states() -> Dict[str, Dict[str, Any]]:
+    """Per-upstream breaker state and recent latency, for the status endpoint."""
+    out = {}
+    for name in upstream_names():
+        info = _breaker(name).snapshot()
+        window = _latency(name)
+        for label, q in (("p50_ms", 0.5), ("p95_ms", 0.95)):
+            v = window.percentile(q)
+            info[label] = round(v * 1000, 1) if v is not None else None
+        hedge_delay = window.hedge_delay()
+        info["hedge_after_ms"] = round(hedge_delay * 1000, 1) if hedge_delay is not None and upstream_settings(name).hedge else None
+        out[name] = info
+    return out
+
+
+def _stale_key(call_key: str) -> str:
+    return f"{config.STALE_CACHE_PREFIX}:{hashlib.sha1(call_key.encode('utf-8')).hexdigest()[:24]}"
+
+
+async def remember_result(call_key: str, result: Any, ttl_s: Optional[int] = None) -> None:
+    """Keep the last good result of a fetcher call for ``load_stale`` (``ttl_s`` defaults to ``STALE_CACHE_TTL_S``)."""
+    if not isinstance(result, dict):
+        return
+    try:
+        entry = {"at": int(time.time()), "v": payloads.VERSION, "data": payloads.dump(result)}
+        payload = json.dumps(entry, default=str).encode("utf-8")
+        await config.aredis_client.set(_stale_key(call_key), payload, ex=ttl_s or config.STALE_CACHE_TTL_S)
+    except Exception as e:
+        logger.debug("Stale cache write failed: %s", e)
+
+
+async def load_stale(call_key: str) -> Optional[Dict[str, Any]]:
+    """Last good result of a fetcher call, with ``stale_age_s`` added, or None."""
+    try:
+        raw = await config.aredis_client.get(_stale_key(call_key))
+    except Exception as e:
+        logger.debug("Stale cache read failed: %s", e)
+        return None
+    if raw is None:
+        return None
+    entry = json.loads(raw)
+    if entry.get("v") != payloads.VERSION:
+        # Written before the payload records last changed shape
+        return None
+    data = dict(payloads.load(entry.get("data")) or {})
+    data["stale_age_s"] = max(0, int(time.time()) - int(entry.get("at") or 0))
+    return data
+
+
+__all__ = ["CircuitOpenError", "CircuitBreaker", "upstream_get", "breaker_states", "remember_result", "load_stale"]
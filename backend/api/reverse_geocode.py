@@ -0,0 +1,195 @@
+"""Coordinates -> canonical state/district for the data.gov.in filters.
+
+With ``DISTRICT_BOUNDARIES_PATH`` set to a GeoJSON FeatureCollection of district
+polygons (Polygon/MultiPolygon; state and district names in common property
+keys such as ST_NM/DISTRICT, NAME_1/NAME_2), points are located by a grid index
+over simplified polygons followed by an exact ray-casting test. Polygon names are
+mapped to the gazetteer spellings so they match data.gov.in filters.
+
+Without a boundary file, or for points outside every polygon, the nearest
+gazetteer place within ``REVERSE_GEOCODE_MAX_KM`` supplies the district. No
+boundary file ships with the repo, so out of the box every lookup takes this
+nearest-place path: a point near a district border can get the neighbouring
+district, and a point farther than the limit from every gazetteer place gets none.
+"""
+import json
+import logging
+import math
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from api import metrics
+from api.gazetteer import canonical_admin, get_gazetteer
+from config import config
+
+logger = logging.getLogger("reverse_geocode")
+
+_STATE_KEYS = ("ST_NM", "st_nm", "STATE", "state", "State", "state_name", "NAME_1")
+_DISTRICT_KEYS = ("DISTRICT", "district", "District", "dtname", "DTNAME", "district_name", "NAME_2")
+
+
+@dataclass(frozen=True)
+class AdminArea:
+    state: str
+    district: Optional[str]
+    source: str  # "polygon" or "nearest"
+
+
+def _simplify(ring: np.ndarray, tol: float) -> np.ndarray:
+    """Radial-distance simplification: drop vertices closer than ``tol`` degrees to the last kept one."""
+    if tol <= 0 or len(ring) <= 8:
+        return ring
+    keep = [0]
+    last = ring[0]
+    for i in range(1, len(ring) - 1):
+        if abs(ring[i, 0] - last[0]) > tol or abs(ring[i, 1] - last[1]) > tol:
+            keep.append(i)
+            last = ring[i]
+    keep.append(len(ring) - 1)
+    return ring[keep] if len(keep) >= 4 else ring
+
+
+def _in_ring(x: float, y: float, ring: np.ndarray) -> bool:
+    xs, ys = ring[:, 0], ring[:, 1]
+    xj, yj = np.roll(xs, 1), np.roll(ys, 1)
+    crosses = (ys > y) != (yj > y)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_at = (xj - xs) * (y - ys) / (yj - ys) + xs
+    return bool(np.count_nonzero(crosses & (x < x_at)) % 2)
+
+
+class PolygonIndex:
+    """Uniform lat/lon grid -> candidate polygons; exact test only on those candidates."""
+
+    def __init__(self, features: List[dict], cell_deg: float, simplify_deg: float) -> None:
+        self._cell = cell_deg
+        self._areas: List[Tuple[str, Optional[str]]] = []
+        # Per area: list of polygons, each (outer ring, [holes]) as (n, 2) lon/lat arrays
+        self._polys: List[List[Tuple[np.ndarray, List[np.ndarray]]]] = []
+        self._bboxes: List[Tuple[float, float, float, float]] = []
+        self._grid: Dict[Tuple[int, int], List[int]] = {}
+        for feat in features:
+            geom = feat.get("geometry") or {}
+            props = feat.get("properties") or {}
+            state = next((str(props[k]) for k in _STATE_KEYS if props.get(k)), None)
+            district = next((str(props[k]) for k in _DISTRICT_KEYS if props.get(k)), None)
+            if not state and not district:
+                continue
+            if geom.get("type") == "Polygon":
+                polygons = [geom.get("coordinates") or []]
+            elif geom.get("type") == "MultiPolygon":
+                polygons = geom.get("coordinates") or []
+            else:
+                continue
+            parts = []
+            for rings in polygons:
+                arrs = [_simplify(np.asarray(r, dtype=np.float64)[:, :2], simplify_deg) for r in rings if len(r) >= 4]
+                if arrs:
+                    parts.append((arrs[0], arrs[1:]))
+            if not parts:
+                continue
+            allpts = np.vstack([outer for outer, _ in parts])
+            bbox = (float(allpts[:, 1].min()), float(allpts[:, 0].min()), float(allpts[:, 1].max()), float(allpts[:, 0].max()))
+            idx = len(self._areas)
+            self._areas.append(canonical_admin(state, district))
+            self._polys.append(parts)
+            self._bboxes.append(bbox)
+            for ci in range(self._cell_of(bbox[0]), self._cell_of(bbox[2]) + 1):
+                for cj in range(self._cell_of(bbox[1]), self._cell_of(bbox[3]) + 1):
+                    self._grid.setdefault((ci, cj), []).append(idx)
+
+    def __len__(self) -> int:
+        return len(self._areas)
+
+    def _cell_of(self, deg: float) -> int:
+        return int(math.floor(deg / self._cell))
+
+    def locate(self, lat: float, lon: float) -> Optional[Tuple[str, Optional[str]]]:
+        for idx in self._grid.get((self._cell_of(lat), self._cell_of(lon)), ()):
+            s, w, n, e = self._bboxes[idx]
+            if not (s <= lat <= n and w <= lon <= e):
+                continue
+            for outer, holes in self._polys[idx]:
+                if _in_ring(lon, lat, outer) and not any(_in_ring(lon, lat, h) for h in holes):
+                    return self._areas[idx]
+        return None
+
+
+_POLYGON_INDEX: Optional[PolygonIndex] = None
+_POLYGON_INDEX_LOADED = False
+_NEAREST: Optional[Tuple[np.ndarray, np.ndarray, List[Tuple[str, str]]]] = None
+
+
+def get_polygon_index() -> Optional[PolygonIndex]:
+    global _POLYGON_INDEX, _POLYGON_INDEX_LOADED
+    if not _POLYGON_INDEX_LOADED:
+        _POLYGON_INDEX_LOADED = True
+        path = config.DISTRICT_BOUNDARIES_PATH
+        if path:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                _POLYGON_INDEX = PolygonIndex(
+                    data.get("features") or [],
+                    cell_deg=config.REVERSE_GEOCODE_GRID_DEG,
+                    simplify_deg=config.REVERSE_GEOCODE_SIMPLIFY_DEG,
+                )
+                logger.info("District polygon index loaded: %d districts from %s", len(_POLYGON_INDEX), path)
+            except Exception as e:
+                logger.warning("District boundaries not loaded from %s: %s", path, e)
+    return _POLYGON_INDEX
+
+
+def _nearest(lat: float, lon: float) -> Optional[Tuple[str, str]]:
+    global _NEAREST
+    if _NEAREST is None:
+        lats, lons, areas = get_gazetteer().admin_points()
+        _NEAREST = (np.radians(np.asarray(lats, dtype=np.float64)), np.radians(np.asarray(lons, dtype=np.float64)), areas)
+    lats_r, lons_r, areas = _NEAREST
+    if not areas:
+        return None
+    # Equirectangular distance is accurate enough at district scale
+    la, lo = math.radians(lat), math.radians(lon)
+    x = (lons_r - lo) * math.cos(la)
+    y = lats_r - la
+    d2 = x * x + y * y
+    best = int(np.argmin(d2))
+    if math.sqrt(float(d2[best])) * 6371.0 > config.REVERSE_GEOCODE_MAX_KM:
+        return None
+    return areas[best]
+
+
+@lru_cache(maxsize=4096)
+def _reverse_rounded(lat: float, lon: float) -> Optional[AdminArea]:
+    index = get_polygon_index()
+    if index is not None:
+        hit = index.locate(lat, lon)
+        if hit is not None and hit[0]:
+            return AdminArea(hit[0], hit[1], "polygon")
+    near = _nearest(lat, lon)
+    if near is not None:
+        return AdminArea(near[0], near[1], "nearest")
+    return None
+
+
+def reverse_geocode(lat: Optional[float], lon: Optional[float]) -> Optional[AdminArea]:
+    """State/district (data.gov.in spellings) containing the point, or None if unknown."""
+    if lat is None or lon is None:
+        return None
+    try:
+        lat_f, lon_f = float(lat), float(lon)
+    except (TypeError, ValueError):
+        return None
+    if not (-90.0 <= lat_f <= 90.0 and -180.0 <= lon_f <= 180.0):
+        return None
+    # ~100 m grid keeps the memo useful for callers reporting GPS fixes
+    area = _reverse_rounded(round(lat_f, 3), round(lon_f, 3))
+    if area is not None and area.source == "nearest":
+        metrics.record_fallback("reverse_nearest")
+    return area
+
+
+__all__ = ["AdminArea", "PolygonIndex", "reverse_geocode", "get_polygon_index"]
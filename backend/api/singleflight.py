@@ -0,0 +1,125 @@
+"""Single-flight coalescing of identical fetcher calls, within and across workers.
+
+``coalesce(name, args, call)`` keys a call on the fetcher name plus normalised
+arguments (None dropped, strings case-folded, floats rounded to 4 decimals).
+Within a worker, concurrent callers with the same key await one shared future.
+Across workers, the first caller takes a short Redis lock (``sf:lock:{hash}``)
+and publishes its result under ``sf:result:{hash}`` for
+``SINGLEFLIGHT_RESULT_TTL_S``; callers elsewhere wait for that result instead of
+calling the upstream, and run the call themselves if the lock holder gives up
+without one. Outcomes are counted in ``agri_singleflight_total{fetcher,result}``.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from api import metrics, payloads, redis_lock
+from config import config
+
+logger = logging.getLogger("singleflight")
+
+_INFLIGHT: Dict[str, "asyncio.Future[Any]"] = {}
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in sorted(value.items(), key=lambda kv: str(kv[0])) if v is not None}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, str):
+        return value.strip().casefold()
+    if isinstance(value, float):
+        return round(value, 4)
+    return value
+
+
+def call_key(name: str, args: Dict[str, Any]) -> str:
+    """Stable key for a fetcher call; equal for calls that would fetch the same data."""
+    payload = json.dumps(_normalize(args), sort_keys=True, default=str)
+    return f"{name}:{hashlib.sha1(payload.encode('utf-8')).hexdigest()[:24]}"
+
+
+async def _remote_result(r: Any, result_key: str) -> Optional[Any]:
+    raw = await r.get(result_key)
+    return payloads.load(json.loads(raw)) if raw is not None else None
+
+
+async def _run_shared(name: str, key: str, call: Callable[[], Awaitable[Any]]) -> Any:
+    """Leader for this worker: reuse another worker's result, wait for its call, or make the call."""
+    r = config.aredis_client
+    lock_key, result_key = f"sf:lock:{key}", f"sf:result:{key}"
+    try:
+        hit = await _remote_result(r, result_key)
+        if hit is not None:
+            metrics.record_singleflight(name, "result_hit")
+            return hit
+        token = redis_lock.new_token()
+        leader = await r.set(lock_key, token, nx=True, px=config.SINGLEFLIGHT_LOCK_MS)
+    except Exception as e:
+        logger.debug("Single-flight Redis unavailable (%s); calling directly", e)
+        metrics.record_singleflight(name, "leader")
+        return await call()
+
+    if not leader:
+        # Another worker is fetching: poll for its result until the lock goes away
+        deadline = time.monotonic() + config.SINGLEFLIGHT_LOCK_MS / 1000.0
+        delay = 0.01
+        try:
+            while time.monotonic() < deadline:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 0.1)
+                hit = await _remote_result(r, result_key)
+                if hit is not None:
+                    metrics.record_singleflight(name, "shared_remote")
+                    return hit
+                if not await r.exists(lock_key):
+                    break
+        except Exception as e:
+            logger.debug("Single-flight wait failed: %s", e)
+        # The other worker failed or timed out; fetch here
+        metrics.record_singleflight(name, "leader")
+        return await call()
+
+    metrics.record_singleflight(name, "leader")
+    try:
+        result = await call()
+        try:
+            payload = json.dumps(payloads.dump(result), default=str).encode("utf-8")
+            await r.set(result_key, payload, ex=config.SINGLEFLIGHT_RESULT_TTL_S)
+        except Exception as e:
+            logger.debug("Single-flight result not shared: %s", e)
+        return result
+    finally:
+        try:
+            await redis_lock.release(r, lock_key, token)
+        except Exception as e:
+            logger.debug("Single-flight lock not released (expires with its lease): %s", e)
+
+
+def _done(key: str, fut: "asyncio.Future[Any]") -> None:
+    _INFLIGHT.pop(key, None)
+    # Mark the error retrieved even if every waiter was cancelled
+    if not fut.cancelled():
+        fut.exception()
+
+
+async def coalesce(name: str, args: Dict[str, Any], call: Callable[[], Awaitable[Any]]) -> Any:
+    """Run ``call`` once for all concurrent identical calls; every caller gets the same result or error."""
+    if not config.SINGLEFLIGHT_ENABLED:
+        return await call()
+    key = call_key(name, args)
+    fut = _INFLIGHT.get(key)
+    if fut is None:
+        fut = asyncio.ensure_future(_run_shared(name, key, call))
+        _INFLIGHT[key] = fut
+        fut.add_done_callback(lambda f, k=key: _done(k, f))
+    else:
+        metrics.record_singleflight(name, "shared_local")
+    # One caller giving up must not cancel the call the others are waiting on
+    return await asyncio.shield(fut)
+
+
+__all__ = ["coalesce", "call_key"]
@@ -0,0 +1,273 @@
+"""Per-district soil-moisture aggregates from a local mirror of the data.gov.in resource.
+
+The sync job (``start_sync``, see ``api.datagov_sync``) downloads the whole
+soil-moisture resource every ``SOIL_SYNC_INTERVAL_S``, reduces it with vectorised
+numpy group-bys to one row per district, and writes those aggregates to
+``SOIL_MIRROR_PATH`` (an ``.npz``). Workers load the file when it changes, so a
+soil lookup is a dict hit.
+
+Per district: latest reading and date, 7- and 30-day means ending at the latest
+reading, a least-squares trend over those 30 days, the seasonal norm (mean of
+all earlier readings in the same calendar month) and the 30-day anomaly against
+it. Readings are packed into compact columns page by page as they download
+(``_Readings``), so a multi-million-row sync stays in tens of megabytes.
+``latest_readings`` gives only the latest reading per district for the few raw
+records the fetcher gets from the live API when the mirror is stale.
+"""
+import asyncio
+import logging
+import os
+from dataclasses import dataclass, replace
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from api.datagov_sync import PeriodicSync, fetch_resource, file_age_s, iso_date, match_keys
+from api.gazetteer import canonical_admin, fold
+from api.payloads import SoilSummary
+from config import config
+
+logger = logging.getLogger("soil_mirror")
+
+SOIL_RESOURCE_ID = "4554a3c8-74e3-4f93-8727-8fd92161e345"
+
+_FLOAT_FIELDS = ("latest", "mean_7d", "mean_30d", "trend_per_day", "seasonal_norm", "anomaly")
+
+
+@dataclass(frozen=True)
+class _Snapshot:
+    mtime: float
+    rows: Dict[Tuple[str, str], SoilSummary]  # (state key, district key) -> aggregate
+    district_keys: List[str]
+    state_keys: List[str]
+
+
+_snapshot: Optional[_Snapshot] = None
+
+
+def _project(rec: Dict[str, Any]) -> Optional[Tuple[str, str, str, float]]:
+    """Raw record -> (ISO date, state, district, moisture at 15 cm); None when unusable."""
+    try:
+        value = float(rec.get("Avg_smlvl_at15cm"))
+    except (TypeError, ValueError):
+        return None
+    date = iso_date(rec.get("Date"))
+    state = str(rec.get("State") or "").strip()
+    district = str(rec.get("District") or "").strip()
+    if not date or len(date) != 10 or not district or not np.isfinite(value):
+        return None
+    return date, state, district, value
+
+
+class _Readings:
+    """Projected readings packed page by page into compact columns.
+
+    A full sync holds millions of readings; as (date, state, district, value)
+    tuples that is gigabytes, as int32 day / int32 district id / float32 value
+    columns it is 12 bytes a reading. Pass ``add`` to ``fetch_resource(pack=...)``.
+    """
+
+    def __init__(self) -> None:
+        self.areas: Dict[Tuple[str, str], int] = {}  # (state, district) -> id
+        self._chunks: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+
+    def add(self, rows: List[Tuple[str, str, str, float]]) -> int:
+        if rows:
+            dates, states, districts, values = zip(*rows)
+            ids = [self.areas.setdefault(key, len(self.areas)) for key in zip(states, districts)]
+            self._chunks.append((
+                np.asarray(dates, dtype="datetime64[D]").astype(np.int32),
+                np.asarray(ids, dtype=np.int32),
+                np.asarray(values, dtype=np.float32),
+            ))
+        return len(rows)
+
+    def columns(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        if not self._chunks:
+            return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.float64)
+        day, area, value = (np.concatenate(c) for c in zip(*self._chunks))
+        return day.astype(np.int64), area.astype(np.int64), value.astype(np.float64)
+
+
+def _aggregate(readings: _Readings) -> Dict[str, np.ndarray]:
+    """Vectorised per-district summary of packed readings."""
+    day, area, value = readings.columns()
+    if not len(day):
+        return {}
+    areas = list(readings.areas)  # ids are insertion order
+
+    # Sort by (district, day); groups are contiguous and the last row of each is the latest
+    order = np.lexsort((day, area))
+    day, value, area = day[order], value[order], area[order]
+    n = len(areas)
+    counts = np.bincount(area, minlength=n)
+    last = np.cumsum(counts) - 1
+    latest_day = day[last]
+    age = latest_day[area] - day  # days before the district's latest reading
+
+    def window_mean(mask: np.ndarray) -> np.ndarray:
+        cnt = np.bincount(area, weights=mask, minlength=n)
+        tot = np.bincount(area, weights=value * mask, minlength=n)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return tot / cnt
+
+    in7 = (age < 7).astype(np.float64)
+    in30 = (age < 30).astype(np.float64)
+    mean_7d = window_mean(in7)
+    mean_30d = window_mean(in30)
+
+    # Least-squares slope over the 30-day window, x in days relative to the latest reading
+    x = -age.astype(np.float64)
+    sn = np.bincount(area, weights=in30, minlength=n)
+    sx = np.bincount(area, weights=x * in30, minlength=n)
+    sy = np.bincount(area, weights=value * in30, minlength=n)
+    sxx = np.bincount(area, weights=x * x * in30, minlength=n)
+    sxy = np.bincount(area, weights=x * value * in30, minlength=n)
+    denom = sn * sxx - sx * sx
+    with np.errstate(invalid="ignore", divide="ignore"):
+        trend = np.where(denom > 0, (sn * sxy - sx * sy) / denom, np.nan)
+
+    # Seasonal norm: readings outside the 30-day window from the latest reading's calendar month
+    month = day.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64) % 12
+    latest_month = month[last]
+    hist = ((age >= 30) & (month == latest_month[area])).astype(np.float64)
+    seasonal_norm = window_mean(hist)
+    anomaly = mean_30d - seasonal_norm
+
+    state_names, district_names = zip(*areas)
+    return {
+        "state": np.asarray(state_names, dtype=str),
+        "district": np.asarray(district_names, dtype=str),
+        "latest_date": latest_day.astype("datetime64[D]").astype(str),
+        "latest": value[last],
+        "mean_7d": mean_7d,
+        "mean_30d": mean_30d,
+        "trend_per_day": trend,
+        "seasonal_norm": seasonal_norm,
+        "anomaly": anomaly,
+        "samples": counts.astype(np.int64),
+    }
+
+
+def _to_rows(agg: Dict[str, np.ndarray]) -> List[SoilSummary]:
+    out = []
+    for i in range(len(agg.get("district", ()))):
+        floats = {}
+        for f in _FLOAT_FIELDS:
+            v = float(agg[f][i])
+            floats[f] = round(v, 3) if np.isfinite(v) else None
+        out.append(SoilSummary(
+            state=str(agg["state"][i]) or None,
+            district=str(agg["district"][i]),
+            latest_date=str(agg["latest_date"][i]),
+            samples=int(agg["samples"][i]),
+            **floats,
+        ))
+    return out
+
+
+def latest_readings(records: List[Dict[str, Any]]) -> List[SoilSummary]:
+    """Latest reading per district from a handful of raw records (live API fallback).
+
+    A single page of the live API is far too few readings for 7/30-day means, a
+    trend or a seasonal anomaly, so those are left empty rather than computed
+    from a few scattered days.
+    """
+    readings = _Readings()
+    readings.add([r for r in map(_project, records) if r is not None])
+    return [
+        replace(row, mean_7d=None, mean_30d=None, trend_per_day=None, seasonal_norm=None, anomaly=None)
+        for row in _to_rows(_aggregate(readings))
+    ]
+
+
+def _write(path: str, agg: Dict[str, np.ndarray]) -> int:
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "wb") as f:
+        np.savez_compressed(f, **agg)
+    os.replace(tmp, path)
+    return len(agg["district"])
+
+
+async def sync_once() -> int:
+    """Download the resource, aggregate per district and swap the file in. Returns the district count."""
+    readings = _Readings()
+    await fetch_resource(SOIL_RESOURCE_ID, max_rows=config.SOIL_SYNC_MAX_ROWS, project=_project, pack=readings.add)
+    agg = await asyncio.to_thread(_aggregate, readings)
+    if not agg:
+        raise RuntimeError("soil resource had no usable readings")
+    path = config.SOIL_MIRROR_PATH
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    return await asyncio.to_thread(_write, path, agg)
+
+
+_sync = PeriodicSync("soil", config.SOIL_MIRROR_PATH, config.SOIL_SYNC_INTERVAL_S, sync_once)
+
+
+async def start_sync() -> None:
+    if config.SOIL_MIRROR_ENABLED and config.DATA_GOV_API_KEY:
+        _sync.start()
+
+
+async def stop_sync() -> None:
+    await _sync.stop()
+
+
+def is_fresh() -> bool:
+    age = file_age_s(config.SOIL_MIRROR_PATH)
+    return age is not None and age <= config.SOIL_MIRROR_MAX_AGE_S
+
+
+def _load() -> Optional[_Snapshot]:
+    global _snapshot
+    path = config.SOIL_MIRROR_PATH
+    mtime = os.path.getmtime(path)
+    if _snapshot is not None and _snapshot.mtime == mtime:
+        return _snapshot
+    with np.load(path, allow_pickle=False) as data:
+        agg = {k: data[k] for k in data.files}
+    rows: Dict[Tuple[str, str], SoilSummary] = {}
+    for row in _to_rows(agg):
+        # Same spellings as the mandi/soil filters derived from the gazetteer
+        state, district = canonical_admin(row.state, row.district)
+        row = replace(row, state=state or row.state, district=district or row.district)
+        rows[(fold(row.state or ""), fold(row.district))] = row
+    _snapshot = _Snapshot(
+        mtime=mtime,
+        rows=rows,
+        district_keys=sorted({d for _, d in rows}),
+        state_keys=sorted({s for s, _ in rows if s}),
+    )
+    logger.info("Soil mirror loaded: %d districts", len(rows))
+    return _snapshot
+
+
+def _lookup(state: Optional[str], district: Optional[str], limit: int) -> List[SoilSummary]:
+    snap = _load()
+    state_keys = match_keys(fold(state or ""), snap.state_keys, config.GAZETTEER_FUZZY_CUTOFF) if state else []
+    if district:
+        wanted = set(match_keys(fold(district), snap.district_keys, config.GAZETTEER_FUZZY_CUTOFF))
+        hits = [row for (s, d), row in snap.rows.items() if d in wanted and (not state_keys or s in state_keys)]
+        if hits or not state_keys:
+            return hits[:limit]
+    if state_keys:
+        # No district (or none recorded): the state's districts, freshest first
+        hits = [row for (s, _), row in snap.rows.items() if s in state_keys]
+        hits.sort(key=lambda r: r.latest_date, reverse=True)
+        return hits[:limit]
+    return []
+
+
+async def query(state: Optional[str], district: Optional[str], *, limit: int = 10) -> Optional[List[SoilSummary]]:
+    """District aggregates matching the filters, or None if the mirror is missing or stale."""
+    if not config.SOIL_MIRROR_ENABLED or not is_fresh():
+        return None
+    try:
+        # Loading a new snapshot and fuzzy-matching keys are CPU work; keep them off the event loop
+        return await asyncio.to_thread(_lookup, state, district, max(1, int(limit)))
+    except Exception as e:
+        logger.warning("Soil mirror query failed: %s", e)
+        return None
+
+
+__all__ = ["query", "latest_readings", "sync_once", "start_sync", "stop_sync", "is_fresh"]
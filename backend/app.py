@@ -2,16 +2,21 @@ from fastapi import FastAPI
 import logging, os
 from routers.api import router as rag_router
 from routers.ingest import router as ingest_router
+from routers.metrics import router as metrics_router
 from api.pipeline_selector import ensure_pipeline_index
+from api.history import history_writer
+from api.http_clients import close_clients, start_clients
+from api import mandi_mirror, soil_mirror
 
 # Configure basic logging; override with LOG_LEVEL env var
 _level = os.getenv("LOG_LEVEL", "INFO").upper()
 logging.basicConfig(level=getattr(logging, _level, logging.INFO), format="%(asctime)s %(levelname)s [%(name)s] %(message)s")
 
 app = FastAPI()
-# Expose routes without a prefix so paths are exactly "/response" and "/ingest"
+# Expose routes without a prefix so paths are exactly "/response", "/ingest" and "/metrics"
 app.include_router(rag_router)
 app.include_router(ingest_router)
+app.include_router(metrics_router)
 
 
 @app.on_event("startup")
@@ -22,3 +27,38 @@ async def _warm_pipeline_cache():
 	except Exception:
 		# Non-fatal; selection will compute on-demand
 		pass
+
+
+@app.on_event("startup")
+async def _start_history_writer():
+	await history_writer.start()
+
+
+@app.on_event("startup")
+async def _start_http_clients():
+	# Pooled keep-alive clients for OpenWeather, data.gov.in and Nominatim
+	await start_clients()
+
+
+@app.on_event("startup")
+async def _start_mirror_sync():
+	# Background refresh of the local mandi price and soil-moisture mirrors
+	await mandi_mirror.start_sync()
+	await soil_mirror.start_sync()
+
+
+@app.on_event("shutdown")
+async def _stop_mirror_sync():
+	await mandi_mirror.stop_sync()
+	await soil_mirror.stop_sync()
+
+
+@app.on_event("shutdown")
+async def _stop_history_writer():
+	# Flush queued history records before the worker exits
+	await history_writer.stop()
+
+
+@app.on_event("shutdown")
+async def _close_http_clients():
+	await close_clients()
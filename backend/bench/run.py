@@ -0,0 +1,289 @@
+"""Hermetic load test for /response.
+
+Starts a local Redis (unless one is given), the upstream stubs from ``bench.stubs``,
+seeds the vector index and launches the FastAPI app with every upstream pointed at
+the stubs. Then it drives ``/response`` with each pipeline mix from ``mixes.json``
+at each requested concurrency and reports p50/p95/p99 latency and throughput,
+overall and per picked pipeline.
+
+    python -m bench.run --mix weather,mandi,mixed --concurrency 1,8,32 --requests 200
+
+``--out`` writes the results as JSON; ``--baseline`` compares p95 against an
+earlier run and exits non-zero when any mix regressed by more than
+``--max-regression``.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+MIXES_PATH = Path(__file__).resolve().parent / "mixes.json"
+LOG_DIR = Path(tempfile.gettempdir()) / "agri-bench"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_until(check, timeout: float, what: str) -> None:
+    deadline = time.monotonic() + timeout
+    last_err: Optional[Exception] = None
+    while time.monotonic() < deadline:
+        try:
+            if check():
+                return
+        except Exception as e:
+            last_err = e
+        time.sleep(0.25)
+    raise RuntimeError(f"{what} did not become ready in {timeout:.0f}s ({last_err})")
+
+
+def _http_ok(url: str) -> bool:
+    return httpx.get(url, timeout=2).status_code < 500
+
+
+def _redis_ok(port: int) -> bool:
+    import redis
+
+    return bool(redis.Redis(host="127.0.0.1", port=port).ping())
+
+
+class Services:
+    """Child processes for Redis, the stubs and the app; stopped together."""
+
+    def __init__(self) -> None:
+        self.procs: List[subprocess.Popen] = []
+
+    def spawn(self, cmd: List[str], env: Optional[Dict[str, str]] = None, log_name: str = "") -> subprocess.Popen:
+        LOG_DIR.mkdir(parents=True, exist_ok=True)
+        log = open(LOG_DIR / f"{log_name or 'proc'}.log", "wb")
+        proc = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+        self.procs.append(proc)
+        return proc
+
+    def stop(self) -> None:
+        for proc in reversed(self.procs):
+            if proc.poll() is None:
+                proc.send_signal(signal.SIGINT)
+        for proc in reversed(self.procs):
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+def start_redis(services: Services, port: int) -> None:
+    # Vector search needs RediSearch: redis-stack-server, or redis-server >= 8
+    binary = shutil.which("redis-stack-server") or shutil.which("redis-server")
+    if not binary:
+        raise RuntimeError("No redis-stack-server/redis-server on PATH; pass --redis-port of a running Redis Stack")
+    services.spawn([binary, "--port", str(port), "--save", "", "--appendonly", "no"], log_name="redis")
+    _wait_until(lambda: _redis_ok(port), 20, "Redis")
+
+
+def backend_env(args: argparse.Namespace, redis_port: int, stub_url: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "REDIS_HOST": "127.0.0.1",
+        "REDIS_PORT": str(redis_port),
+        "REDIS_DB": "0",
+        "MISTRAL_API_KEY": "bench",
+        "MODEL_NAME": env.get("MODEL_NAME") or "bench-model",
+        "OPENWEATHER_API_KEY": "bench",
+        "DATA_GOV_API_KEY": "bench",
+        "MISTRAL_BASE_URL": f"{stub_url}/mistral/v1",
+        "OWM_BASE_URL": f"{stub_url}/owm",
+        "DATA_GOV_BASE_URL": f"{stub_url}/datagov",
+        "NOMINATIM_BASE_URL": f"{stub_url}/nominatim",
+        "MANDI_MIRROR_PATH": str(LOG_DIR / "mandi_mirror.sqlite"),
+        "SOIL_MIRROR_PATH": str(LOG_DIR / "soil_mirror.npz"),
+        "ANSWER_CACHE_ENABLED": "true" if args.answer_cache else "false",
+        "LOG_LEVEL": args.log_level,
+    })
+    return env
+
+
+async def drive(base_url: str, queries: List[str], *, concurrency: int, total: int, timeout: float) -> List[Dict[str, Any]]:
+    """Closed-loop load: ``concurrency`` workers each send the next query as soon as the last returns."""
+    counter = itertools.count()
+    results: List[Dict[str, Any]] = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        async def worker() -> None:
+            while True:
+                i = next(counter)
+                if i >= total:
+                    return
+                body = {"query": queries[i % len(queries)], "call_sid": f"bench-{uuid.uuid4().hex[:12]}"}
+                t0 = time.perf_counter()
+                try:
+                    resp = await client.post("/response", json=body)
+                    ok = resp.status_code == 200
+                    data = resp.json() if ok else {}
+                except Exception:
+                    ok, data = False, {}
+                elapsed = time.perf_counter() - t0
+                picked = data.get("pipelines") or ([data["pipeline"]] if data.get("pipeline") else [])
+                results.append({"ok": ok, "seconds": elapsed, "pipeline": "+".join(sorted(picked)) or "-"})
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results
+
+
+def summarize(results: List[Dict[str, Any]], wall_s: float) -> Dict[str, Any]:
+    lat = np.array([r["seconds"] for r in results if r["ok"]], dtype=float) * 1000
+    errors = sum(1 for r in results if not r["ok"])
+    out: Dict[str, Any] = {"requests": len(results), "errors": errors, "rps": round(len(results) / wall_s, 2) if wall_s else 0.0}
+    if lat.size:
+        p50, p95, p99 = np.percentile(lat, [50, 95, 99])
+        out.update({"p50_ms": round(float(p50), 1), "p95_ms": round(float(p95), 1), "p99_ms": round(float(p99), 1), "mean_ms": round(float(lat.mean()), 1)})
+    return out
+
+
+def by_pipeline(results: List[Dict[str, Any]], wall_s: float) -> Dict[str, Dict[str, Any]]:
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for r in results:
+        if r["ok"]:
+            groups.setdefault(r["pipeline"], []).append(r)
+    return {label: summarize(rows, wall_s) for label, rows in sorted(groups.items())}
+
+
+def print_table(rows: List[Dict[str, Any]]) -> None:
+    header = f"{'mix':<12}{'pipeline':<34}{'conc':>6}{'n':>7}{'err':>5}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        s = row["summary"]
+        print(f"{row['mix']:<12}{'(all)':<34}{row['concurrency']:>6}{s['requests']:>7}{s['errors']:>5}{s['rps']:>9}"
+              f"{s.get('p50_ms', '-'):>9}{s.get('p95_ms', '-'):>9}{s.get('p99_ms', '-'):>9}")
+        for label, ps in row["pipelines"].items():
+            print(f"{'':<12}{label[:33]:<34}{'':>6}{ps['requests']:>7}{'':>5}{'':>9}"
+                  f"{ps.get('p50_ms', '-'):>9}{ps.get('p95_ms', '-'):>9}{ps.get('p99_ms', '-'):>9}")
+
+
+def compare(rows: List[Dict[str, Any]], baseline_path: str, max_regression: float) -> List[str]:
+    """p95 regressions beyond ``max_regression`` (0.15 = 15%) against a previous --out file."""
+    baseline = json.loads(Path(baseline_path).read_text(encoding="utf-8"))
+    old = {(r["mix"], r["concurrency"]): r["summary"] for r in baseline.get("results", [])}
+    failures = []
+    for row in rows:
+        prev = old.get((row["mix"], row["concurrency"]))
+        cur_p95, prev_p95 = row["summary"].get("p95_ms"), (prev or {}).get("p95_ms")
+        if cur_p95 is None or not prev_p95:
+            continue
+        change = cur_p95 / prev_p95 - 1
+        if change > max_regression:
+            failures.append(f"{row['mix']} @ {row['concurrency']}: p95 {prev_p95} -> {cur_p95} ms (+{change:.0%})")
+    return failures
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Hermetic /response load test against local stubs")
+    ap.add_argument("--mix", default="mixed", help=f"Comma-separated mixes from {MIXES_PATH.name}, or 'all'")
+    ap.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrency levels")
+    ap.add_argument("--requests", type=int, default=200, help="Requests per mix and concurrency level")
+    ap.add_argument("--warmup", type=int, default=10, help="Requests sent before measuring each mix")
+    ap.add_argument("--latency", default=None, help="Stub latency in ms, e.g. mistral=400,owm=80,datagov=150,nominatim=60")
+    ap.add_argument("--jitter", type=float, default=0.2)
+    ap.add_argument("--timeout", type=float, default=60, help="Per-request client timeout (s)")
+    ap.add_argument("--workers", type=int, default=1, help="uvicorn workers for the app")
+    ap.add_argument("--redis-port", type=int, default=None, help="Use an already running Redis Stack instead of starting one")
+    ap.add_argument("--answer-cache", action="store_true", help="Leave the semantic answer cache on (off by default so every request runs the full path)")
+    ap.add_argument("--log-level", default="WARNING", help="App LOG_LEVEL")
+    ap.add_argument("--out", default=None, help="Write results JSON here")
+    ap.add_argument("--baseline", default=None, help="Previous --out file to compare p95 against")
+    ap.add_argument("--max-regression", type=float, default=0.15)
+    args = ap.parse_args()
+
+    mixes: Dict[str, List[str]] = json.loads(MIXES_PATH.read_text(encoding="utf-8"))
+    names = list(mixes) if args.mix == "all" else [m.strip() for m in args.mix.split(",") if m.strip()]
+    unknown = [m for m in names if m not in mixes]
+    if unknown:
+        ap.error(f"unknown mix(es): {', '.join(unknown)}")
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+
+    services = Services()
+    try:
+        redis_port = args.redis_port
+        if redis_port is None:
+            redis_port = _free_port()
+            start_redis(services, redis_port)
+
+        stub_port = _free_port()
+        stub_cmd = [sys.executable, "-m", "bench.stubs", "--port", str(stub_port), "--jitter", str(args.jitter)]
+        if args.latency:
+            stub_cmd += ["--latency", args.latency]
+        services.spawn(stub_cmd, log_name="stubs")
+        stub_url = f"http://127.0.0.1:{stub_port}"
+        _wait_until(lambda: _http_ok(f"{stub_url}/nominatim/search?q=Pune"), 30, "Stub server")
+
+        env = backend_env(args, redis_port, stub_url)
+        print("Seeding vector index ...", flush=True)
+        subprocess.run([sys.executable, "-m", "bench.seed"], cwd=BACKEND_DIR, env=env, check=True)
+
+        app_port = _free_port()
+        services.spawn(
+            [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(app_port),
+             "--workers", str(args.workers), "--log-level", "warning"],
+            env=env,
+            log_name="app",
+        )
+        app_url = f"http://127.0.0.1:{app_port}"
+        # First start loads the embedding model and builds the pipeline index
+        _wait_until(lambda: _http_ok(f"{app_url}/metrics"), 300, "App")
+
+        rows: List[Dict[str, Any]] = []
+        for name in names:
+            queries = mixes[name]
+            if args.warmup:
+                asyncio.run(drive(app_url, queries, concurrency=min(4, args.warmup), total=args.warmup, timeout=args.timeout))
+            for conc in levels:
+                t0 = time.perf_counter()
+                results = asyncio.run(drive(app_url, queries, concurrency=conc, total=args.requests, timeout=args.timeout))
+                wall = time.perf_counter() - t0
+                rows.append({
+                    "mix": name,
+                    "concurrency": conc,
+                    "summary": summarize(results, wall),
+                    "pipelines": by_pipeline(results, wall),
+                })
+                print(f"  {name} @ {conc}: {rows[-1]['summary']}", flush=True)
+
+        print()
+        print_table(rows)
+        if args.out:
+            meta = {"latency_ms": args.latency, "jitter": args.jitter, "requests": args.requests, "workers": args.workers, "ts": int(time.time())}
+            Path(args.out).write_text(json.dumps({"meta": meta, "results": rows}, indent=2), encoding="utf-8")
+        if args.baseline:
+            failures = compare(rows, args.baseline, args.max_regression)
+            if failures:
+                print("\nLatency regressions:")
+                for f in failures:
+                    print(f"  {f}")
+                return 1
+            print(f"\nNo p95 regression above {args.max_regression:.0%} vs {args.baseline}")
+        return 0
+    finally:
+        services.stop()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+"""Seed the vector index with a few agronomy passages so retrieval has something to hit.
+
+Run against the benchmark Redis (REDIS_HOST/REDIS_PORT from the environment):
+``python -m bench.seed``. Uses the same local embedding model as the app.
+"""
+import logging
+import time
+
+from langchain_core.documents import Document
+from langchain_redis import RedisVectorStore
+
+from config import config
+from routers.retrieval import get_embeddings
+
+logger = logging.getLogger("bench.seed")
+
+PASSAGES = [
+    "Onion is transplanted 6-8 weeks after sowing. Irrigate immediately after transplanting and then every 7-10 days; stop irrigation 10-15 days before harvest to improve storage life.",
+    "Wheat responds well to split nitrogen: half at sowing and the rest at first irrigation (crown root initiation, 20-25 days after sowing). Apply phosphorus and potash fully as basal dose.",
+    "Aphids on cotton can be managed by conserving natural enemies, yellow sticky traps and, above economic threshold, a spray of neem seed kernel extract 5% or recommended systemic insecticides.",
+    "Drip irrigation for grapes: run 30-60 minutes daily during fruit development depending on evapotranspiration; reduce after veraison to improve sugar accumulation.",
+    "Sugarcane needs frequent irrigation in the grand growth phase. On medium black soils irrigate every 8-10 days in summer and 12-15 days in winter.",
+    "Avoid spraying pesticides when rain is expected within 6 hours or when wind speed exceeds 15 km/h; early morning or late evening sprays reduce drift and evaporation.",
+    "Soil moisture at 15 cm below 20% on sandy loam indicates irrigation is due for most field crops; clay soils hold more water and can go longer between irrigations.",
+    "Staggered selling across weeks and checking modal prices in nearby APMC markets helps farmers avoid distress sales during arrival gluts.",
+    "PM-KISAN provides income support of Rs 6000 per year to eligible farmer families in three instalments; PMFBY offers crop insurance at subsidised premium rates.",
+    "Store harvested grain at below 12% moisture in clean, fumigated bins; use hermetic bags to control storage pests without chemicals.",
+]
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    t0 = time.monotonic()
+    store = RedisVectorStore(
+        embeddings=get_embeddings(),
+        index_name=config.REDIS_INDEX_NAME,
+        redis_url=config.REDIS_URL,
+        metadata_schema=[
+            {"name": "source", "type": "text"},
+            {"name": "doc_hash", "type": "tag"},
+            {"name": "last_modified_time", "type": "numeric"},
+        ],
+    )
+    now = int(time.time())
+    docs = [
+        Document(page_content=text, metadata={"source": "bench", "doc_hash": f"bench-{i}", "last_modified_time": now})
+        for i, text in enumerate(PASSAGES)
+    ]
+    store.add_documents(docs)
+    logger.info("Seeded %d passages into %s in %d ms", len(docs), config.REDIS_INDEX_NAME, int((time.monotonic() - t0) * 1000))
+
+
+if __name__ == "__main__":
+    main()
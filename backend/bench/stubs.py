@@ -0,0 +1,369 @@
+"""Local stand-ins for every upstream the backend calls.
+
+One FastAPI app serves all of them under path prefixes so a single port is enough:
+
+- ``/mistral/v1/chat/completions`` — Mistral chat (JSON and SSE streaming). Router,
+  understanding and mandi-extraction prompts get canned JSON derived from keywords
+  in the query; answer prompts get a canned paragraph.
+- ``/owm/...`` — OpenWeather current, 16-day daily, 30-day climate and direct geocoding.
+- ``/datagov/resource/{id}`` — the soil-moisture and mandi-price resources (unfiltered
+  requests page through a fixed catalogue, for the mirror syncs).
+- ``/nominatim/search`` — Nominatim search.
+
+Latency per upstream is configurable (milliseconds, with +/- jitter) so the load
+test can model slow dependencies. Run with ``python -m bench.stubs --port 9100``.
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import time
+import uuid
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+DEFAULT_LATENCY_MS = {"mistral": 400, "owm": 80, "datagov": 150, "nominatim": 60}
+
+SOIL_RESOURCE = "4554a3c8-74e3-4f93-8727-8fd92161e345"
+MANDI_RESOURCE = "9ef84268-d588-465a-a308-a864a43d0070"
+
+# Places the stubs "know": (name, district, state, lat, lon)
+PLACES = [
+    ("Pune", "Pune", "Maharashtra", 18.5204, 73.8567),
+    ("Nashik", "Nashik", "Maharashtra", 19.9975, 73.7898),
+    ("Lasalgaon", "Nashik", "Maharashtra", 20.1500, 74.2333),
+    ("Junnar", "Pune", "Maharashtra", 19.2000, 73.8800),
+    ("Satara", "Satara", "Maharashtra", 17.6805, 74.0183),
+    ("Indore", "Indore", "Madhya Pradesh", 22.7196, 75.8577),
+    ("Ludhiana", "Ludhiana", "Punjab", 30.9010, 75.8573),
+    ("Guntur", "Guntur", "Andhra Pradesh", 16.3067, 80.4365),
+]
+COMMODITIES = ["Onion", "Tomato", "Soybean", "Cotton", "Wheat", "Potato", "Sugarcane", "Grapes"]
+
+# Full daily mandi resource served to unfiltered (bulk) requests: every place x commodity x 5 days
+MANDI_BULK = [
+    {
+        "state": place[2],
+        "district": place[1],
+        "market": place[0],
+        "commodity": commodity,
+        "variety": "Other",
+        "grade": "FAQ",
+        "arrival_date": f"{13 + day:02d}/10/2026",
+        "min_price": str(1000 + 100 * ci + 10 * day),
+        "max_price": str(1800 + 100 * ci + 15 * day),
+        "modal_price": str(1400 + 100 * ci + 12 * day),
+    }
+    for place in PLACES
+    for ci, commodity in enumerate(COMMODITIES)
+    for day in range(5)
+]
+
+
+def _soil_bulk(days: int = 400) -> List[Dict[str, Any]]:
+    """Daily soil moisture for every stub district: a seasonal cycle plus a per-district offset."""
+    end = date(2026, 10, 17).toordinal()
+    rows = []
+    for offset, (district, state) in enumerate(sorted({(p[1], p[2]) for p in PLACES})):
+        for back in range(days):
+            day = date.fromordinal(end - back)
+            rows.append({
+                "Date": day.isoformat(),
+                "State": state,
+                "District": district,
+                "Year": str(day.year),
+                "Month": day.strftime("%B"),
+                "Avg_smlvl_at15cm": f"{22 + 8 * math.sin(day.toordinal() / 58.0) + offset:.2f}",
+                "Agency_name": "NRSC VIC MODEL",
+            })
+    return rows
+
+
+SOIL_BULK = _soil_bulk()
+
+ROUTE_KEYWORDS = [
+    ("weather_advice", ("rain", "weather", "forecast", "storm", "temperature", "hot", "spray")),
+    ("soil_advice", ("soil", "moisture")),
+    ("mandi_advice", ("price", "mandi", "rate", "sell", "market")),
+    ("irrigation_advice", ("irrigat", "water", "drip")),
+]
+
+ANSWER_TEXT = (
+    "Based on the latest data for your area, conditions are suitable for field work over the next two days. "
+    "Expect light showers later in the week, so plan irrigation after checking soil moisture. "
+    "Current mandi prices are close to the seasonal average; staggering sales over the coming week reduces risk. "
+    "Consult your local Krishi Vigyan Kendra for crop-specific recommendations."
+)
+
+_latency: Dict[str, float] = dict(DEFAULT_LATENCY_MS)
+_jitter: float = 0.2
+
+
+async def _sleep(upstream: str, share: float = 1.0) -> None:
+    base = _latency.get(upstream, 0) * share
+    if base <= 0:
+        return
+    await asyncio.sleep(max(0.0, base * random.uniform(1 - _jitter, 1 + _jitter)) / 1000)
+
+
+def _find_place(text: str) -> Optional[tuple]:
+    low = text.lower()
+    for place in PLACES:
+        if place[0].lower() in low:
+            return place
+    return None
+
+
+def _find_commodity(text: str) -> Optional[str]:
+    low = text.lower()
+    for c in COMMODITIES:
+        if c.lower() in low:
+            return c
+    return None
+
+
+def _route(text: str) -> List[str]:
+    low = text.lower()
+    ids = [pid for pid, words in ROUTE_KEYWORDS if any(w in low for w in words)]
+    return ids or ["general_assistant"]
+
+
+def _query_of(prompt: str) -> str:
+    m = re.search(r"Query:\s*(.*)$", prompt, re.S)
+    return (m.group(1) if m else prompt).strip()
+
+
+def _mandi_filters(query: str) -> Dict[str, Any]:
+    place = _find_place(query)
+    return {
+        "state": place[2] if place else None,
+        "district": place[1] if place else None,
+        "market": place[0] if place else None,
+        "commodity": _find_commodity(query),
+        "variety": None,
+        "grade": None,
+        "limit": None,
+        "offset": None,
+    }
+
+
+def _reply_for(prompt: str) -> str:
+    """Canned reply keyed on which backend prompt this is."""
+    query = _query_of(prompt)
+    if prompt.startswith("You analyse a farmer's query"):
+        place = _find_place(query)
+        obj: Dict[str, Any] = {
+            "region": place[0] if place else None,
+            "lat": None,
+            "lon": None,
+            "city": place[1] if place else None,
+            "state": place[2] if place else None,
+            "mandi": _mandi_filters(query),
+        }
+        if "pipeline_ids" in prompt:
+            obj = {"pipeline_ids": _route(query), "reason": "keyword match", **obj}
+        return json.dumps(obj)
+    if prompt.startswith("You are an expert router"):
+        return json.dumps({"pipeline_ids": _route(query), "reason": "keyword match"})
+    if prompt.startswith("You extract structured filters"):
+        return json.dumps(_mandi_filters(query))
+    return ANSWER_TEXT
+
+
+def _usage(prompt: str, reply: str) -> Dict[str, int]:
+    p, c = len(prompt) // 4, len(reply) // 4
+    return {"prompt_tokens": p, "completion_tokens": c, "total_tokens": p + c}
+
+
+app = FastAPI(title="Upstream stubs")
+
+
+@app.post("/mistral/v1/chat/completions")
+async def mistral_chat(request: Request):
+    body = await request.json()
+    messages = body.get("messages") or []
+    prompt = "\n".join(str(m.get("content") or "") for m in messages if m.get("role") != "assistant")
+    reply = _reply_for(prompt)
+    model = body.get("model") or "bench-model"
+    cid = f"cmpl-{uuid.uuid4().hex[:12]}"
+    created = int(time.time())
+
+    if not body.get("stream"):
+        await _sleep("mistral")
+        return {
+            "id": cid,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+            "usage": _usage(prompt, reply),
+        }
+
+    async def events():
+        # Time to first token is 40% of the configured latency; the rest is spread over the chunks
+        await _sleep("mistral", 0.4)
+        words = reply.split(" ")
+        chunks = [" ".join(words[i:i + 4]) + " " for i in range(0, len(words), 4)]
+        for i, text in enumerate(chunks):
+            last = i == len(chunks) - 1
+            data = {
+                "id": cid,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {"role": "assistant", "content": text}, "finish_reason": "stop" if last else None}],
+            }
+            if last:
+                data["usage"] = _usage(prompt, reply)
+            yield f"data: {json.dumps(data)}\n\n"
+            await _sleep("mistral", 0.6 / len(chunks))
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/owm/data/2.5/weather")
+async def owm_current(lat: float, lon: float):
+    await _sleep("owm")
+    return {
+        "coord": {"lat": lat, "lon": lon},
+        "weather": [{"id": 802, "main": "Clouds", "description": "scattered clouds"}],
+        "main": {"temp": 29.4, "feels_like": 31.2, "temp_min": 27.0, "temp_max": 31.5, "humidity": 62, "pressure": 1008},
+        "wind": {"speed": 3.6, "deg": 250},
+        "clouds": {"all": 40},
+        "dt": int(time.time()),
+        "name": "Bench",
+    }
+
+
+@app.get("/owm/data/2.5/forecast/daily")
+async def owm_daily(lat: float, lon: float, cnt: int = 16):
+    await _sleep("owm")
+    now = int(time.time())
+    days = [
+        {
+            "dt": now + i * 86400,
+            "temp": {"day": 29 + i % 3, "min": 22, "max": 32 + i % 2},
+            "humidity": 60 + i % 10,
+            "weather": [{"main": "Rain" if i % 4 == 1 else "Clouds", "description": "light rain" if i % 4 == 1 else "broken clouds"}],
+            "speed": 3.2,
+            "pop": 0.6 if i % 4 == 1 else 0.1,
+            "rain": 4.2 if i % 4 == 1 else 0,
+        }
+        for i in range(cnt)
+    ]
+    return {"city": {"coord": {"lat": lat, "lon": lon}}, "cnt": cnt, "list": days}
+
+
+@app.get("/owm/data/2.5/forecast/climate")
+async def owm_climate(lat: float, lon: float, cnt: int = 30):
+    # Climate forecast needs a paid plan; the real API answers 401 on free keys
+    await _sleep("owm")
+    return JSONResponse({"cod": 401, "message": "Invalid API key."}, status_code=401)
+
+
+@app.get("/owm/geo/1.0/direct")
+async def owm_geocode(q: str, limit: int = 1):
+    await _sleep("owm")
+    place = _find_place(q)
+    if not place:
+        return []
+    return [{"name": place[0], "lat": place[3], "lon": place[4], "country": "IN", "state": place[2]}]
+
+
+@app.get("/datagov/resource/{resource_id}")
+async def datagov_resource(resource_id: str, request: Request):
+    await _sleep("datagov")
+    params = request.query_params
+    limit = int(params.get("limit") or 10)
+    if resource_id == SOIL_RESOURCE:
+        if not any(k.startswith("filters[") for k in params.keys()):
+            offset = int(params.get("offset") or 0)
+            page = SOIL_BULK[offset:offset + limit]
+            return {"records": page, "total": len(SOIL_BULK), "count": len(page)}
+        state = params.get("filters[State]") or "Maharashtra"
+        district = params.get("filters[District]") or "Pune"
+        records = [
+            {
+                "Date": f"2024-06-{i + 1:02d}",
+                "State": state,
+                "District": district,
+                "Year": "2024",
+                "Month": "June",
+                "Avg_smlvl_at15cm": f"{18.5 + i * 0.7:.2f}",
+                "Agency_name": "NRSC VIC MODEL",
+            }
+            for i in range(limit)
+        ]
+        return {"records": records, "total": 120, "count": len(records)}
+    if resource_id == MANDI_RESOURCE:
+        if not any(k.startswith("filters[") for k in params.keys()):
+            # Unfiltered paging, as used by the mandi mirror sync
+            offset = int(params.get("offset") or 0)
+            return {"records": MANDI_BULK[offset:offset + limit], "total": len(MANDI_BULK), "count": len(MANDI_BULK[offset:offset + limit])}
+        commodity = params.get("filters[commodity]") or "Onion"
+        market = params.get("filters[market]") or "Pune"
+        records = [
+            {
+                "state": params.get("filters[state.keyword]") or "Maharashtra",
+                "district": params.get("filters[district]") or market,
+                "market": market,
+                "commodity": commodity,
+                "variety": "Other",
+                "grade": "FAQ",
+                "arrival_date": "17/10/2026",
+                "min_price": str(1200 + i * 25),
+                "max_price": str(2100 + i * 30),
+                "modal_price": str(1650 + i * 20),
+            }
+            for i in range(limit)
+        ]
+        return {"records": records, "total": 340, "count": len(records)}
+    return JSONResponse({"error": "unknown resource"}, status_code=404)
+
+
+@app.get("/nominatim/search")
+async def nominatim_search(q: str, format: str = "json", limit: int = 1):
+    await _sleep("nominatim")
+    place = _find_place(q)
+    if not place:
+        return []
+    return [{"display_name": f"{place[0]}, {place[2]}, India", "lat": str(place[3]), "lon": str(place[4])}]
+
+
+def parse_latency(spec: Optional[str]) -> Dict[str, float]:
+    """``"mistral=400,owm=80"`` -> {"mistral": 400.0, "owm": 80.0}, on top of the defaults."""
+    out = dict(DEFAULT_LATENCY_MS)
+    for part in (spec or "").split(","):
+        if "=" in part:
+            k, v = part.split("=", 1)
+            out[k.strip()] = float(v)
+    return out
+
+
+def configure(latency: Dict[str, float], jitter: float) -> None:
+    global _latency, _jitter
+    _latency = dict(latency)
+    _jitter = max(0.0, min(jitter, 1.0))
+
+
+def main() -> None:
+    import uvicorn
+
+    ap = argparse.ArgumentParser(description="Serve local stand-ins for Mistral, OpenWeather, data.gov.in and Nominatim")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=9100)
+    ap.add_argument("--latency", default=None, help="Per-upstream latency in ms, e.g. mistral=400,owm=80,datagov=150,nominatim=60")
+    ap.add_argument("--jitter", type=float, default=0.2, help="Relative latency jitter (0.2 = +/-20%%)")
+    args = ap.parse_args()
+    configure(parse_latency(args.latency), args.jitter)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
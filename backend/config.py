@@ -2,6 +2,7 @@ import torch
 # config.py
 import os
 import redis
+import redis.asyncio as aioredis
 from dotenv import load_dotenv
 
 load_dotenv()  # Load environment variables from .env file
@@ -13,8 +14,112 @@ class Config:
     REDIS_URL = f"redis://{REDIS_HOST}:{REDIS_PORT}"
     REDIS_INDEX_NAME = "pdf_vectors"
     PIPELINE_INDEX_NAME = os.getenv("PIPELINE_INDEX_NAME", "pipeline_vectors")
+    # Embedding router: minimum cosine score to skip the LLM router; pipelines this close to the best are all picked
+    ROUTER_MIN_SCORE = float(os.getenv("ROUTER_MIN_SCORE", 0.40))
+    ROUTER_MARGIN = float(os.getenv("ROUTER_MARGIN", 0.08))
+    # Semantic answer cache: cosine threshold for a hit; TTLs come from pipelines.json cache_ttl_s
+    ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    ANSWER_CACHE_PREFIX = os.getenv("ANSWER_CACHE_PREFIX", "answer_cache")
+    ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.92))
+    ANSWER_CACHE_DEFAULT_TTL_S = int(os.getenv("ANSWER_CACHE_DEFAULT_TTL_S", 3600))
+    ANSWER_CACHE_DOC_TTL_S = int(os.getenv("ANSWER_CACHE_DOC_TTL_S", 7 * 24 * 3600))
+    ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 200))
+    # Conversation history (call:{sid}:history): kept turns, idle expiry and background batching
+    HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", 50))
+    HISTORY_TTL_S = int(os.getenv("HISTORY_TTL_S", 30 * 24 * 3600))
+    HISTORY_BATCH_SIZE = int(os.getenv("HISTORY_BATCH_SIZE", 100))
+    HISTORY_FLUSH_INTERVAL_MS = int(os.getenv("HISTORY_FLUSH_INTERVAL_MS", 50))
+    HISTORY_QUEUE_SIZE = int(os.getenv("HISTORY_QUEUE_SIZE", 10000))
     MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
     MODEL_NAME = os.getenv("MODEL_NAME")
+    # Async LLM layer: max in-flight Mistral calls per worker and per-call timeout (seconds)
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 16))
+    LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", 30))
+    # /response/batch: queries processed concurrently and max items per request
+    BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", 8))
+    BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 500))
+    # Upstream base URLs; overridden by bench/ to point at local stub servers
+    MISTRAL_BASE_URL = os.getenv("MISTRAL_BASE_URL")  # None -> langchain_mistralai default
+    OWM_BASE_URL = os.getenv("OWM_BASE_URL", "https://api.openweathermap.org").rstrip("/")
+    DATA_GOV_BASE_URL = os.getenv("DATA_GOV_BASE_URL", "https://api.data.gov.in").rstrip("/")
+    NOMINATIM_BASE_URL = os.getenv("NOMINATIM_BASE_URL", "https://nominatim.openstreetmap.org").rstrip("/")
+    # Offline gazetteer: difflib ratio needed for a fuzzy place-name match (1.0 disables fuzzy)
+    GAZETTEER_FUZZY_CUTOFF = float(os.getenv("GAZETTEER_FUZZY_CUTOFF", 0.85))
+    # Network geocode cache (in-process LRU + Redis); failed lookups use the shorter negative TTL
+    GEOCODE_CACHE_PREFIX = os.getenv("GEOCODE_CACHE_PREFIX", "geocode")
+    GEOCODE_CACHE_TTL_S = int(os.getenv("GEOCODE_CACHE_TTL_S", 30 * 24 * 3600))
+    GEOCODE_NEGATIVE_TTL_S = int(os.getenv("GEOCODE_NEGATIVE_TTL_S", 3600))
+    GEOCODE_CACHE_SIZE = int(os.getenv("GEOCODE_CACHE_SIZE", 4096))
+    # Reverse geocoding for soil/mandi filters: optional district GeoJSON, grid cell and simplification (degrees),
+    # and max distance to the nearest gazetteer place when no polygon contains the point
+    DISTRICT_BOUNDARIES_PATH = os.getenv("DISTRICT_BOUNDARIES_PATH")
+    REVERSE_GEOCODE_GRID_DEG = float(os.getenv("REVERSE_GEOCODE_GRID_DEG", 0.25))
+    REVERSE_GEOCODE_SIMPLIFY_DEG = float(os.getenv("REVERSE_GEOCODE_SIMPLIFY_DEG", 0.002))
+    REVERSE_GEOCODE_MAX_KM = float(os.getenv("REVERSE_GEOCODE_MAX_KM", 75))
+    # Shared upstream HTTP clients: per-upstream timeout (s) and pool size, keep-alive and HTTP/2 (needs h2)
+    OWM_TIMEOUT_S = float(os.getenv("OWM_TIMEOUT_S", 20))
+    OWM_MAX_CONNECTIONS = int(os.getenv("OWM_MAX_CONNECTIONS", 50))
+    DATA_GOV_TIMEOUT_S = float(os.getenv("DATA_GOV_TIMEOUT_S", 20))
+    DATA_GOV_MAX_CONNECTIONS = int(os.getenv("DATA_GOV_MAX_CONNECTIONS", 20))
+    NOMINATIM_TIMEOUT_S = float(os.getenv("NOMINATIM_TIMEOUT_S", 10))
+    NOMINATIM_MAX_CONNECTIONS = int(os.getenv("NOMINATIM_MAX_CONNECTIONS", 2))
+    HTTP_KEEPALIVE_EXPIRY_S = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_S", 60))
+    HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+    # Weather cache: geohash tile size and per-endpoint TTLs; 401/404 endpoints are skipped for a day
+    WEATHER_CACHE_PREFIX = os.getenv("WEATHER_CACHE_PREFIX", "weather")
+    WEATHER_GEOHASH_PRECISION = int(os.getenv("WEATHER_GEOHASH_PRECISION", 5))
+    WEATHER_CURRENT_TTL_S = int(os.getenv("WEATHER_CURRENT_TTL_S", 600))
+    WEATHER_DAILY_TTL_S = int(os.getenv("WEATHER_DAILY_TTL_S", 3 * 3600))
+    WEATHER_CLIMATE_TTL_S = int(os.getenv("WEATHER_CLIMATE_TTL_S", 24 * 3600))
+    WEATHER_UNAVAILABLE_TTL_S = int(os.getenv("WEATHER_UNAVAILABLE_TTL_S", 24 * 3600))
+    # Paging for data.gov.in mirror syncs, and the Redis lock held by the syncing worker
+    DATAGOV_SYNC_PAGE_SIZE = int(os.getenv("DATAGOV_SYNC_PAGE_SIZE", 1000))
+    DATAGOV_SYNC_CONCURRENCY = int(os.getenv("DATAGOV_SYNC_CONCURRENCY", 4))
+    DATAGOV_SYNC_LOCK_TTL_S = int(os.getenv("DATAGOV_SYNC_LOCK_TTL_S", 1800))
+    # Local SQLite mirror of the data.gov.in mandi price resource, re-synced in the background
+    MANDI_MIRROR_ENABLED = os.getenv("MANDI_MIRROR_ENABLED", "true").lower() == "true"
+    MANDI_MIRROR_PATH = os.getenv("MANDI_MIRROR_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "mandi_mirror.sqlite"))
+    MANDI_SYNC_INTERVAL_S = int(os.getenv("MANDI_SYNC_INTERVAL_S", 3 * 3600))
+    MANDI_MIRROR_MAX_AGE_S = int(os.getenv("MANDI_MIRROR_MAX_AGE_S", 36 * 3600))  # older -> live API
+    MANDI_SYNC_MAX_ROWS = int(os.getenv("MANDI_SYNC_MAX_ROWS", 500000))
+    MANDI_FUZZY_CUTOFF = float(os.getenv("MANDI_FUZZY_CUTOFF", 0.8))
+    # Mandi analytics: rows considered per query and the radius for "best nearby" markets
+    MANDI_ANALYTICS_MAX_ROWS = int(os.getenv("MANDI_ANALYTICS_MAX_ROWS", 5000))
+    MANDI_NEARBY_RADIUS_KM = float(os.getenv("MANDI_NEARBY_RADIUS_KM", 100))
+    # Soil-moisture mirror: per-district aggregates rebuilt daily from the full resource
+    SOIL_MIRROR_ENABLED = os.getenv("SOIL_MIRROR_ENABLED", "true").lower() == "true"
+    SOIL_MIRROR_PATH = os.getenv("SOIL_MIRROR_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "soil_mirror.npz"))
+    SOIL_SYNC_INTERVAL_S = int(os.getenv("SOIL_SYNC_INTERVAL_S", 24 * 3600))
+    SOIL_MIRROR_MAX_AGE_S = int(os.getenv("SOIL_MIRROR_MAX_AGE_S", 7 * 24 * 3600))  # older -> live API
+    SOIL_SYNC_MAX_ROWS = int(os.getenv("SOIL_SYNC_MAX_ROWS", 3000000))
+    # Upstream circuit breakers: open after N consecutive failures, probe again after BREAKER_RESET_S
+    BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", 5))
+    BREAKER_RESET_S = float(os.getenv("BREAKER_RESET_S", 30))
+    # Hedged GETs: second request once the first outlives this percentile of recent latencies
+    HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "true").lower() == "true"
+    HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", 0.95))
+    HEDGE_MIN_DELAY_MS = int(os.getenv("HEDGE_MIN_DELAY_MS", 100))
+    HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", 20))
+    HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", 200))
+    # Last good result of each fetcher call, served when the fetch fails or its circuit is open
+    STALE_CACHE_PREFIX = os.getenv("STALE_CACHE_PREFIX", "stale")
+    STALE_CACHE_TTL_S = int(os.getenv("STALE_CACHE_TTL_S", 24 * 3600))
+    # Single-flight: identical concurrent fetcher calls share one upstream request, across workers via Redis
+    SINGLEFLIGHT_ENABLED = os.getenv("SINGLEFLIGHT_ENABLED", "true").lower() == "true"
+    SINGLEFLIGHT_LOCK_MS = int(os.getenv("SINGLEFLIGHT_LOCK_MS", 10000))
+    SINGLEFLIGHT_RESULT_TTL_S = int(os.getenv("SINGLEFLIGHT_RESULT_TTL_S", 5))
+    # Answer-prompt context budget in estimated tokens (0 = unlimited); per prompt key as "mandi=900,uv=600"
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 1500))
+    CONTEXT_TOKEN_BUDGETS = os.getenv("CONTEXT_TOKEN_BUDGETS", "mandi=1000,uv=800")
+    CONTEXT_CHARS_PER_TOKEN = float(os.getenv("CONTEXT_CHARS_PER_TOKEN", 3.5))
+    CONTEXT_PASSAGE_TOKENS = int(os.getenv("CONTEXT_PASSAGE_TOKENS", 120))
+    # Request deadline when the caller sends none (ms, 0 = none); stage shares of it, and the answer LLM's floor
+    DEADLINE_DEFAULT_MS = int(os.getenv("DEADLINE_DEFAULT_MS", 0))
+    DEADLINE_SHARES = os.getenv("DEADLINE_SHARES", "extraction=0.3,geocode=0.15,fetchers=0.45,retrieval=0.3,answer=0.45")
+    DEADLINE_MIN_ANSWER_S = float(os.getenv("DEADLINE_MIN_ANSWER_S", 3))
+    # Vector search depth and minimum relevance (0-1, 0 = none) for pipelines that declare no "retrieval"
+    RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", 4))
+    RETRIEVAL_SCORE_THRESHOLD = float(os.getenv("RETRIEVAL_SCORE_THRESHOLD", 0))
     OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
     AGRO_API_KEY = os.getenv("AGRO_API_KEY")
     DATA_GOV_API_KEY = os.getenv("DATA_GOV_API_KEY")
@@ -35,8 +140,21 @@ class Config:
         decode_responses=False
     )
     
+    # Async pool for request-path Redis work (answer cache etc.) so it never blocks the event loop
+    aredis_pool = aioredis.ConnectionPool(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        db=REDIS_DB,
+        max_connections=50,
+        decode_responses=False
+    )
+    
     @property
     def redis_client(self):
         return redis.Redis(connection_pool=self.redis_pool)
 
+    @property
+    def aredis_client(self):
+        return aioredis.Redis(connection_pool=self.aredis_pool)
+
 config = Config()
\ No newline at end of file
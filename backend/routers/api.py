@@ -1,11 +1,15 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 import logging
-from typing import Optional
+from typing import Any, List, Optional
 from datetime import datetime, timezone
 import json
-from api.pipeline_selector import plan_fetchers
-from .pipelines.common import run_multi_pipeline
+import asyncio
+from api import answer_cache, deadline, metrics
+from api.history import history_writer, read_recent
+from api.pipeline_selector import FetchPlan, RetrievalSpec, plan_fetchers, load_pipelines, embed_query, embed_queries
+from .pipelines.common import run_multi_pipeline, stream_multi_pipeline, retrieve_docs
 from config import config
 
 router = APIRouter()
@@ -16,49 +20,319 @@ class QueryRequest(BaseModel):
     transcription: Optional[str] = Field(default=None, description="Transcribed query text")
     query: Optional[str] = Field(default=None, description="Single query string")
     call_sid: str = Field(..., description="Unique Call SID for grouping history")
+    timings: bool = Field(default=False, description="Include per-stage timings (ms) in the response")
+    deadline_ms: Optional[int] = Field(
+        default=None,
+        ge=1,
+        description="How long the caller will wait (ms); stages share this budget, optional data is dropped when it runs short and the response lists the degraded stages",
+    )
+    lat: Optional[float] = Field(default=None, ge=-90, le=90, description="Caller latitude (used with lon over locations in the query text)")
+    lon: Optional[float] = Field(default=None, ge=-180, le=180, description="Caller longitude")
+    region: Optional[str] = Field(default=None, description="Caller region/city name, geocoded when lat/lon are absent")
+
+
+class BatchQueryRequest(BaseModel):
+    requests: List[QueryRequest] = Field(..., description="Queries to answer")
+    max_concurrency: Optional[int] = Field(default=None, ge=1, description="Queries processed at once (defaults to BATCH_MAX_CONCURRENCY)")
 
 
 # Pipeline endpoints live in routers/pipelines.py
 
 
-@router.post("/response")
-async def response(payload: QueryRequest):
+def _question_or_400(payload: QueryRequest) -> str:
     # Validate inputs (single query mode)
     question = payload.query or payload.transcription
     if not question:
         raise HTTPException(status_code=400, detail="Provide 'transcription' or 'query'")
+    return question
+
+
+def _location(payload: QueryRequest) -> dict[str, Any]:
+    return {"lat": payload.lat, "lon": payload.lon, "region": payload.region}
+
+
+def _cancel_all(tasks) -> None:
+    for t in tasks:
+        if t is None:
+            continue
+        if not t.done():
+            t.cancel()
+        elif not t.cancelled():
+            t.exception()  # mark a finished failure as retrieved; it is no longer needed
+
+
+async def _plan_and_lookup(
+    question: str,
+    *,
+    shared_fetches: Optional[dict] = None,
+    lat: Optional[float] = None,
+    lon: Optional[float] = None,
+    region: Optional[str] = None,
+):
+    """Plan fetchers while retrieval runs, then consult the answer cache.
+
+    Retrieval starts as soon as the planner has routed the query, and only if a
+    picked pipeline needs documents (``docs_task`` is None otherwise); fetchers
+    start inside the planner as soon as their inputs are known. On a cache hit (or
+    any failure) the speculative work is cancelled. ``lat``/``lon``/``region`` are
+    the caller's location from the request body.
+    Returns (plan, bucket, query_vec, cached, docs_task).
+    """
+    inflight: dict = {} if shared_fetches is None else shared_fetches
+    query_vec = None
+    try:
+        with metrics.stage("embedding"):
+            query_vec = await asyncio.to_thread(embed_query, question)
+    except Exception as e:
+        logger.warning("Query embedding failed: %s", e)
+    docs_task: Optional[asyncio.Future] = None
+
+    def start_retrieval(spec: Optional[RetrievalSpec]) -> None:
+        nonlocal docs_task
+        if spec is None:
+            logger.info("Retrieval skipped: picked pipelines need no documents")
+            return
+        docs_task = asyncio.ensure_future(
+            retrieve_docs(question, query_vec=query_vec, k=spec.k, score_threshold=spec.score_threshold)
+        )
 
     try:
         # Plan fetchers and prompt based on the query
-        fetchers, prompt_key, picked_ids = await plan_fetchers(question)
-        logger.info("Planned fetchers=%d picked=%s", len(fetchers), ",".join(picked_ids))
-        result = await run_multi_pipeline(question, prompt_key=prompt_key, fetchers=fetchers)
-        sim = 1.0
+        with metrics.stage("plan"):
+            plan = await plan_fetchers(
+                question, body_lat=lat, body_lon=lon, body_region=region, inflight=inflight, on_retrieval=start_retrieval,
+            )
+        logger.info("Planned fetchers=%d picked=%s", len(plan.fetchers), ",".join(plan.picked_ids))
+
+        # Semantic answer cache keyed by query embedding + resolved location/commodity/day
+        bucket = answer_cache.cache_bucket(
+            plan.picked_ids, lat=plan.lat, lon=plan.lon, region=plan.region, commodity=plan.commodity,
+            has_external_data=bool(plan.fetchers),
+        )
+        with metrics.stage("answer_cache_lookup"):
+            cached = await answer_cache.lookup(bucket, query_vec) if query_vec is not None else None
+    except BaseException:
+        # Batch-shared fetches stay alive for sibling queries; our own are cancelled
+        _cancel_all([docs_task, *(inflight.values() if shared_fetches is None else [])])
+        raise
+    if cached is not None:
+        logger.info("Answer cache hit (similarity=%.3f, cached query=%r)", cached.similarity, cached.query)
+        metrics.record_cache("hit")
+        _cancel_all([docs_task, *(inflight.values() if shared_fetches is None else [])])
+    else:
+        logger.info("Answer cache miss")
+        metrics.record_cache("miss")
+    return plan, bucket, query_vec, cached, docs_task
+
+
+async def _store_answer(plan: FetchPlan, bucket: str, question: str, query_vec, output_text: str) -> None:
+    if query_vec is None:
+        return
+    picked_defs = [p for p in load_pipelines() if p.id in plan.picked_ids]
+    ttl = answer_cache.cache_ttl(picked_defs, has_external_data=bool(plan.fetchers))
+    await answer_cache.store(bucket, question, query_vec, output_text, ttl)
+
+
+def _with_pipelines(d: dict[str, Any], picked_ids: list[str]) -> dict[str, Any]:
+    if len(picked_ids) > 1:
+        d["pipelines"] = picked_ids
+    else:
+        d["pipeline"] = picked_ids[0] if picked_ids else "unknown"
+    return d
+
+
+def _save_history(call_sid: str, question: str, output_text: str, sim: float, cache_status: str, picked_ids: list[str]) -> dict:
+    """Queue the interaction for the background history writer. Returns the record."""
+    rec = _with_pipelines({
+        "ts": datetime.now(timezone.utc).isoformat(),
+        "query": question,
+        "response": output_text,
+        "similarity": sim,
+        "cache": cache_status,
+    }, picked_ids)
+    history_writer.submit(call_sid, rec)
+    return rec
+
+
+async def _answer_query(
+    question: str,
+    call_sid: str,
+    *,
+    shared_fetches: Optional[dict] = None,
+    include_timings: bool = False,
+    deadline_ms: Optional[int] = None,
+    lat: Optional[float] = None,
+    lon: Optional[float] = None,
+    region: Optional[str] = None,
+) -> dict:
+    """Plan, serve from cache or run the pipeline, save history; returns the /response body.
+
+    ``shared_fetches`` lets batch callers share identical fetcher calls across queries.
+    ``include_timings`` adds a per-stage ``timings`` object (ms) to the body.
+    ``deadline_ms`` bounds the stages (see ``api.deadline``); the body then lists
+    the ``degraded`` stages. ``lat``/``lon``/``region`` locate the caller.
+    """
+    timings = metrics.start_timings() if include_timings else None
+    deadline.start(deadline_ms)
+    with metrics.stage("total"):
+        resp = await _answer_query_timed(question, call_sid, shared_fetches=shared_fetches, lat=lat, lon=lon, region=region)
+    if timings is not None:
+        resp["timings"] = dict(timings)
+    degraded = deadline.degraded()
+    if degraded is not None:
+        resp["degraded"] = degraded
+    return resp
+
+
+async def _answer_query_timed(question: str, call_sid: str, *, shared_fetches: Optional[dict] = None, **location: Any) -> dict:
+    plan, bucket, query_vec, cached, docs_task = await _plan_and_lookup(question, shared_fetches=shared_fetches, **location)
+    picked_ids = plan.picked_ids
+    if cached is not None:
+        cache_status = "hit"
+        output_text = cached.answer
+    else:
+        cache_status = "miss"
+        result = await run_multi_pipeline(
+            question, prompt_key=plan.prompt_key, fetchers=plan.fetchers, docs_task=docs_task, retrieve=plan.retrieval is not None,
+        )
         output_text = result.get("output") if isinstance(result, dict) else str(result)
-        logger.info("Generated output length: %d chars", len(output_text or ""))
+        # An answer missing data because of the deadline is not reused for others
+        if not deadline.degraded():
+            await _store_answer(plan, bucket, question, query_vec, output_text)
+    sim = 1.0
+    logger.info("Generated output length: %d chars", len(output_text or ""))
+
+    _save_history(call_sid, question, output_text, sim, cache_status, picked_ids)
+
+    resp = {"output": output_text, "similarity": sim, "call_sid": call_sid, "cache": cache_status}
+    return _with_pipelines(resp, picked_ids)
+
 
-        # Save interaction in Redis (non-fatal if it fails)
+@router.post("/response")
+async def response(payload: QueryRequest):
+    question = _question_or_400(payload)
+
+    try:
+        return await _answer_query(
+            question, payload.call_sid, include_timings=payload.timings, deadline_ms=payload.deadline_ms, **_location(payload),
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"RAG failed: {str(e)}")
+
+
+@router.post("/response/batch")
+async def response_batch(payload: BatchQueryRequest):
+    """Answer many queries in one call, streamed back as NDJSON in completion order.
+
+    All questions are embedded in one batched encoder pass, identical fetcher calls
+    (same weather lat/lon, same mandi filters) run once for the whole batch, and at
+    most ``max_concurrency`` queries are planned/answered at a time. Each line carries
+    the request ``index`` plus the usual /response body, or an ``error``.
+    """
+    items = payload.requests
+    if not items:
+        raise HTTPException(status_code=400, detail="Provide at least one request")
+    if len(items) > config.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch too large (max {config.BATCH_MAX_ITEMS})")
+
+    questions = [r.query or r.transcription for r in items]
+    try:
+        await asyncio.to_thread(embed_queries, [q for q in questions if q])
+    except Exception as e:
+        logger.warning("Batch query embedding failed; falling back to per-query encode: %s", e)
+
+    sem = asyncio.Semaphore(payload.max_concurrency or config.BATCH_MAX_CONCURRENCY)
+    shared_fetches: dict = {}
+
+    async def one(idx: int, req: QueryRequest, question: Optional[str]) -> dict:
+        if not question:
+            return {"index": idx, "call_sid": req.call_sid, "error": "Provide 'transcription' or 'query'"}
+        async with sem:
+            try:
+                resp = await _answer_query(
+                    question, req.call_sid, shared_fetches=shared_fetches, include_timings=req.timings, deadline_ms=req.deadline_ms,
+                    **_location(req),
+                )
+                return dict(resp, index=idx)
+            except Exception as e:
+                logger.error("Batch item %d failed: %s", idx, e)
+                return {"index": idx, "call_sid": req.call_sid, "error": f"RAG failed: {str(e)}"}
+
+    async def lines():
+        tasks = [asyncio.ensure_future(one(i, r, q)) for i, (r, q) in enumerate(zip(items, questions))]
         try:
-            rec = {
-                "ts": datetime.now(timezone.utc).isoformat(),
-                "query": question,
-                "response": output_text,
-                "similarity": sim,
-            }
-            if len(picked_ids) > 1:
-                rec["pipelines"] = picked_ids
+            for fut in asyncio.as_completed(tasks):
+                yield json.dumps(await fut, ensure_ascii=False) + "\n"
+        finally:
+            for t in [*tasks, *shared_fetches.values()]:
+                t.cancel()
+            logger.info("Batch of %d done; %d unique fetches shared", len(items), len(shared_fetches))
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post("/response/stream")
+async def response_stream(payload: QueryRequest):
+    """Server-sent-events variant of /response.
+
+    Emits ``plan`` (picked pipelines, prompt key, cache status) as soon as planning
+    finishes, then ``token`` events as the answer streams, then ``done`` with the
+    record written to ``call:{sid}:history`` (plus ``degraded`` under a deadline).
+    Failures after the stream has started are reported as an ``error`` event.
+    """
+    question = _question_or_400(payload)
+
+    async def events():
+        timings = metrics.start_timings() if payload.timings else None
+        deadline.start(payload.deadline_ms)
+        try:
+            plan, bucket, query_vec, cached, docs_task = await _plan_and_lookup(question, **_location(payload))
+            cache_status = "hit" if cached is not None else "miss"
+            yield _sse("plan", _with_pipelines({"prompt_key": plan.prompt_key, "cache": cache_status}, plan.picked_ids))
+
+            if cached is not None:
+                output_text = cached.answer
+                yield _sse("token", {"text": output_text})
             else:
-                rec["pipeline"] = picked_ids[0] if picked_ids else "unknown"
-            key = f"call:{payload.call_sid}:history"
-            config.redis_client.lpush(key, json.dumps(rec).encode("utf-8"))
+                chunks: list[str] = []
+                async for chunk in stream_multi_pipeline(
+                    question, prompt_key=plan.prompt_key, fetchers=plan.fetchers, docs_task=docs_task, retrieve=plan.retrieval is not None,
+                ):
+                    chunks.append(chunk)
+                    yield _sse("token", {"text": chunk})
+                output_text = "".join(chunks)
+                if not deadline.degraded():
+                    await _store_answer(plan, bucket, question, query_vec, output_text)
+            logger.info("Streamed output length: %d chars", len(output_text or ""))
+
+            rec = _save_history(payload.call_sid, question, output_text, 1.0, cache_status, plan.picked_ids)
+            done = dict(rec, call_sid=payload.call_sid)
+            if timings is not None:
+                done["timings"] = dict(timings)
+            degraded = deadline.degraded()
+            if degraded is not None:
+                done["degraded"] = degraded
+            yield _sse("done", done)
         except Exception as e:
-            logger.error("Redis save failed for %s: %s", payload.call_sid, e)
-
-        resp = {"output": output_text, "similarity": sim, "call_sid": payload.call_sid}
-        if len(picked_ids) > 1:
-            resp["pipelines"] = picked_ids
-        else:
-            resp["pipeline"] = picked_ids[0] if picked_ids else "unknown"
-        return resp
+            logger.error("Streaming RAG failed for %s: %s", payload.call_sid, e)
+            yield _sse("error", {"detail": f"RAG failed: {str(e)}", "call_sid": payload.call_sid})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/history/{call_sid}")
+async def history(call_sid: str, n: int = Query(default=10, ge=1, le=200, description="Most recent turns to return")):
+    """Most recent turns for a session, newest first."""
+    try:
+        turns = await read_recent(call_sid, n)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"RAG failed: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=503, detail=f"History unavailable: {str(e)}")
+    return {"call_sid": call_sid, "turns": turns}
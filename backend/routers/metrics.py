@@ -0,0 +1,18 @@
+from fastapi import APIRouter, Response
+
+from api.metrics import render_latest
+from api.resilience import breaker_states
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+async def metrics():
+    payload, content_type = render_latest()
+    return Response(content=payload, media_type=content_type)
+
+
+@router.get("/upstreams")
+async def upstreams():
+    """Circuit breaker state and recent latency per upstream (this worker)."""
+    return breaker_states()
@@ -1,236 +1,400 @@
 import logging
-from typing import Callable, Any
+from typing import AsyncIterator, Callable, Any
 
-from api.common import run_chain, get_prompt_template, format_docs
+from api import deadline, metrics
+from api.common import arun_chain, astream_chain, get_prompt_template
+from api.context_builder import build_context
+from api.fetcher_registry import fetcher_for
+from api.payloads import CurrentWeather
+from api.resilience import load_stale, remember_result
+from api.singleflight import coalesce
+from config import config
 from ..retrieval import get_vector_store
 
 logger = logging.getLogger("pipelines.common")
 
 
-_PROMPT_KEY_CACHE: dict[str, str] | None = None
-
+def summarize_external_data(external_data: dict[str, Any] | None) -> str:
+    sections = external_data_sections(external_data)
+    return "\n".join(text for _, text in sections) if sections else "No external data available."
 
-def get_prompt_key_for_pipeline(pipeline_id: str, default: str = "general") -> str:
-    global _PROMPT_KEY_CACHE
-    if _PROMPT_KEY_CACHE is None:
-        try:
-            import os, json
-            # backend/routers -> backend/api/pipelines.json
-            routers_dir = os.path.dirname(os.path.dirname(__file__))
-            pipelines_path = os.path.normpath(os.path.join(routers_dir, "..", "api", "pipelines.json"))
-            with open(pipelines_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            _PROMPT_KEY_CACHE = {str(item.get("id")): str(item.get("prompt_key")) for item in data if item.get("id")}
-        except Exception:
-            _PROMPT_KEY_CACHE = {}
-    return _PROMPT_KEY_CACHE.get(pipeline_id, default)
 
+def external_data_sections(external_data: dict[str, Any] | None) -> list[tuple[str, str]]:
+    """Summary of the merged fetcher outputs as (section name, text) pairs, in display order.
 
-def summarize_external_data(external_data: dict[str, Any] | None) -> str:
+    Names (weather, forecast, climate, soil, mandi, stale_note) let the context
+    builder rank and drop whole sections.
+    """
     if not external_data:
-        return "No external data available."
-
-    parts: list[str] = []
-
-    # Weather summary (metric units if available)
-    if "today_weather" in external_data:
-        w = external_data["today_weather"] or {}
-        temp = w.get("main", {}).get("temp")
-        hum = w.get("main", {}).get("humidity")
-        clouds = (w.get("clouds", {}) or {}).get("all")
-        wind = (w.get("wind", {}) or {}).get("speed")
-        # OpenWeather units are metric when requested; prefer °C and m/s
-        parts.append(
-            f"Current Weather → Temp: {temp}°C, Humidity: {hum}%, Clouds: {clouds}%, Wind: {wind} m/s."
-        )
+        return []
 
-    # Forecast summary (optional shape: list of entries with 'dt','main','rain')
-    if isinstance(external_data.get("forecast"), list):
-        try:
-            from datetime import datetime
-
-            forecast_days: dict[str, dict] = {}
-            for entry in external_data["forecast"]:
-                ts = entry.get("dt")
-                if not ts:
-                    continue
-                day = datetime.utcfromtimestamp(ts).strftime("%Y-%m-%d")
-                main = entry.get("main", {})
-                # OpenWeather daily 16 endpoint shape has entry.temp {min,max,day}
-                temp_block = entry.get("temp") or {}
-                if temp_block and not main:
-                    # Map to main-like fields for summarization
-                    main = {"temp_min": temp_block.get("min"), "temp_max": temp_block.get("max"), "temp": temp_block.get("day")}
-                rain_field = entry.get("rain")
-                if isinstance(rain_field, dict):
-                    rain = (rain_field or {}).get("3h", 0)
-                elif isinstance(rain_field, (int, float)):
-                    rain = rain_field
-                else:
-                    rain = 0
-                forecast_days.setdefault(day, {"temps": [], "rain_total": 0})
-                forecast_days[day]["temps"].append(main.get("temp") or temp_block.get("day"))
-                forecast_days[day]["rain_total"] += rain
-
-            compact: list[str] = []
-            for day, vals in list(forecast_days.items())[:5]:
-                temps = [t for t in vals["temps"] if t is not None]
-                tmin = min(temps) if temps else None
-                tmax = max(temps) if temps else None
-                compact.append(f"{day}: Tmin={tmin}°C, Tmax={tmax}°C, Rain={vals['rain_total']}mm")
-            if compact:
-                parts.append("Forecast (next days): " + "; ".join(compact))
-        except Exception:
-            pass
-
-    # Climate 30-day summary (if available from OpenWeather)
-    c30 = external_data.get("climate_30d") if isinstance(external_data, dict) else None
-    try:
-        if c30:
-            lst = c30.get("list", c30 if isinstance(c30, list) else [])
-            if isinstance(lst, list) and lst:
-                # Summarize first few days
-                out = []
-                for it in lst[:5]:
-                    # Try daily-like shape with temp averages
-                    dt = it.get("dt") or it.get("time")
-                    main = it.get("temp") or it.get("main") or {}
-                    tmin = main.get("min") or main.get("temp_min")
-                    tmax = main.get("max") or main.get("temp_max")
-                    if dt and (tmin is not None or tmax is not None):
-                        from datetime import datetime
-                        day = datetime.utcfromtimestamp(dt).strftime("%Y-%m-%d") if isinstance(dt, (int, float)) else str(dt)
-                        out.append(f"{day}: Tmin={tmin}°C Tmax={tmax}°C")
-                if out:
-                    parts.append("Climate outlook (30d sample): " + "; ".join(out))
-    except Exception:
-        pass
-
-    # Soil summary (data.gov.in soil moisture records)
-    soil_records = external_data.get("soil_records") if isinstance(external_data, dict) else None
-    if isinstance(soil_records, list) and soil_records:
+    parts: list[tuple[str, str]] = []
+
+    # Weather summary (OpenWeather is requested in metric units: °C and m/s)
+    w = external_data.get("today_weather")
+    if isinstance(w, CurrentWeather):
+        parts.append((
+            "weather",
+            f"Current Weather → Temp: {w.temp}°C, Humidity: {w.humidity}%, Clouds: {w.clouds}%, Wind: {w.wind_speed} m/s.",
+        ))
+
+    # Forecast summary: daily entries, or 3-hourly ones folded into days
+    forecast = external_data.get("forecast")
+    if isinstance(forecast, list) and forecast:
+        forecast_days: dict[str, dict] = {}
+        for entry in forecast:
+            day = forecast_days.setdefault(entry.day, {"lows": [], "highs": [], "rain_total": 0.0})
+            low = entry.temp_min if entry.temp_min is not None else entry.temp_day
+            high = entry.temp_max if entry.temp_max is not None else entry.temp_day
+            if low is not None:
+                day["lows"].append(low)
+            if high is not None:
+                day["highs"].append(high)
+            day["rain_total"] += entry.rain_mm
+        compact: list[str] = []
+        for day, vals in list(forecast_days.items())[:5]:
+            tmin = min(vals["lows"]) if vals["lows"] else None
+            tmax = max(vals["highs"]) if vals["highs"] else None
+            compact.append(f"{day}: Tmin={tmin}°C, Tmax={tmax}°C, Rain={round(vals['rain_total'], 1)}mm")
+        parts.append(("forecast", "Forecast (next days): " + "; ".join(compact)))
+
+    # Climate 30-day summary (first few days)
+    c30 = external_data.get("climate_30d")
+    if isinstance(c30, list) and c30:
+        out = [f"{it.day}: Tmin={it.temp_min}°C Tmax={it.temp_max}°C" for it in c30[:5]]
+        parts.append(("climate", "Climate outlook (30d sample): " + "; ".join(out)))
+
+    # Soil summary (per-district soil moisture aggregates)
+    soil_summary = external_data.get("soil_summary")
+    if isinstance(soil_summary, list) and soil_summary:
         lines: list[str] = []
-        for rec in soil_records[:5]:
-            st = rec.get("State")
-            dist = rec.get("District")
-            date = rec.get("Date")
-            sm = rec.get("Avg_smlvl_at15cm")
-            agency = rec.get("Agency_name")
-            loc = ", ".join([p for p in [dist, st] if p])
-            lines.append(f"{date} — {loc}: Soil moisture at 15cm = {sm} (agency: {agency})")
-        total = external_data.get("total") or len(soil_records)
-        parts.append("Soil moisture (sample):\n" + "\n".join(lines) + f"\nTotal records: {total}; showing {min(len(soil_records), 5)}")
-
-    # Mandi price summary (data.gov.in commodity prices)
-    mandi_records = external_data.get("mandi_records") if isinstance(external_data, dict) else None
-    if isinstance(mandi_records, list) and mandi_records:
+        for row in soil_summary[:5]:
+            loc = ", ".join([p for p in [row.district, row.state] if p])
+            fields = [f"latest {row.latest} on {row.latest_date}"]
+            if row.mean_7d is not None:
+                fields.append(f"7d mean {row.mean_7d}")
+            if row.mean_30d is not None:
+                fields.append(f"30d mean {row.mean_30d}")
+            if row.trend_per_day is not None:
+                fields.append(f"trend {row.trend_per_day:+}/day")
+            if row.anomaly is not None:
+                fields.append(f"{row.anomaly:+} vs seasonal norm {row.seasonal_norm}")
+            lines.append(f"{loc}: " + ", ".join(fields))
+        parts.append(("soil", "Soil moisture at 15cm (district summary):\n" + "\n".join(lines)))
+
+    # Mandi price summary: the precomputed per-market table when available, raw rows otherwise
+    mandi_analytics = external_data.get("mandi_analytics")
+    mandi_records = external_data.get("mandi_records")
+    if isinstance(mandi_analytics, dict) and mandi_analytics.get("markets"):
+        parts.append(("mandi", format_mandi_analytics(mandi_analytics)))
+    elif isinstance(mandi_records, list) and mandi_records:
         max_items = 5
         lines: list[str] = []
         for rec in mandi_records[:max_items]:
-            market = rec.get("market") or rec.get("Market")
-            district = rec.get("district") or rec.get("District")
-            state = rec.get("state") or rec.get("State")
-            commodity = rec.get("commodity") or rec.get("Commodity")
-            variety = rec.get("variety") or rec.get("Variety")
-            grade = rec.get("grade") or rec.get("Grade")
-            modal = rec.get("modal_price") or rec.get("modal_price (Rs/quintal)") or rec.get("modal")
-            min_p = rec.get("min_price") or rec.get("min")
-            max_p = rec.get("max_price") or rec.get("max")
-            date = rec.get("arrival_date") or rec.get("date")
-            # Build a compact line
-            loc = ", ".join([p for p in [market, district, state] if p])
-            prod = " / ".join([p for p in [commodity, variety, grade] if p])
-            price = f"Modal {modal} (min {min_p}, max {max_p})" if modal or min_p or max_p else "Price N/A"
-            when = f" on {date}" if date else ""
+            loc = ", ".join([p for p in [rec.market, rec.district, rec.state] if p])
+            prod = " / ".join([p for p in [rec.commodity, rec.variety, rec.grade] if p])
+            if any(v is not None for v in (rec.modal_price, rec.min_price, rec.max_price)):
+                price = f"Modal {_price(rec.modal_price)} (min {_price(rec.min_price)}, max {_price(rec.max_price)})"
+            else:
+                price = "Price N/A"
+            when = f" on {rec.arrival_date}" if rec.arrival_date else ""
             lines.append(f"{loc} — {prod}: {price}{when}")
         total = external_data.get("total") or len(mandi_records)
-        parts.append("Mandi Prices (sample):\n" + "\n".join(lines) + f"\nTotal records: {total}; showing {min(len(mandi_records), max_items)}")
+        parts.append(("mandi", "Mandi Prices (sample):\n" + "\n".join(lines) + f"\nTotal records: {total}; showing {min(len(mandi_records), max_items)}"))
 
-    return "\n".join(parts) if parts else "No external data available."
+    stale_age = external_data.get("stale_age_s")
+    if parts and isinstance(stale_age, (int, float)):
+        parts.append(("stale_note", f"Note: some of this data is from a cached copy about {max(1, int(stale_age) // 60)} min old (live source unavailable)."))
 
+    return parts
 
-async def run_pipeline(
-    question: str,
-    *,
-    prompt_key: str,
-    external_fetcher: Callable[..., Any] | None = None,
-    fetcher_args: dict[str, Any] | None = None,
-) -> dict:
-    # Step 1: external API data
-    external_data = None
-    if external_fetcher:
+
+def _price(value: float | None) -> str:
+    if value is None:
+        return "-"
+    return str(int(value)) if float(value).is_integer() else str(value)
+
+
+def format_mandi_analytics(analytics: dict[str, Any]) -> str:
+    """Render ``mandi_analytics`` as a compact table (Rs/quintal)."""
+    def fmt(v: Any, suffix: str = "", signed: bool = False) -> str:
+        if v is None:
+            return "-"
+        return (f"{v:+}" if signed else f"{v}") + suffix
+
+    def line(row: dict[str, Any]) -> str:
+        loc = ", ".join([p for p in [row.get("market"), row.get("district")] if p])
+        dist = f" ({row['distance_km']} km)" if row.get("distance_km") is not None else ""
+        return (
+            f"{loc}{dist} | {row.get('commodity') or '-'} | {fmt(row.get('modal'))} on {row.get('date')} | "
+            f"{fmt(row.get('dod'), signed=True)} | {fmt(row.get('wow_pct'), '%', signed=True)} | "
+            f"{fmt(row.get('median'))} ({fmt(row.get('p25'))}-{fmt(row.get('p75'))}) | {fmt(row.get('spread'))}"
+        )
+
+    overall = analytics.get("overall") or {}
+    lines = [
+        f"Mandi prices (Rs/quintal; {analytics.get('records')} records from {analytics.get('markets_total')} markets, as of {analytics.get('as_of')}; "
+        f"latest modal across markets: median {fmt(overall.get('median'))}, p25 {fmt(overall.get('p25'))}, p75 {fmt(overall.get('p75'))}):",
+        "market | commodity | latest modal | day-on-day | week-on-week | median (p25-p75) | min-max spread",
+    ]
+    lines.extend(line(r) for r in analytics.get("markets") or [])
+    nearby = analytics.get("best_nearby") or []
+    if nearby and (analytics.get("markets_total") or 0) > 1:
+        lines.append(f"Best-paying markets within {analytics.get('radius_km'):g} km:")
+        lines.extend(line(r) for r in nearby)
+    return "\n".join(lines)
+
+
+async def gather_external_data(fetchers: list[tuple[Callable[..., Any], dict]]) -> dict[str, Any]:
+    """Run fetchers concurrently and merge their dict outputs; failures are logged and skipped.
+
+    Under a request deadline, fetchers still running when the fetch budget ends are
+    cancelled and reported as degraded.
+    """
+    import asyncio
+
+    external_data: dict[str, Any] = {}
+    if not fetchers:
+        return external_data
+    logger.info("Running %d external fetchers", len(fetchers))
+    tasks = [asyncio.ensure_future(f(**args) if f is _await_shared else run_fetcher(f, args)) for f, args in fetchers]
+    timeout = deadline.stage_timeout("fetchers")
+    try:
+        if timeout is not None:
+            # Past the request's fetch budget, answer without what is still outstanding;
+            # the grace lets run_fetcher fall back to stale data first
+            _, pending = await asyncio.wait(tasks, timeout=timeout + 0.25)
+            for (f, args), task in zip(fetchers, tasks):
+                if task in pending:
+                    task.cancel()
+                    deadline.mark_degraded(f"fetcher:{args.get('name') if f is _await_shared else f.__name__}")
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+    except asyncio.CancelledError:
+        for task in tasks:
+            task.cancel()
+        raise
+    for idx, res in enumerate(results):
+        if isinstance(res, asyncio.CancelledError):
+            continue  # cut off by the deadline (already reported)
+        if isinstance(res, BaseException):
+            logger.error("Fetcher[%d] error: %s", idx, res or type(res).__name__)
+            continue
+        if isinstance(res, dict):
+            external_data.update(res)
+    logger.info("Merged external keys: %s", ",".join(sorted(list(external_data.keys()))))
+    return external_data
+
+
+def fetch_key(fn: Callable[..., Any], args: dict) -> tuple:
+    """Identity of a fetcher call: same function and same (normalized) arguments."""
+    import json
+    return (fn.__module__, fn.__qualname__, json.dumps(args, sort_keys=True, default=str))
+
+
+async def run_fetcher(fn: Callable[..., Any], args: dict) -> Any:
+    """Call one fetcher, recording its latency and failures in metrics.
+
+    The fetcher's declaration in pipelines.json (if any) sets its timeout, whether
+    concurrent identical calls (here or in other workers) share one upstream call,
+    and how long its results stay in the stale cache. A failed or timed-out call
+    (including an open circuit) returns the last good result for the same
+    arguments from the stale cache, when there is one.
+    """
+    import asyncio
+
+    name = getattr(fn, "__name__", "fetcher")
+    call_key = "|".join(fetch_key(fn, args))
+    fdef = fetcher_for(fn)
+    use_stale = fdef is None or fdef.stale_ttl_s != 0
+    limit = fdef.timeout_s if fdef is not None else None
+    # The request deadline may leave less time than the fetcher's own timeout
+    timeout = deadline.stage_timeout("fetchers", limit)
+    with metrics.stage(name):
         try:
-            external_data = await external_fetcher(**(fetcher_args or {}))
+            call = coalesce(name, args, lambda: fn(**args)) if fdef is None or fdef.singleflight else fn(**args)
+            result = await asyncio.wait_for(call, timeout)
         except Exception as e:
-            logger.error(f"External fetch failed: {e}")
-            external_data = None
+            metrics.record_fetcher_error(name)
+            if isinstance(e, asyncio.TimeoutError) and timeout is not None and (limit is None or timeout < limit):
+                deadline.mark_degraded(f"fetcher:{name}")
+            stale = await load_stale(call_key) if use_stale else None
+            if stale is None:
+                raise
+            metrics.record_stale_served(name)
+            logger.warning("%s failed (%s); serving result from %d s ago", name, e, stale["stale_age_s"])
+            return stale
+    if use_stale:
+        await remember_result(call_key, result, fdef.stale_ttl_s if fdef is not None else None)
+    return result
+
+
+async def _await_shared(task: "asyncio.Future", name: str = "fetcher") -> Any:
+    import asyncio
+    # Shield so one cancelled consumer does not cancel the fetch for everyone else
+    return await asyncio.shield(task)
+
+
+def dedupe_fetchers(
+    fetchers: list[tuple[Callable[..., Any], dict]],
+    inflight: dict[tuple, Any],
+) -> list[tuple[Callable[..., Any], dict]]:
+    """Rewrite fetchers so identical calls share one task stored in ``inflight``.
+
+    Used by batch processing: the first query to need e.g. weather at a given
+    lat/lon starts the fetch, later queries await the same result.
+    """
+    import asyncio
+
+    shared: list[tuple[Callable[..., Any], dict]] = []
+    for fn, args in fetchers:
+        key = fetch_key(fn, args)
+        task = inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(run_fetcher(fn, args))
+            inflight[key] = task
+        else:
+            logger.debug("Reusing in-flight fetch %s", key[1])
+        shared.append((_await_shared, {"task": task, "name": getattr(fn, "__name__", "fetcher")}))
+    return shared
 
-    # Step 2: retrieve docs
+
+def _retriever_kwargs(k: int, score_threshold: float | None) -> dict[str, Any]:
+    if score_threshold is None:
+        return {"search_kwargs": {"k": k}}
+    return {"search_type": "similarity_score_threshold", "search_kwargs": {"k": k, "score_threshold": score_threshold}}
+
+
+def _search_by_vector(vector_store: Any, embedding: list[float], k: int, score_threshold: float | None) -> list:
+    if score_threshold is None:
+        return vector_store.similarity_search_by_vector(embedding, k=k)
+    # Scores are cosine distances (the index default); relevance is 1 - distance, as for the text retriever
+    hits = vector_store.similarity_search_with_score_by_vector(embedding, k=k)
+    return [doc for doc, distance in hits if 1.0 - float(distance) >= score_threshold]
+
+
+async def retrieve_docs(
+    question: str,
+    *,
+    query_vec: Any = None,
+    k: int | None = None,
+    score_threshold: float | None = None,
+) -> list:
+    """Vector search for the question; reuses ``query_vec`` when the caller already embedded it.
+
+    ``k`` defaults to ``RETRIEVAL_K``; docs below ``score_threshold`` relevance (0-1) are dropped.
+    """
+    import asyncio
+
+    k = k or config.RETRIEVAL_K
     vector_store = get_vector_store()
-    retriever = vector_store.as_retriever(search_kwargs={"k": 4, "score_threshold": 0.6})
-    docs = retriever.get_relevant_documents(question)
-    docs_context = format_docs(docs)
-    logger.debug("Retrieved %d docs for single pipeline run", len(docs) if hasattr(docs, "__len__") else -1)
+    with metrics.stage("vector_search"):
+        if query_vec is not None:
+            embedding = [float(x) for x in query_vec]
+            docs = await asyncio.to_thread(_search_by_vector, vector_store, embedding, k, score_threshold)
+        else:
+            retriever = vector_store.as_retriever(**_retriever_kwargs(k, score_threshold))
+            docs = await retriever.ainvoke(question)
+    logger.info("Retrieved %d docs for multi-run", len(docs) if hasattr(docs, "__len__") else -1)
+    return docs
 
-    # Step 3: build context (use summarized external data)
-    external_text = summarize_external_data(external_data)
-    full_context = f"External Data:\n{external_text}\n\nRelevant Docs:\n{docs_context}"
 
-    # Step 4: LLM
-    prompt = get_prompt_template(prompt_key)
-    answer = run_chain(prompt, {"context": full_context, "question": question})
+def build_full_context(
+    external_data: dict[str, Any] | None,
+    docs: list,
+    *,
+    question: str = "",
+    prompt_key: str = "general",
+) -> str:
+    """Answer-prompt context, ranked and trimmed to the prompt key's token budget."""
+    with metrics.stage("build_context"):
+        return build_context(
+            question,
+            prompt_key,
+            external_data_sections(external_data),
+            [doc.page_content for doc in docs],
+        )
 
-    return {
-        "output": answer,
-        "external_data": external_data,
-        "prompt_key": prompt_key,
-    }
+
+async def prepare_multi_pipeline(
+    question: str,
+    *,
+    prompt_key: str = "general",
+    fetchers: list[tuple[Callable[..., Any], dict]],
+    query_vec: Any = None,
+    docs_task: "asyncio.Future | None" = None,
+    retrieve: bool = True,
+) -> tuple[str, dict[str, Any]]:
+    """Fetch external data and retrieve docs concurrently; returns (full_context, external_data).
+
+    ``docs_task`` is an already-running retrieval (started early by the caller).
+    With ``retrieve=False`` and no ``docs_task`` (no picked pipeline needs
+    documents) the vector search is skipped and the context has external data only.
+    """
+    import asyncio
+
+    if docs_task is None and retrieve:
+        docs_task = asyncio.ensure_future(retrieve_docs(question, query_vec=query_vec))
+    try:
+        external_data = await gather_external_data(fetchers)
+        # Docs are optional context: past the retrieval budget, answer without them
+        docs = await deadline.bounded("retrieval", docs_task, []) if docs_task is not None else []
+    except BaseException:
+        if docs_task is not None:
+            docs_task.cancel()
+        raise
+    full_context = build_full_context(external_data, docs, question=question, prompt_key=prompt_key)
+    logger.debug("Built full context for multi-run (%d chars)", len(full_context))
+    return full_context, external_data
 
 
 async def run_multi_pipeline(
     question: str,
     *,
     prompt_key: str,
-    fetchers: list[tuple[Callable[..., Any], dict]]
+    fetchers: list[tuple[Callable[..., Any], dict]],
+    query_vec: Any = None,
+    docs_task: "asyncio.Future | None" = None,
+    retrieve: bool = True,
 ) -> dict:
     """Run multiple external fetchers, merge their dict outputs, then a single LLM call.
     - fetchers: list of (callable, args_dict)
+    - query_vec: optional precomputed query embedding reused for retrieval
+    - docs_task: optional retrieval already started by the caller
+    - retrieve: False skips the vector search when no docs_task is given
     """
-    import asyncio
-
     import time
     t0 = time.monotonic()
-    external_data: dict[str, Any] = {}
-    if fetchers:
-        logger.info("Running %d external fetchers", len(fetchers))
-        tasks = [f(**args) for f, args in fetchers]
-        try:
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-        except Exception as e:
-            logger.error("One or more external fetchers failed to start: %s", e)
-            results = []
-        for idx, res in enumerate(results):
-            if isinstance(res, Exception):
-                logger.error("Fetcher[%d] error: %s", idx, res)
-                continue
-            if isinstance(res, dict):
-                external_data.update(res)
-        logger.info("Merged external keys: %s", ",".join(sorted(list(external_data.keys()))))
-
-    vector_store = get_vector_store()
-    retriever = vector_store.as_retriever(search_kwargs={"k": 4, "score_threshold": 0.6})
-    docs = retriever.get_relevant_documents(question)
-    docs_context = format_docs(docs)
-    logger.info("Retrieved %d docs for multi-run", len(docs) if hasattr(docs, "__len__") else -1)
-
-    external_text = summarize_external_data(external_data)
-    full_context = f"External Data:\n{external_text}\n\nRelevant Docs:\n{docs_context}"
-    logger.debug("Built full context for multi-run (%d chars)", len(full_context))
+    full_context, external_data = await prepare_multi_pipeline(question, prompt_key=prompt_key, fetchers=fetchers, query_vec=query_vec, docs_task=docs_task, retrieve=retrieve)
     prompt = get_prompt_template(prompt_key)
-    answer = run_chain(prompt, {"context": full_context, "question": question})
+    with metrics.stage("answer_llm"):
+        answer = await arun_chain(prompt, {"context": full_context, "question": question}, timeout=deadline.stage_timeout("answer"))
     logger.info("Multi-run pipeline total time: %d ms", int((time.monotonic() - t0) * 1000))
     return {
         "output": answer,
         "external_data": external_data,
         "prompt_key": prompt_key,
     }
+
+
+async def stream_multi_pipeline(
+    question: str,
+    *,
+    prompt_key: str,
+    fetchers: list[tuple[Callable[..., Any], dict]],
+    query_vec: Any = None,
+    docs_task: "asyncio.Future | None" = None,
+    retrieve: bool = True,
+) -> AsyncIterator[str]:
+    """Streaming variant of run_multi_pipeline: yields answer chunks as the LLM produces them."""
+    import time
+    t0 = time.monotonic()
+    full_context, _ = await prepare_multi_pipeline(question, prompt_key=prompt_key, fetchers=fetchers, query_vec=query_vec, docs_task=docs_task, retrieve=retrieve)
+    prompt = get_prompt_template(prompt_key)
+    first = True
+    with metrics.stage("answer_llm"):
+        async for chunk in astream_chain(prompt, {"context": full_context, "question": question}, timeout=deadline.stage_timeout("answer")):
+            if first:
+                logger.info("Multi-run stream first token after %d ms", int((time.monotonic() - t0) * 1000))
+                first = False
+            yield chunk
+    logger.info("Multi-run stream total time: %d ms", int((time.monotonic() - t0) * 1000))
@@ -1,22 +1,24 @@
 import logging
 from typing import Any, Optional
 import json
-import httpx
 
-from .common import run_pipeline, get_prompt_key_for_pipeline
-from api.common import run_chain
+from api import metrics
+from api.common import arun_chain
 from langchain.prompts import PromptTemplate
 from config import config
+from api.resilience import upstream_get
+from api import mandi_analytics, mandi_mirror, payloads
 
 logger = logging.getLogger("pipelines.mandi")
 
-DATA_GOV_RESOURCE_URL = "https://api.data.gov.in/resource/9ef84268-d588-465a-a308-a864a43d0070"
+DATA_GOV_RESOURCE_URL = f"{config.DATA_GOV_BASE_URL}/resource/{mandi_mirror.MANDI_RESOURCE_ID}"
 
 
 __all__ = [
     "fetch_mandi_data",
-    "run_mandi_pipeline",
     "fetch_mandi_data_from_query",
+    "normalize_mandi_filters",
+    "mandi_fetch_args",
 ]
 
 
@@ -30,13 +32,32 @@ async def fetch_mandi_data(
     grade: Optional[str] = None,
     limit: int = 10,
     offset: int = 0,
+    lat: Optional[float] = None,
+    lon: Optional[float] = None,
 ) -> dict[str, Any]:
+    """Mandi price rows (``MandiRecord``) plus ``mandi_analytics``, a precomputed per-market price table.
+
+    ``lat``/``lon`` (the caller's location, when known) rank nearby markets;
+    otherwise the market or district named in the filters is used.
+    """
     import time
     start = time.monotonic()
     logger.info(
         "[mandi] fetch start state=%s district=%s market=%s commodity=%s variety=%s grade=%s limit=%s offset=%s",
         state, district, market, commodity, variety, grade, limit, offset,
     )
+    filters = {"state": state, "district": district, "market": market, "commodity": commodity, "variety": variety, "grade": grade}
+    mirrored = await mandi_mirror.query(filters, limit=limit, offset=offset)
+    if mirrored is not None:
+        # Analytics see every market trading the commodity in the state, not just the requested page
+        pool_filters = {"state": state, "commodity": commodity, "variety": variety, "grade": grade} if commodity else filters
+        pool = await mandi_mirror.query(pool_filters, limit=config.MANDI_ANALYTICS_MAX_ROWS)
+        _attach_analytics(mirrored, (pool or mirrored)["mandi_records"], filters, lat, lon)
+        dur_ms = int((time.monotonic() - start) * 1000)
+        logger.info("[mandi] mirror hit in %d ms; records=%d total=%d", dur_ms, len(mirrored["mandi_records"]), mirrored["total"])
+        return mirrored
+    # Mirror missing or stale: query data.gov.in directly
+    metrics.record_fallback("mandi_live")
     api_key = config.DATA_GOV_API_KEY
     params: dict[str, Any] = {
         "api-key": api_key,
@@ -56,17 +77,41 @@ async def fetch_mandi_data(
     add_filter("variety", variety)
     add_filter("grade", grade)
 
-    async with httpx.AsyncClient(timeout=20) as client:
-        resp = await client.get(DATA_GOV_RESOURCE_URL, params=params)
-        if resp.status_code != 200:
-            logger.error(f"Mandi API failed: {resp.status_code} {resp.text}")
-            raise RuntimeError("Failed to fetch mandi prices")
-        data = resp.json()
-        records = data.get("records") or []
-        total = data.get("total") or len(records)
-        dur_ms = int((time.monotonic() - start) * 1000)
-        logger.info("[mandi] fetch done in %d ms; records=%d total=%d", dur_ms, len(records), total)
-        return {"mandi_records": records, "total": total}
+    resp = await upstream_get("datagov", DATA_GOV_RESOURCE_URL, params=params)
+    if resp.status_code != 200:
+        logger.error(f"Mandi API failed: {resp.status_code} {resp.text}")
+        raise RuntimeError("Failed to fetch mandi prices")
+    data = resp.json()
+    records = [payloads.project_mandi(r) for r in data.get("records") or [] if isinstance(r, dict)]
+    total = data.get("total") or len(records)
+    out = {"mandi_records": records, "total": total}
+    _attach_analytics(out, records, filters, lat, lon)
+    dur_ms = int((time.monotonic() - start) * 1000)
+    logger.info("[mandi] fetch done in %d ms; records=%d total=%d", dur_ms, len(records), total)
+    return out
+
+
+def _attach_analytics(
+    out: dict[str, Any],
+    records: list[payloads.MandiRecord],
+    filters: dict[str, Optional[str]],
+    lat: Optional[float],
+    lon: Optional[float],
+) -> None:
+    if lat is not None and lon is not None:
+        origin = (float(lat), float(lon))
+    elif filters.get("market") or filters.get("district"):
+        origin = mandi_analytics.market_coords(filters.get("market") or "", filters.get("district") or "", filters.get("state") or "")
+    else:
+        origin = None
+    try:
+        with metrics.stage("mandi_analytics"):
+            analytics = mandi_analytics.analyze(records, origin=origin, focus=filters)
+    except Exception as e:
+        logger.warning("[mandi] analytics failed: %s", e)
+        return
+    if analytics is not None:
+        out["mandi_analytics"] = analytics
 
 
 def _get_extraction_prompt() -> PromptTemplate:
@@ -84,91 +129,53 @@ def _get_extraction_prompt() -> PromptTemplate:
     )
 
 
-def _extract_filters_from_query(query: str) -> dict[str, Any]:
+def normalize_mandi_filters(data: Any) -> dict[str, Any]:
+    """Map raw extractor output onto the canonical mandi filter keys."""
+    if not isinstance(data, dict):
+        return {}
+    # Normalize keys to lowercase and map synonyms
+    def norm_key(k: Any) -> str:
+        return str(k).strip().lower()
+
+    canonical = {
+        "state": None,
+        "district": None,
+        "market": None,
+        "commodity": None,
+        "variety": None,
+        "grade": None,
+        "limit": None,
+        "offset": None,
+    }
+    synonyms = {
+        "state.keyword": "state",
+        "mandi": "market",
+        "market_name": "market",
+        "city": "district",
+    }
+
+    for k, v in data.items():
+        nk = norm_key(k)
+        target = synonyms.get(nk, nk)
+        if target in canonical:
+            canonical[target] = v
+    return canonical
+
+
+async def _extract_filters_from_query(query: str) -> dict[str, Any]:
     try:
-        raw = run_chain(_get_extraction_prompt(), {"question": query})
+        with metrics.stage("extract_mandi"):
+            raw = await arun_chain(_get_extraction_prompt(), {"question": query})
         data = json.loads(raw)
-        if not isinstance(data, dict):
-            return {}
-        # Normalize keys to lowercase and map synonyms
-        def norm_key(k: Any) -> str:
-            return str(k).strip().lower()
-
-        canonical = {
-            "state": None,
-            "district": None,
-            "market": None,
-            "commodity": None,
-            "variety": None,
-            "grade": None,
-            "limit": None,
-            "offset": None,
-        }
-        synonyms = {
-            "state.keyword": "state",
-            "mandi": "market",
-            "market_name": "market",
-            "city": "district",
-        }
-
-        for k, v in data.items():
-            nk = norm_key(k)
-            target = synonyms.get(nk, nk)
-            if target in canonical:
-                canonical[target] = v
-
+        canonical = normalize_mandi_filters(data)
         logger.debug("Mandi filters extracted raw=%s normalized=%s", data, canonical)
         return canonical
     except Exception:
         return {}
 
 
-async def run_mandi_pipeline(question: str, *, default_limit: int = 10, default_offset: int = 0) -> dict:
-    filters = _extract_filters_from_query(question)
-    # Coerce and fallback
-    def _clean_str(v):
-        if not isinstance(v, str):
-            return None
-        s = v.strip()
-        if not s:
-            return None
-        if s.lower() in {"not specified", "na", "n/a", "none", "null", "-", "unknown"}:
-            return None
-        return s
-    def _clean_int(v, default):
-        try:
-            return int(v)
-        except Exception:
-            return default
-
-    def _clean_name(v):
-        s = _clean_str(v)
-        return s.title() if s else None
-
-    fetch_args = {
-        "state": _clean_name(filters.get("state")),
-        "district": _clean_name(filters.get("district")),
-        "market": _clean_name(filters.get("market")),
-        "commodity": _clean_name(filters.get("commodity")),
-        "variety": _clean_name(filters.get("variety")),
-        "grade": _clean_str(filters.get("grade")),
-        "limit": _clean_int(filters.get("limit"), default_limit),
-        "offset": _clean_int(filters.get("offset"), default_offset),
-    }
-    prompt_key = get_prompt_key_for_pipeline("mandi_advice", default="general")
-    return await run_pipeline(
-        question,
-        prompt_key=prompt_key,
-        external_fetcher=fetch_mandi_data,
-        fetcher_args=fetch_args,
-    )
-
-
-async def fetch_mandi_data_from_query(question: str, *, default_limit: int = 10, default_offset: int = 0) -> dict[str, Any]:
-    import time
-    t0 = time.monotonic()
-    filters = _extract_filters_from_query(question)
-    logger.debug("[mandi] extracted filters from query: %s", filters)
+def mandi_fetch_args(filters: dict[str, Any], *, default_limit: int = 10, default_offset: int = 0) -> dict[str, Any]:
+    """Turn canonical filters into fetch_mandi_data keyword arguments (cleaned, title case)."""
     def _clean_str(v):
         if not isinstance(v, str):
             return None
@@ -181,7 +188,7 @@ async def fetch_mandi_data_from_query(question: str, *, default_limit: int = 10,
             return int(v)
         except Exception:
             return default
-    args = {
+    return {
         "state": _clean_str(filters.get("state")),
         "district": _clean_str(filters.get("district")),
         "market": _clean_str(filters.get("market")),
@@ -191,8 +198,31 @@ async def fetch_mandi_data_from_query(question: str, *, default_limit: int = 10,
         "limit": _clean_int(filters.get("limit"), default_limit),
         "offset": _clean_int(filters.get("offset"), default_offset),
     }
-    out = await fetch_mandi_data(**args)
-    logger.info("[mandi] end-to-end from query in %d ms", int((time.monotonic() - t0) * 1000))
-    return out
 
 
+async def fetch_mandi_data_from_query(
+    question: str,
+    *,
+    filters: Optional[dict[str, Any]] = None,
+    default_limit: int = 10,
+    default_offset: int = 0,
+    lat: Optional[float] = None,
+    lon: Optional[float] = None,
+) -> dict[str, Any]:
+    """Fetch mandi prices for a query.
+
+    ``filters`` may carry pre-extracted filters (e.g. from the query understanding
+    stage); the dedicated extraction LLM call only runs when they are absent.
+    """
+    import time
+    t0 = time.monotonic()
+    if filters is None:
+        filters = await _extract_filters_from_query(question)
+        logger.debug("[mandi] extracted filters from query: %s", filters)
+    else:
+        filters = normalize_mandi_filters(filters)
+        logger.debug("[mandi] using pre-extracted filters: %s", filters)
+    args = mandi_fetch_args(filters, default_limit=default_limit, default_offset=default_offset)
+    out = await fetch_mandi_data(**args, lat=lat, lon=lon)
+    logger.info("[mandi] end-to-end from query in %d ms", int((time.monotonic() - t0) * 1000))
+    return out
@@ -1,12 +1,13 @@
 import logging
 from typing import Any, Optional
-import httpx
 
 from config import config
+from api import metrics, soil_mirror
+from api.resilience import upstream_get
 
 logger = logging.getLogger("pipelines.soil")
 
-DATA_GOV_SOIL_URL = "https://api.data.gov.in/resource/4554a3c8-74e3-4f93-8727-8fd92161e345"
+DATA_GOV_SOIL_URL = f"{config.DATA_GOV_BASE_URL}/resource/{soil_mirror.SOIL_RESOURCE_ID}"
 
 
 async def fetch_soil_data(
@@ -19,14 +20,25 @@ async def fetch_soil_data(
     limit: int = 10,
     offset: int = 0,
 ) -> dict[str, Any]:
-    """Fetch soil moisture records from data.gov.in resource.
+    """Soil moisture summary per district: latest, 7/30-day means, trend and seasonal anomaly.
 
-    Returns dict: { "soil_records": [...], "total": int }
+    Served from the local mirror (``api.soil_mirror``); when it is missing or stale,
+    raw records are fetched from data.gov.in and only each district's latest
+    reading is returned (one page is too few readings for the windowed statistics).
+
+    Returns dict: { "soil_summary": list[SoilSummary], "total": int }
     """
     import time
     start = time.monotonic()
-    logger.info("[soil] (data.gov.in) fetch start state=%s district=%s year=%s month=%s limit=%s offset=%s",
+    logger.info("[soil] fetch start state=%s district=%s year=%s month=%s limit=%s offset=%s",
                 state, district, year, month, limit, offset)
+    # The mirror summarises the latest readings; year/month filters need the raw resource
+    if not year and not month:
+        mirrored = await soil_mirror.query(state, district, limit=limit)
+        if mirrored is not None:
+            logger.info("[soil] mirror hit in %d ms; districts=%d", int((time.monotonic() - start) * 1000), len(mirrored))
+            return {"soil_summary": mirrored, "total": len(mirrored)}
+        metrics.record_fallback("soil_live")
     params: dict[str, Any] = {
         "api-key": config.DATA_GOV_API_KEY,
         "format": "json",
@@ -43,18 +55,16 @@ async def fetch_soil_data(
     add_filter("Month", month)
     add_filter("Agency_name", agency_name)
 
-    async with httpx.AsyncClient(timeout=20) as client:
-        resp = await client.get(DATA_GOV_SOIL_URL, params=params)
-        if resp.status_code != 200:
-            logger.error("Soil API failed: %s %s", resp.status_code, resp.text)
-            raise RuntimeError("Failed to fetch soil data")
-        data = resp.json()
-        records = data.get("records") or []
-        total = int(data.get("total") or len(records))
-        dur = int((time.monotonic() - start) * 1000)
-        logger.info("[soil] (data.gov.in) done in %d ms; records=%d total=%d", dur, len(records), total)
-        print(records)
-        return {"soil_records": records, "total": total}
+    resp = await upstream_get("datagov", DATA_GOV_SOIL_URL, params=params)
+    if resp.status_code != 200:
+        logger.error("Soil API failed: %s %s", resp.status_code, resp.text)
+        raise RuntimeError("Failed to fetch soil data")
+    data = resp.json()
+    records = data.get("records") or []
+    summary = soil_mirror.latest_readings(records)
+    dur = int((time.monotonic() - start) * 1000)
+    logger.info("[soil] (data.gov.in) done in %d ms; records=%d districts=%d", dur, len(records), len(summary))
+    return {"soil_summary": summary, "total": len(summary)}
 
 
 __all__ = ["fetch_soil_data"]
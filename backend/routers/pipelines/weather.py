@@ -1,72 +1,150 @@
+import asyncio
+import json
 import logging
-from typing import Any
-
-import httpx
+import time
+from typing import Any, Dict, Optional
 
 from config import config
+from api import metrics, payloads
+from api.geohash import decode_center, encode as geohash_encode
+from api.resilience import upstream_get
 
 logger = logging.getLogger("pipelines.weather")
 
 # OpenWeather endpoints
-OWM_BASE = "https://api.openweathermap.org"
+OWM_BASE = config.OWM_BASE_URL
 OWM_CURRENT_URL = f"{OWM_BASE}/data/2.5/weather"
 OWM_DAILY16_URL = f"{OWM_BASE}/data/2.5/forecast/daily"  # 16-day daily forecast
 OWM_CLIMATE30_URL = f"{OWM_BASE}/data/2.5/forecast/climate"  # 30-day climate forecast
 
+# name -> (url, extra params, cache TTL config attribute, projection of the response)
+_ENDPOINTS = {
+    "current": (OWM_CURRENT_URL, {}, "WEATHER_CURRENT_TTL_S", payloads.project_current),
+    "daily16": (OWM_DAILY16_URL, {"cnt": 16}, "WEATHER_DAILY_TTL_S", payloads.project_daily),
+    "climate30": (OWM_CLIMATE30_URL, {"cnt": 30}, "WEATHER_CLIMATE_TTL_S", payloads.project_climate),
+}
+# Plan-dependent endpoints: a 401/404 means our key's plan lacks them, so they are skipped for a while.
+# `current` is in every plan; a 401 there is a bad or rotated key and must not outlive its fix.
+_OPTIONAL_ENDPOINTS = frozenset({"daily16", "climate30"})
+# Optional endpoints our key cannot use, with the monotonic time until which they are skipped
+_UNAVAILABLE: Dict[str, float] = {}
+
+
+def _tile_key(name: str, tile: str) -> str:
+    return f"{config.WEATHER_CACHE_PREFIX}:{name}:v{payloads.VERSION}:{tile}"
+
+
+def _unavailable_key(name: str) -> str:
+    return f"{config.WEATHER_CACHE_PREFIX}:unavailable:{name}"
+
+
+async def _is_unavailable(name: str) -> bool:
+    until = _UNAVAILABLE.get(name)
+    if until is not None:
+        if until > time.monotonic():
+            return True
+        _UNAVAILABLE.pop(name, None)
+    try:
+        ttl = await config.aredis_client.ttl(_unavailable_key(name))
+    except Exception:
+        return False
+    if ttl and ttl > 0:
+        # Another worker saw the 401/404; trust it for the rest of its TTL
+        _UNAVAILABLE[name] = time.monotonic() + ttl
+        return True
+    return False
+
+
+async def _mark_unavailable(name: str, status: int) -> None:
+    ttl = config.WEATHER_UNAVAILABLE_TTL_S
+    _UNAVAILABLE[name] = time.monotonic() + ttl
+    logger.warning("OWM %s returned %s; skipping it for %d s", name, status, ttl)
+    try:
+        await config.aredis_client.set(_unavailable_key(name), str(status), ex=ttl)
+    except Exception as e:
+        logger.debug("Could not share unavailable flag for %s: %s", name, e)
+
+
+async def _fetch_endpoint(name: str, tile: str, lat: float, lon: float) -> Optional[Any]:
+    """One OpenWeather endpoint for a geohash tile, projected to payload records: cache, then upstream.
+
+    None when unavailable or failed.
+    """
+    url, extra, ttl_attr, project = _ENDPOINTS[name]
+    key = _tile_key(name, tile)
+    try:
+        raw = await config.aredis_client.get(key)
+    except Exception as e:
+        logger.debug("Weather cache read failed for %s: %s", key, e)
+        raw = None
+    if raw is not None:
+        metrics.record_upstream_cache(f"weather_{name}", "hit")
+        return payloads.load(json.loads(raw))
+    metrics.record_upstream_cache(f"weather_{name}", "miss")
+    if await _is_unavailable(name):
+        return None
+
+    # Always request metric units for human-friendly outputs
+    params = {"lat": lat, "lon": lon, "appid": config.OPENWEATHER_API_KEY, "units": "metric", **extra}
+    try:
+        resp = await upstream_get("owm", url, params=params)
+    except Exception as e:
+        logger.warning("OWM %s request failed: %s", name, e)
+        return None
+    if resp.status_code in (401, 404):
+        if name in _OPTIONAL_ENDPOINTS:
+            await _mark_unavailable(name, resp.status_code)
+        else:
+            logger.error("OWM %s returned %s; check OPENWEATHER_API_KEY", name, resp.status_code)
+        return None
+    if resp.status_code == 204:
+        return None
+    if resp.status_code != 200:
+        logger.warning("OWM %s failed: %s %s", name, resp.status_code, resp.text)
+        return None
+    data = project(resp.json())
+    try:
+        await config.aredis_client.set(key, json.dumps(payloads.dump(data)).encode("utf-8"), ex=getattr(config, ttl_attr))
+    except Exception as e:
+        logger.debug("Weather cache write failed for %s: %s", key, e)
+    return data
+
 
 async def fetch_weather_data(lat: float, lon: float) -> dict[str, Any]:
     """Fetch current weather, 16-day daily forecast, and 30-day climate forecast from OpenWeather.
 
+    Results are cached per endpoint and geohash tile (``WEATHER_GEOHASH_PRECISION``),
+    and upstream calls use the tile centre so every caller in a tile shares them.
+    The three endpoints are fetched concurrently; an optional one (daily16,
+    climate30) answering 401/404 is skipped for ``WEATHER_UNAVAILABLE_TTL_S``.
+    ``current`` is never skipped, so a fixed key takes effect on the next call.
+
     Returns a dict with keys:
-    - today_weather: dict
-    - forecast: list|dict (16-day daily)
-    - climate_30d: list|dict (optional, if plan allows)
+    - today_weather: CurrentWeather
+    - forecast: list[DailyForecast] (16-day daily)
+    - climate_30d: list[ClimateDay] | None (optional, if plan allows)
     """
-    import time
     start = time.monotonic()
-    logger.info("[weather] (OWM) fetch start lat=%s lon=%s", lat, lon)
+    tile = geohash_encode(float(lat), float(lon), config.WEATHER_GEOHASH_PRECISION)
+    logger.info("[weather] (OWM) fetch start lat=%s lon=%s tile=%s", lat, lon, tile)
 
     if not config.OPENWEATHER_API_KEY:
         raise RuntimeError("OPENWEATHER_API_KEY is not configured")
 
-    async with httpx.AsyncClient(timeout=20) as client:
-        # Always request metric units for human-friendly outputs
-        base_params = {"lat": lat, "lon": lon, "appid": config.OPENWEATHER_API_KEY, "units": "metric"}
-
-        # Current weather
-        w_resp = await client.get(OWM_CURRENT_URL, params=base_params)
-        if w_resp.status_code != 200:
-            logger.error("OWM current weather failed: %s", w_resp.text)
-            raise RuntimeError("Failed to fetch current weather")
-        today = w_resp.json()
-
-        # 16-day daily forecast (cnt=16)
-        f_params = dict(base_params)
-        f_params["cnt"] = 16
-        f_resp = await client.get(OWM_DAILY16_URL, params=f_params)
-        if f_resp.status_code not in (200, 204):
-            logger.warning("OWM 16-day daily forecast failed: %s", f_resp.text)
-            forecast = []
-        else:
-            f_json = f_resp.json()
-            # Some responses wrap data in { city, cnt, list: [...] }
-            forecast = f_json.get("list", f_json if isinstance(f_json, list) else [])
-
-        # 30-day climate forecast (cnt=30) — may require paid plan; tolerate failure
-        c_params = dict(base_params)
-        c_params["cnt"] = 30
-        c_resp = await client.get(OWM_CLIMATE30_URL, params=c_params)
-        climate_30d = None
-        if c_resp.status_code in (200, 204):
-            c_json = c_resp.json()
-            climate_30d = c_json.get("list", c_json if isinstance(c_json, list) else c_json)
-        else:
-            logger.info("OWM 30d climate unavailable: %s", c_resp.text)
+    t_lat, t_lon = decode_center(tile)
+    today, forecast, climate_30d = await asyncio.gather(
+        _fetch_endpoint("current", tile, t_lat, t_lon),
+        _fetch_endpoint("daily16", tile, t_lat, t_lon),
+        _fetch_endpoint("climate30", tile, t_lat, t_lon),
+    )
+    if today is None:
+        raise RuntimeError("Failed to fetch current weather")
+
+    forecast = forecast or []
 
-        dur_ms = int((time.monotonic() - start) * 1000)
-        fcount = len(forecast) if isinstance(forecast, list) else (len(forecast.get("list", [])) if isinstance(forecast, dict) else 0)
-        logger.info("[weather] (OWM) fetch done in %d ms (daily16 items=%s, climate=%s)", dur_ms, fcount, "ok" if climate_30d is not None else "na")
-        return {"today_weather": today, "forecast": forecast, "climate_30d": climate_30d}
+    dur_ms = int((time.monotonic() - start) * 1000)
+    logger.info("[weather] (OWM) fetch done in %d ms (daily16 items=%s, climate=%s)", dur_ms, len(forecast), "ok" if climate_30d is not None else "na")
+    return {"today_weather": today, "forecast": forecast, "climate_30d": climate_30d}
 
 
 __all__ = ["fetch_weather_data"]
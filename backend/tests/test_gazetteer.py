@@ -0,0 +1,36 @@
+"""Bundled gazetteer lookups: spelling variants, coverage and names shared across states."""
+import pytest
+
+from api.gazetteer import ambiguous_places, lookup_place
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Poona", ("Pune", "Maharashtra")),
+    ("Nasik district", ("Nashik", "Maharashtra")),
+    ("Amravati", ("Amravati", "Maharashtra")),
+    ("Amaravati", ("Guntur", "Andhra Pradesh")),
+    ("Sehore", ("Sehore", "Madhya Pradesh")),
+    ("Ooty", ("The Nilgiris", "Tamil Nadu")),
+    ("Mau", ("Mau", "Uttar Pradesh")),
+])
+def test_lookup_resolves_the_district(text, expected):
+    place = lookup_place(text)
+    assert place is not None
+    assert (place.district, place.state) == expected
+
+
+@pytest.mark.parametrize("text", ["Aurangabad", "Una", "Bilaspur district"])
+def test_name_shared_across_states_needs_the_state(text):
+    assert lookup_place(text) is None
+    assert len({p.state for p in ambiguous_places(text)}) > 1
+
+
+@pytest.mark.parametrize("text, state", [
+    ("Aurangabad, Bihar", "Bihar"),
+    ("Aurangabad Maharashtra", "Maharashtra"),
+    ("Una, Himachal Pradesh", "Himachal Pradesh"),
+])
+def test_state_in_the_text_picks_the_place(text, state):
+    place = lookup_place(text)
+    assert place is not None and place.state == state
+    assert ambiguous_places(text) == []
@@ -0,0 +1,108 @@
+"""Caller location from the request body reaches the planner and the fetchers.
+
+The endpoint runs for real down to the fetchers; embedding, the answer cache,
+history and the answer LLM are replaced, and fetchers only record their arguments.
+"""
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import routers.api as rag_api
+import routers.pipelines.common as pipelines_common
+from api import answer_cache, pipeline_selector
+from api.history import history_writer
+from api.query_understanding import QueryUnderstanding
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Route every query to the pipelines in ``calls["route"]`` and record fetcher calls."""
+    recorded = {"route": ["general_assistant"], "fetches": []}
+    by_id = {p.id: p for p in pipeline_selector.load_pipelines()}
+
+    async def route_by_embedding(query):
+        return [by_id[i] for i in recorded["route"]]
+
+    async def understand_query(query, pipelines, route=True):
+        return QueryUnderstanding(mandi_filters={"commodity": "onion"})
+
+    async def run_fetcher(fn, args):
+        recorded["fetches"].append((fn.__name__, dict(args)))
+        return {}
+
+    async def run_multi_pipeline(question, *, prompt_key, fetchers, docs_task=None, retrieve=True, **_):
+        if docs_task is not None:
+            docs_task.cancel()
+        await pipelines_common.gather_external_data(fetchers)
+        return {"output": "ok"}
+
+    async def no_cache(*args, **kwargs):
+        return None
+
+    monkeypatch.setattr(pipeline_selector, "route_by_embedding", route_by_embedding)
+    monkeypatch.setattr(pipeline_selector, "understand_query", understand_query)
+    monkeypatch.setattr(pipelines_common, "run_fetcher", run_fetcher)
+    monkeypatch.setattr(rag_api, "run_multi_pipeline", run_multi_pipeline)
+    monkeypatch.setattr(rag_api, "embed_query", lambda q: np.ones(4, dtype=np.float32))
+    monkeypatch.setattr(answer_cache, "lookup", no_cache)
+    monkeypatch.setattr(answer_cache, "store", no_cache)
+    monkeypatch.setattr(history_writer, "submit", lambda call_sid, rec: None)
+    return recorded
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(rag_api.router)
+    return TestClient(app)
+
+
+def _fetch_args(calls, name):
+    matching = [args for fn, args in calls["fetches"] if fn == name]
+    assert len(matching) == 1, calls["fetches"]
+    return matching[0]
+
+
+def test_body_coordinates_resolve_the_soil_district(client, calls):
+    calls["route"] = ["soil_advice"]
+    resp = client.post("/response", json={"query": "How wet is my soil?", "call_sid": "t1", "lat": 18.52, "lon": 73.86})
+    assert resp.status_code == 200, resp.text
+    args = _fetch_args(calls, "fetch_soil_data")
+    assert (args["state"], args["district"]) == ("Maharashtra", "Pune")
+
+
+def test_body_coordinates_rank_mandis_near_the_caller(client, calls):
+    calls["route"] = ["mandi_advice"]
+    resp = client.post("/response", json={"query": "Onion price today", "call_sid": "t2", "lat": 18.5204, "lon": 73.8567})
+    assert resp.status_code == 200, resp.text
+    args = _fetch_args(calls, "fetch_mandi_data")
+    assert (args["lat"], args["lon"]) == (18.52, 73.86)
+    assert args["state"] == "Maharashtra"
+    assert args["commodity"] == "Onion"
+
+
+def test_batch_items_carry_their_own_location(client, calls):
+    calls["route"] = ["mandi_advice"]
+    resp = client.post("/response/batch", json={"requests": [
+        {"query": "Onion price today", "call_sid": "b1", "lat": 23.2599, "lon": 77.4126},
+    ]})
+    assert resp.status_code == 200, resp.text
+    args = _fetch_args(calls, "fetch_mandi_data")
+    assert (args["lat"], args["lon"], args["state"]) == (23.26, 77.41, "Madhya Pradesh")
+
+
+def test_without_location_mandi_fetch_has_no_origin(client, calls):
+    calls["route"] = ["mandi_advice"]
+    resp = client.post("/response", json={"query": "Onion price today", "call_sid": "t3"})
+    assert resp.status_code == 200, resp.text
+    args = _fetch_args(calls, "fetch_mandi_data")
+    assert "lat" not in args and "lon" not in args
+
+
+def test_body_region_without_coordinates_still_ranks_nearby_mandis(client, calls):
+    calls["route"] = ["mandi_advice"]
+    resp = client.post("/response", json={"query": "Onion price today", "call_sid": "t4", "region": "Pune"})
+    assert resp.status_code == 200, resp.text
+    args = _fetch_args(calls, "fetch_mandi_data")
+    assert args.get("lat") is not None and args.get("lon") is not None
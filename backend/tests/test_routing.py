@@ -0,0 +1,58 @@
+"""Embedding router: every pipeline close to the best score is picked.
+
+The pipeline index and query encoder are replaced by orthogonal unit vectors, one
+per pipeline plus one matching none, so a query's score against a pipeline is its
+(normalised) weight on that pipeline's axis.
+"""
+import asyncio
+
+import numpy as np
+import pytest
+
+from api import pipeline_selector
+
+_PIPELINES = ["general_assistant", "weather_advice", "soil_advice", "mandi_advice", "irrigation_advice"]
+_AXES = _PIPELINES + ["unrelated"]
+
+
+@pytest.fixture
+def route(monkeypatch):
+    monkeypatch.setattr(pipeline_selector, "_PIPELINE_INDEX", (np.eye(len(_PIPELINES), len(_AXES), dtype=np.float32), list(_PIPELINES)))
+    queries = {}
+
+    def embed_query(query):
+        vec = np.array([queries[query].get(pid, 0.0) for pid in _AXES], dtype=np.float32)
+        return vec / np.linalg.norm(vec)
+
+    async def no_llm(*args, **kwargs):
+        raise AssertionError("LLM router called")
+
+    monkeypatch.setattr(pipeline_selector, "embed_query", embed_query)
+    monkeypatch.setattr(pipeline_selector, "arun_chain", no_llm)
+
+    def run(query, weights):
+        queries[query] = weights
+        routed = asyncio.run(pipeline_selector.route_by_embedding(query))
+        return None if routed is None else [p.id for p in routed]
+    return run
+
+
+def test_mixed_intent_query_gets_every_close_pipeline(route):
+    picked = route("Will it rain tomorrow, and what is the onion price in Lasalgaon?",
+                   {"weather_advice": 1.0, "mandi_advice": 0.95, "general_assistant": 0.3})
+    assert picked == ["weather_advice", "mandi_advice"]
+
+
+def test_clear_single_intent_gets_one_pipeline(route):
+    picked = route("Will it rain tomorrow?", {"weather_advice": 1.0, "mandi_advice": 0.5})
+    assert picked == ["weather_advice"]
+
+
+def test_weak_match_defers_to_the_llm_router(route):
+    assert route("What did my neighbour plant?", {"unrelated": 1.0, "general_assistant": 0.3}) is None
+
+
+def test_select_pipelines_uses_the_embedding_route_for_mixed_intent(route):
+    route("Rain and mandi rates", {"weather_advice": 1.0, "mandi_advice": 1.0})
+    picked = asyncio.run(pipeline_selector.select_pipelines("Rain and mandi rates"))
+    assert [p.id for p in picked] == ["weather_advice", "mandi_advice"]
@@ -2,6 +2,11 @@ import requests
 import logging
 from app.call_manager import call_manager
 
+# How long a caller is kept waiting on the backend; the backend is told to answer
+# a little sooner so its reply still arrives in time, with whatever data it has
+BACKEND_TIMEOUT_S = 30
+BACKEND_DEADLINE_MARGIN_S = 3
+
 
 def process_with_n8n(call_sid, transcription):
     """Send query to backend /response and set the result for the call."""
@@ -9,17 +14,23 @@ def process_with_n8n(call_sid, transcription):
         lat, lon = call_manager.get_location(call_sid)
         region = call_manager.get_region(call_sid)
 
-        payload = {"query": transcription, "call_sid": call_sid}
+        payload = {
+            "query": transcription,
+            "call_sid": call_sid,
+            "deadline_ms": int((BACKEND_TIMEOUT_S - BACKEND_DEADLINE_MARGIN_S) * 1000),
+        }
         if lat is not None and lon is not None:
             payload["lat"] = lat
             payload["lon"] = lon
         if region:
             payload["region"] = region
 
-        resp = requests.post("http://localhost:5000/response", json=payload, timeout=30)
+        resp = requests.post("http://localhost:5000/response", json=payload, timeout=BACKEND_TIMEOUT_S)
         if resp.status_code != 200:
             raise RuntimeError(f"Backend error {resp.status_code}: {resp.text}")
         data = resp.json()
+        if data.get("degraded"):
+            logging.getLogger(__name__).info("backend answered with degraded stages: %s", data["degraded"])
         output = (data.get("output") or "").strip()
         if not output:
             raise RuntimeError("Empty output from backend")
@@ -19,6 +19,9 @@ TWILIO_ACCOUNT_SID = Config.TWILIO_ACCOUNT_SID
 TWILIO_AUTH_TOKEN = Config.TWILIO_AUTH_TOKEN
 TWILIO_WHATSAPP_NUMBER = Config.TWILIO_WHATSAPP_NUMBER
 BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000/response")  # Ngrok or prod URL
+# Twilio drops the webhook after 15 s; the backend is asked to answer within the deadline
+BACKEND_TIMEOUT_S = float(os.getenv("BACKEND_TIMEOUT_S", 14))
+BACKEND_DEADLINE_MS = int(os.getenv("BACKEND_DEADLINE_MS", 12000))
 
 @app.post("/whatsapp")
 async def whatsapp_webhook(request: Request):
@@ -37,9 +40,10 @@ async def whatsapp_webhook(request: Request):
         payload = {
             "query": body,
             "call_sid": call_sid,
+            "deadline_ms": BACKEND_DEADLINE_MS,
             # Add lat/lon/region if extracted (e.g., via regex or LLM in this app)
         }
-        async with httpx.AsyncClient() as client:
+        async with httpx.AsyncClient(timeout=BACKEND_TIMEOUT_S) as client:
             resp = await client.post(BACKEND_URL, json=payload)
             if resp.status_code != 200:
                 logger.error(f"Backend error: {resp.text}")